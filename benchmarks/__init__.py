@@ -0,0 +1,5 @@
+"""Benchmarks for puni's encode, decode and mutation paths.
+
+Run with ``python -m benchmarks.run``. No reddit access is required; all data
+is generated by benchmarks.data.
+"""
@@ -0,0 +1,146 @@
+"""Synthetic schema v6 usernotes for benchmarking.
+
+The generated pages mimic what large subreddits store: a skewed number of
+notes per user, a long tail of moderators (including ex-moderators), every
+warning type and a mix of submission, comment, message and empty links.
+"""
+
+
+import bisect
+import json
+import random
+import string
+
+from puni import Note, UserNotes
+
+
+WORDS = (
+    'spam ban evasion alt account rule reported removed comment submission '
+    'harassment warned temp permanent troll self promotion link domain brigade '
+    'modmail appeal repeat offender vote manipulation shadowbanned ok good '
+    'contributor approved see thread racism slur doxxing low effort meme '
+    'off topic reposted karma farming bot'
+).split()
+
+ALPHABET = string.ascii_lowercase + string.digits
+
+
+def _base36(rng, length):
+    return ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def _link(rng):
+    kind = rng.random()
+
+    if kind < 0.15:
+        return ''
+    elif kind < 0.55:
+        return 'l,' + _base36(rng, 6)
+    elif kind < 0.9:
+        return 'l,{},{}'.format(_base36(rng, 6), _base36(rng, 7))
+    else:
+        return 'm,' + _base36(rng, 6)
+
+
+def _cumulative(weights):
+    total = 0
+    cumulative = []
+
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    return cumulative
+
+
+def _weighted(rng, cumulative):
+    # Same draw as rng.choices(range(n), cum_weights=cumulative)[0], which
+    # Python 2.7 does not have
+    return bisect.bisect(cumulative, rng.random() * cumulative[-1])
+
+
+def generate_users(count, mods=60, seed=0, now=1600000000):
+    """Generate the 'users' portion of a usernotes page.
+
+    Arguments:
+        count: the number of users to generate (int)
+        mods: the number of moderators in the constants (int)
+        seed: the random seed, so runs are reproducible (int)
+        now: the UNIX timestamp of the newest notes (int)
+
+    Returns a dict in the format stored in UserNotes.cached_json['users']
+    """
+    rng = random.Random(seed)
+    # A few active moderators write most notes
+    mod_weights = _cumulative([1.0 / (i + 1) for i in range(mods)])
+    # Most users have one note, a few have dozens
+    warn_weights = _cumulative([30, 15, 10, 4, 12, 6, 2, 3])
+    users = {}
+
+    for i in range(count):
+        username = '{}_{}'.format(rng.choice(WORDS), _base36(rng, 8))
+        notes = []
+        note_count = min(int(rng.paretovariate(1.6)), 40)
+        note_time = now - rng.randint(0, 5 * 365 * 24 * 60 * 60)
+
+        for _ in range(note_count):
+            notes.append({
+                'n': ' '.join(rng.choice(WORDS)
+                              for _ in range(rng.randint(1, 12))),
+                't': note_time,
+                'm': _weighted(rng, mod_weights),
+                'l': _link(rng),
+                'w': _weighted(rng, warn_weights)
+            })
+            note_time -= rng.randint(60, 90 * 24 * 60 * 60)
+
+        users[username] = {'ns': notes}
+
+    return users
+
+
+def generate_notes(target_size=UserNotes.max_page_size, mods=60, seed=0):
+    """Generate a decoded usernotes page close to a given page size.
+
+    Arguments:
+        target_size: the maximum length of the compressed page (int)
+        mods: the number of moderators in the constants (int)
+        seed: the random seed, so runs are reproducible (int)
+
+    Returns a dict in the format of UserNotes.cached_json
+    """
+    un = UserNotes(None, 'benchmark', lazy_start=True)
+    constants = {
+        'users': ['mod_' + str(i) for i in range(mods)],
+        'warnings': list(Note.warnings)
+    }
+
+    def page(users):
+        return {'ver': UserNotes.schema, 'constants': constants, 'users': users}
+
+    def page_size(users):
+        return len(json.dumps(un._compress_json(page(users))))
+
+    # Grow until the page overflows, then bisect the number of users
+    count = 1000
+
+    while True:
+        users = generate_users(count, mods, seed)
+
+        if page_size(users) > target_size:
+            break
+
+        count *= 2
+
+    names = list(users)
+    lo, hi = 0, len(names)
+
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+
+        if page_size(dict((x, users[x]) for x in names[:mid])) <= target_size:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return page(dict((x, users[x]) for x in names[:lo]))
@@ -0,0 +1,311 @@
+"""Time puni's hot paths against synthetic usernotes.
+
+Usage:
+    python -m benchmarks.run [--size BYTES] [--repeat N] [--json] [NAME ...]
+
+Each scenario reports the best time per run, the throughput and the peak
+memory allocated during a single run (measured with tracemalloc).
+"""
+
+
+import argparse
+import copy
+import gc
+import io
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from puni import MemoryBackend, Note, UserNotes, links
+from puni import transfer
+from benchmarks.data import generate_notes
+
+
+SCENARIOS = []
+
+
+def scenario(unit):
+    """Register a scenario.
+
+    The decorated function receives the benchmark context and returns a
+    (run, amount) tuple: a callable to time and the number of units it
+    processes per call. It may also return a (run, amount, setup) tuple, in
+    which case setup is called untimed before each run and its return value
+    is passed to run.
+    """
+    def decorator(func):
+        SCENARIOS.append((func.__name__, unit, func))
+        return func
+
+    return decorator
+
+
+class Context(object):
+    """Shared data for the scenarios, generated once."""
+
+    def __init__(self, size):
+        self.notes = generate_notes(size)
+        self.usernotes = UserNotes(None, 'benchmark', lazy_start=True)
+        self.usernotes.cached_json = self.notes
+        self.page = self.usernotes._compress_json(self.notes)
+        self.page_text = json.dumps(self.page)
+        self.users_text = json.dumps(self.notes['users'])
+        self.sample_users = random.Random(0).sample(
+            sorted(self.notes['users']), min(1000, len(self.notes['users']))
+        )
+        self.links = [
+            x['l'] for u in self.notes['users'].values() for x in u['ns']
+            if x['l']
+        ][:10000]
+
+
+@scenario('MB')
+def expand_json(ctx):
+    un = UserNotes(None, 'benchmark', lazy_start=True)
+    page = json.loads(ctx.page_text)
+    return lambda: un._expand_json(page), len(ctx.users_text) / 1e6
+
+
+@scenario('MB')
+def expand_json_compact(ctx):
+    un = UserNotes(None, 'benchmark', lazy_start=True)
+    un.compact_notes = True
+    page = json.loads(ctx.page_text)
+    return lambda: un._expand_json(page), len(ctx.users_text) / 1e6
+
+
+@scenario('MB')
+def compress_json(ctx):
+    un = ctx.usernotes
+    return lambda: un._compress_json(ctx.notes), len(ctx.users_text) / 1e6
+
+
+@scenario('users')
+def get_notes(ctx):
+    un = ctx.usernotes
+
+    def run():
+        for user in ctx.sample_users:
+            un.get_notes(user, lazy=True)
+
+    return run, len(ctx.sample_users)
+
+
+@scenario('users')
+def summaries(ctx):
+    un = ctx.usernotes
+    un.summaries([], lazy=True)  # Build the index before timing
+
+    def run():
+        un.summaries(ctx.sample_users, lazy=True)
+
+    return run, len(ctx.sample_users)
+
+
+@scenario('searches')
+def search(ctx):
+    un = ctx.usernotes
+    words = sorted(set(
+        x['n'].split()[0] for u in ctx.notes['users'].values()
+        for x in u['ns'] if x['n']
+    ))
+    un.search('warmup', lazy=True)  # Build the index before timing
+
+    def run():
+        for word in words:
+            un.search(word, lazy=True)
+
+    return run, len(words)
+
+
+@scenario('notes')
+def add_note(ctx):
+    notes = [
+        Note(user, 'benchmark note', subreddit='benchmark', mod='mod_0',
+             link='l,92dd8,c0b6xx0', warning='ban')
+        for user in ctx.sample_users
+    ]
+
+    def setup():
+        un = UserNotes(None, 'benchmark', lazy_start=True)
+        un.cached_json = copy.deepcopy(ctx.notes)
+        return un
+
+    def run(un):
+        for note in notes:
+            un.add_note(note, lazy=True)
+
+    return run, len(notes), setup
+
+
+@scenario('notes')
+def note_init(ctx):
+    def run():
+        for link in ctx.links:
+            Note('user', 'note', subreddit='benchmark', mod='mod_0',
+                 link=link, warning='ban', note_time=1)
+
+    return run, len(ctx.links)
+
+
+@scenario('links')
+def compress_url(ctx):
+    urls = [Note._expand_url(x, 'benchmark') for x in ctx.links]
+
+    def run():
+        for url in urls:
+            Note._compress_url(url)
+
+    return run, len(urls)
+
+
+@scenario('links')
+def compress_url_legacy(ctx):
+    urls = [Note._expand_url(x, 'benchmark') for x in ctx.links]
+
+    def compress(link):
+        # The conversion before puni.links, compiling its patterns per call
+        comment_re = re.compile(
+            r'/comments/([A-Za-z\d]{2,})(?:/[^\s]+/([A-Za-z\d]+))?'
+        )
+        message_re = re.compile(r'/message/messages/([A-Za-z\d]+)')
+        matches = re.findall(comment_re, link)
+
+        if len(matches) == 0:
+            matches = re.findall(message_re, link)
+            return None if len(matches) == 0 else 'm,' + matches[0]
+        elif matches[0][1] == '':
+            return 'l,' + matches[0][0]
+        else:
+            return 'l,' + matches[0][0] + ',' + matches[0][1]
+
+    def run():
+        for url in urls:
+            compress(url)
+
+    return run, len(urls)
+
+
+@scenario('links')
+def expand_url(ctx):
+    def run():
+        for link in ctx.links:
+            Note._expand_url(link, 'benchmark')
+
+    return run, len(ctx.links)
+
+
+@scenario('links')
+def compress_links(ctx):
+    urls = links.expand_links(ctx.links, 'benchmark')
+
+    def run():
+        links.compress_links(urls)
+
+    return run, len(urls)
+
+
+@scenario('links')
+def expand_links(ctx):
+    def run():
+        links.expand_links(ctx.links, 'benchmark')
+
+    return run, len(ctx.links)
+
+
+@scenario('notes')
+def export_notes(ctx):
+    un = UserNotes(None, 'benchmark', lazy_start=True,
+                   backend=MemoryBackend(name='benchmark'))
+    un.cached_json = ctx.notes
+    count = sum(len(x['ns']) for x in ctx.notes['users'].values())
+
+    def run():
+        # export_notes without the revision check
+        transfer.write_rows(io.StringIO(), un._export_rows(un.snapshot()))
+
+    return run, count
+
+
+def measure(run, repeat, setup=None):
+    """Return the best wall time of a callable and its peak allocation."""
+    times = []
+
+    for _ in range(repeat + 1):
+        args = () if setup is None else (setup(),)
+        gc.collect()
+
+        if len(times) < repeat:
+            start = time.perf_counter()
+            run(*args)
+            times.append(time.perf_counter() - start)
+        else:
+            tracemalloc.start()
+            run(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return min(times), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='NAME',
+                        help='scenarios to run (default: all)')
+    parser.add_argument('--size', type=int, default=UserNotes.max_page_size,
+                        help='compressed page size to generate')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed runs per scenario')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(x[0] for x in SCENARIOS)
+    if unknown:
+        parser.error('unknown scenario: ' + ', '.join(sorted(unknown)))
+
+    ctx = Context(args.size)
+    results = []
+
+    for name, unit, setup in SCENARIOS:
+        if args.names and name not in args.names:
+            continue
+
+        prepared = setup(ctx)
+        run, amount = prepared[:2]
+        best, peak = measure(run, args.repeat, *prepared[2:])
+        results.append({
+            'name': name,
+            'seconds': best,
+            'throughput': amount / best,
+            'unit': unit + '/s',
+            'peak_bytes': peak
+        })
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    print('page: {} characters, {} users, {} notes'.format(
+        len(ctx.page_text), len(ctx.notes['users']),
+        sum(len(x['ns']) for x in ctx.notes['users'].values())
+    ))
+    print('{:<20}{:>12}{:>20}{:>14}'.format(
+        'scenario', 'best (ms)', 'throughput', 'peak (KiB)'
+    ))
+
+    for result in results:
+        print('{:<20}{:>12.2f}{:>20}{:>14.0f}'.format(
+            result['name'],
+            result['seconds'] * 1000,
+            '{:.1f} {}'.format(result['throughput'], result['unit']),
+            result['peak_bytes'] / 1024.0
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,23 @@ with puni. If not, see http://www.gnu.org/licenses/.
 """
 
 
+import sys
+
 from .base import UserNotes, Note
 from .version import __version__
 from .decorators import update_cache
+from .cache import SQLiteCache
+from .backends import (PRAWBackend, MemoryBackend, FileBackend, EditConflict,
+                       PageNotFound)
+from .metrics import Metrics, MetricsCollector
+from .compression import CompressionPolicy, FixedCompression
+from .manager import UserNotesManager
+from .accounts import AccountChecker, TokenBucket
+from .history import History
+from .watch import Watcher, Event, NoteAdded, NoteRemoved, UserRemoved
+from .pruning import (PruningPolicy, OldestFirst, OlderThan, WarningType,
+                      UsersWithOnly)
+
+if sys.version_info >= (3, 7):
+    from .aio import (AsyncUserNotes, AsyncPRAWBackend, AsyncBackend,
+                      AsyncHistory, AsyncWatcher, async_update_cache)
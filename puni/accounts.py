@@ -0,0 +1,271 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from prawcore.exceptions import NotFound
+
+from puni.metrics import Metrics
+
+
+ACTIVE = 'active'
+DELETED = 'deleted'  # Deleted or shadowbanned, reddit answers 404 for both
+SUSPENDED = 'suspended'
+
+
+class TokenBucket(object):
+    """Spaces out requests shared by many threads. Thread-safe.
+
+    Tokens are added at rate per second, up to capacity, and every request
+    takes one. When given a reddit instance, update follows the rate limit
+    headers of its last response: the remaining requests are spread evenly
+    until the limit resets.
+    """
+
+    def __init__(self, rate=1.0, capacity=10, clock=time.time,
+                 sleep=time.sleep):
+        """Constructor for the TokenBucket class.
+
+        Arguments:
+            rate: the tokens added per second (float)
+            capacity: the most tokens that can be saved up (int)
+            clock: returns the current time in seconds (function)
+            sleep: waits for a number of seconds (function)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'TokenBucket(rate={}, capacity={})'.format(
+            self.rate, self.capacity
+        )
+
+    def acquire(self):
+        """Take a token, waiting for one to be added if there are none."""
+        while True:
+            with self._lock:
+                self._refill()
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate if self.rate > 0 else 1
+
+            self.sleep(wait)
+
+    def update(self, remaining, seconds_to_reset):
+        """Adjust the rate to the requests reddit still allows.
+
+        Arguments:
+            remaining: the requests left until the limit resets (float)
+            seconds_to_reset: the time until the limit resets (float)
+        """
+        with self._lock:
+            self._refill()
+            self.rate = float(max(remaining, 0)) / max(seconds_to_reset, 1.0)
+            self.tokens = min(self.tokens, float(max(remaining, 0)))
+
+    def update_from(self, r):
+        """Follow the rate limit headers of a reddit instance's last response.
+
+        Arguments:
+            r: the reddit instance (PRAW Reddit Object)
+        """
+        limiter = getattr(getattr(r, '_core', None), '_rate_limiter', None)
+        remaining = getattr(limiter, 'remaining', None)
+        reset = getattr(limiter, 'reset_timestamp', None)
+
+        if remaining is not None and reset is not None:
+            self.update(remaining, reset - self.clock())
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+class AccountChecker(object):
+    """Looks up whether many reddit accounts still exist.
+
+    Reddit has no bulk lookup by username, so unknown accounts are fetched one
+    at a time on a pool of threads. Accounts seen before are checked again by
+    their fullname, 100 per request. Every request waits for a shared
+    TokenBucket, and results are kept for max_age seconds, in memory and in
+    the SQLiteCache if one is given, so later runs only look up new users.
+    """
+
+    batch_size = 100  # Fullnames per user_data_by_account_ids request
+
+    def __init__(self, r, workers=8, bucket=None, cache=None,
+                 max_age=7 * 24 * 60 * 60, metrics=None):
+        """Constructor for the AccountChecker class.
+
+        Arguments:
+            r: the authenticated reddit instance (PRAW Reddit Object)
+            workers: the number of lookups made at the same time (int)
+            bucket: the rate limiter every request waits for. Defaults to one
+                following the reddit instance's rate limit (TokenBucket)
+            cache: stores the results between runs (SQLiteCache)
+            max_age: the seconds after which a result is checked again (float)
+            metrics: receives the lookup counters (Metrics)
+        """
+        self.r = r
+        self.workers = workers
+        self.bucket = bucket if bucket else TokenBucket()
+        self.cache = cache
+        self.max_age = max_age
+        self.metrics = metrics if metrics else Metrics()
+        self.results = {}  # Lowercase username -> (status, fullname, time)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'AccountChecker(workers={})'.format(self.workers)
+
+    def check(self, usernames):
+        """Return the status of every account.
+
+        Arguments:
+            usernames: the accounts to check (iterable of str)
+
+        Returns a dict of username -> ACTIVE, DELETED or SUSPENDED. Accounts
+        that could not be looked up are None
+        """
+        usernames = list(usernames)
+        now = time.time()
+        known = self._cached(usernames)
+        statuses = {}
+        stale = {}  # Fullname -> username
+        missing = []
+
+        for username in usernames:
+            result = known.get(username.lower())
+
+            if result is not None and now - result[2] < self.max_age:
+                statuses[username] = result[0]
+                self.metrics.increment('account_cache_hits')
+            elif result is not None and result[0] == ACTIVE and result[1]:
+                stale[result[1]] = username
+            else:
+                missing.append(username)
+
+        fullnames = list(stale)
+        chunks = [fullnames[i:i + self.batch_size]
+                  for i in range(0, len(fullnames), self.batch_size)]
+        fresh = {}  # Lowercase username -> (status, fullname, time)
+        pool = ThreadPool(max(1, min(self.workers, len(usernames))))
+
+        try:
+            for found in pool.imap_unordered(self._lookup_batch, chunks):
+                for fullname in found:
+                    username = stale.pop(fullname, None)
+
+                    if username is None:
+                        continue
+
+                    statuses[username] = ACTIVE
+                    fresh[username.lower()] = (ACTIVE, fullname, now)
+
+            # Accounts missing from the batches were deleted or suspended
+            missing.extend(stale.values())
+
+            for username, status, fullname in pool.imap_unordered(
+                    self._lookup, missing):
+                statuses[username] = status
+
+                if status is not None:
+                    fresh[username.lower()] = (status, fullname, now)
+        finally:
+            pool.close()
+
+        self._store(fresh)
+        return statuses
+
+    def _lookup(self, username):
+        """Fetch the status of a single account.
+
+        Returns a (username, status, fullname) tuple. The status is None if
+        the lookup failed, and the fullname is None unless the account is
+        active
+        """
+        self.bucket.acquire()
+        self.metrics.increment('api_calls')
+        self.metrics.increment('account_lookups')
+
+        try:
+            redditor = self.r.get('user/{}/about'.format(username))
+        except NotFound:
+            return username, DELETED, None
+        except Exception:
+            return username, None, None
+        finally:
+            self.bucket.update_from(self.r)
+
+        if getattr(redditor, 'is_suspended', False):
+            return username, SUSPENDED, None
+
+        return username, ACTIVE, getattr(redditor, 'fullname', None)
+
+    def _lookup_batch(self, fullnames):
+        """Return the fullnames of the active accounts among fullnames."""
+        self.bucket.acquire()
+        self.metrics.increment('api_calls')
+        self.metrics.increment('account_batches')
+
+        try:
+            found = list(self.r.redditors.partial_redditors(fullnames))
+        except Exception:
+            return []  # Looked up one at a time instead
+        finally:
+            self.bucket.update_from(self.r)
+
+        return [x.fullname for x in found
+                if not getattr(x, 'is_suspended', False)]
+
+    def _cached(self, usernames):
+        """Return the stored results of the accounts, by lowercase name."""
+        with self._lock:
+            known = dict(self.results)
+
+        if self.cache is not None:
+            wanted = [x.lower() for x in usernames if x.lower() not in known]
+            stored = self.cache.get_accounts(wanted)
+            known.update(stored)
+
+            with self._lock:
+                self.results.update(stored)
+
+        return known
+
+    def _store(self, fresh):
+        """Remember the results of the accounts looked up by check."""
+        with self._lock:
+            self.results.update(fresh)
+
+        if self.cache is not None and fresh:
+            self.cache.set_accounts(fresh)
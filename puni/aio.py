@@ -0,0 +1,882 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import asyncio
+import contextvars
+import inspect
+import types
+from contextlib import asynccontextmanager
+from functools import partial, wraps
+
+from puni import accounts, stream, transfer
+from puni.backends import EditConflict, PageNotFound
+from puni.base import UserNotes, _Return
+from puni.history import _MISSING, History
+from puni.snapshot import Snapshot
+from puni.watch import Watcher
+
+try:
+    from asyncprawcore.exceptions import Conflict, NotFound
+except ImportError:  # asyncpraw is optional
+    Conflict = NotFound = None
+
+# The batches opened by the running task and the tasks it started
+_open_batches = contextvars.ContextVar('open_batches', default=())
+
+
+def async_update_cache(func=None, write=False):
+    """Decorate the methods of AsyncUserNotes that use the usernotes JSON.
+
+    Works like update_cache, awaiting the download and upload of the page.
+    The decorated function may be a coroutine function or a plain function,
+    such as the undecorated methods of UserNotes. Calls on the same object
+    run one at a time, except calls made by the coroutine holding a batch
+    open, which join the batch.
+
+    Arguments:
+        func: the function being decorated
+        write: see update_cache (bool)
+    """
+    if func is None:
+        return partial(async_update_cache, write=write)
+
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        """The wrapper function."""
+        lazy = kwargs.pop('lazy', False)
+        self.metrics.increment('update_cache')
+
+        if lazy or self._in_batch():
+            return await _call_cached(self, func, write, lazy, args, kwargs)
+
+        async with self._async_lock:
+            return await _call_cached(self, func, write, lazy, args, kwargs)
+
+    return wrapper
+
+
+async def _call_cached(usernotes, func, write, lazy, args, kwargs):
+    """Run a function decorated with async_update_cache."""
+    batch = usernotes._batch
+    cached = (usernotes.revision_id is not None and
+              not usernotes._unsaved_changes)
+    skipped = not lazy and batch is None and write and cached
+
+    if not lazy and batch is None and not skipped:
+        await usernotes.get_json()
+
+    try:
+        ret = await _maybe_await(func(usernotes, *args, **kwargs))
+    except (KeyError, IndexError):
+        if not skipped:
+            raise
+
+        # The cached page may predate what func looked for (see update_cache)
+        await usernotes.get_json()
+        ret = await _maybe_await(func(usernotes, *args, **kwargs))
+
+    # If returning a string assume it is an update message
+    if isinstance(ret, str):
+        # The change only lives in the cache until set_json succeeds
+        usernotes._unsaved_changes = True
+
+    if isinstance(ret, str) and not lazy:
+        if batch is None:
+            await usernotes.set_json(ret)
+        else:
+            batch.append(ret)
+    else:
+        return ret
+
+
+async def _await_steps(steps):
+    """Run the steps of a method shared with UserNotes, awaiting its calls.
+
+    See base._run_steps.
+    """
+    value = error = None
+
+    try:
+        while True:
+            if error is None:
+                step = steps.send(value)
+            else:
+                step, error = steps.throw(error), None
+
+            try:
+                if isinstance(step, types.GeneratorType):
+                    value = await _await_steps(step)
+                else:
+                    value = await _maybe_await(step[0](*step[1:]))
+            except Exception as e:
+                error = e
+    except StopIteration:
+        return None
+    except _Return as e:
+        return e.value
+
+
+async def _maybe_await(value):
+    """Return a value, awaiting it first if it is awaitable."""
+    if inspect.isawaitable(value):
+        return await value
+
+    return value
+
+
+class AsyncPRAWBackend(object):
+    """Stores wiki pages on reddit through asyncpraw.
+
+    Provides the methods of PRAWBackend as coroutines, except that revisions
+    returns a list.
+    """
+
+    def __init__(self, subreddit):
+        """Constructor for the AsyncPRAWBackend class.
+
+        Arguments:
+            subreddit: the subreddit whose wiki is used (asyncpraw Subreddit
+                object)
+
+        Raises:
+            ImportError if asyncpraw is not installed
+        """
+        if NotFound is None:
+            raise ImportError('AsyncPRAWBackend requires asyncpraw')
+
+        self.subreddit = subreddit
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'AsyncPRAWBackend(subreddit=\'{}\')'.format(self.name)
+
+    @property
+    def name(self):
+        """The name of the subreddit the pages belong to."""
+        return self.subreddit.display_name
+
+    async def read(self, page, revision=None):
+        """Return the contents of a wiki page (see PRAWBackend.read)."""
+        try:
+            wiki_page = await self.subreddit.wiki.get_page(
+                page, revision=revision
+            )
+        except NotFound:
+            raise PageNotFound(page)
+
+        return wiki_page.content_md, wiki_page.revision_id
+
+    async def revisions(self, page, limit=None):
+        """Return the revisions of a page (see PRAWBackend.revisions)."""
+        wiki_page = await self.subreddit.wiki.get_page(page, fetch=False)
+        revisions = []
+
+        try:
+            async for revision in wiki_page.revisions(limit=limit):
+                author = revision.get('author')
+                revisions.append({
+                    'id': revision['id'],
+                    'timestamp': revision.get('timestamp'),
+                    'author': getattr(author, 'name', author),
+                    'reason': revision.get('reason')
+                })
+        except NotFound:
+            pass
+
+        return revisions
+
+    async def latest_revision(self, page):
+        """Return the ID of the newest revision of a page, or None."""
+        revisions = await self.revisions(page, limit=1)
+        return revisions[0]['id'] if revisions else None
+
+    async def write(self, page, content, reason='', previous=None):
+        """Replace the contents of a page (see PRAWBackend.write)."""
+        wiki_page = await self.subreddit.wiki.get_page(page, fetch=False)
+
+        if previous is None:
+            await wiki_page.edit(content=content, reason=reason)
+            return None
+
+        try:
+            await wiki_page.edit(content=content, reason=reason,
+                                 previous=previous)
+        except Conflict:
+            raise EditConflict(page)
+
+        ids = [x['id'] for x in await self.revisions(page, limit=2)]
+
+        if len(ids) == 2 and ids[1] == previous:
+            return ids[0]
+        else:
+            return None
+
+    async def create(self, page, content, reason=''):
+        """Create a wiki page (see PRAWBackend.create)."""
+        wiki_page = await self.subreddit.wiki.create(
+            name=page, content=content, reason=reason
+        )
+        # Set the page as hidden and available to moderators only
+        await wiki_page.mod.update(listed=False, permlevel=2)
+        return None
+
+    async def moderators(self):
+        """Return the usernames of the subreddit's moderators."""
+        return [x.name async for x in self.subreddit.moderator()]
+
+
+class AsyncBackend(object):
+    """Makes a backend with blocking methods usable by AsyncUserNotes.
+
+    Every request runs on an executor. Meant for MemoryBackend and FileBackend
+    in tests; use AsyncPRAWBackend for reddit.
+    """
+
+    def __init__(self, backend, executor=None):
+        """Constructor for the AsyncBackend class.
+
+        Arguments:
+            backend: the backend to wrap (MemoryBackend, FileBackend or
+                PRAWBackend)
+            executor: the executor to run requests on. Defaults to the event
+                loop's default executor (concurrent.futures.Executor)
+        """
+        self.backend = backend
+        self.executor = executor
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'AsyncBackend(backend={!r})'.format(self.backend)
+
+    @property
+    def name(self):
+        """The name of the subreddit the pages belong to."""
+        return self.backend.name
+
+    async def read(self, page, revision=None):
+        """Return the contents of a wiki page (see PRAWBackend.read)."""
+        return await self._run(self.backend.read, page, revision)
+
+    async def revisions(self, page, limit=None):
+        """Return the revisions of a page (see PRAWBackend.revisions)."""
+        return await self._run(
+            lambda: list(self.backend.revisions(page, limit))
+        )
+
+    async def latest_revision(self, page):
+        """Return the ID of the newest revision of a page, or None."""
+        return await self._run(self.backend.latest_revision, page)
+
+    async def write(self, page, content, reason='', previous=None):
+        """Replace the contents of a page (see PRAWBackend.write)."""
+        return await self._run(
+            self.backend.write, page, content, reason, previous
+        )
+
+    async def create(self, page, content, reason=''):
+        """Create a wiki page (see PRAWBackend.create)."""
+        return await self._run(self.backend.create, page, content, reason)
+
+    async def moderators(self):
+        """Return the usernames of the subreddit's moderators."""
+        return await self._run(self.backend.moderators)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+
+class AsyncHistory(History):
+    """Reads past revisions of the page of an AsyncUserNotes.
+
+    Works like History, with coroutines in place of its methods and
+    snapshots yielded by an asynchronous iterator. Up to workers revisions
+    are downloaded at the same time.
+
+    Returned by AsyncUserNotes.history.
+    """
+
+    list_size = 100  # Revisions listed before the rest of the list is read
+
+    def __init__(self, usernotes, workers=8, max_cached=32):
+        """Constructor for the AsyncHistory class.
+
+        Arguments:
+            usernotes: the usernotes whose page is read (AsyncUserNotes)
+
+        See History for the other arguments.
+        """
+        super(AsyncHistory, self).__init__(usernotes, workers, max_cached)
+        self._revisions_lock = asyncio.Lock()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'AsyncHistory(usernotes={!r})'.format(self.usernotes)
+
+    async def revisions(self, limit=None):
+        """Return the revisions of the usernotes page, newest first.
+
+        See History.revisions. The async backends return whole listings, so
+        the newest list_size revisions are requested first, and the full list
+        only if the newest known revision is not among them.
+        """
+        un = self.usernotes
+
+        async with self._revisions_lock:
+            known = self._revisions[0]['id'] if self._revisions else None
+            count = self.list_size if known else None
+
+            while True:
+                un._count_request('revision_checks')
+                listed = await un.backend.revisions(un.page_name, limit=count)
+                ids = [x['id'] for x in listed]
+
+                if known in ids:
+                    self._revisions = (listed[:ids.index(known)] +
+                                       self._revisions)
+                    break
+                elif count is None or len(listed) < count:
+                    # The known revisions are gone, as the page was recreated
+                    self._revisions = listed
+                    break
+
+                count = None
+
+            revisions = self._revisions
+
+        return revisions[:limit] if limit else list(revisions)
+
+    async def snapshot(self, revision_id):
+        """Return the usernotes as of a revision (see History.snapshot)."""
+        snapshot = self._cached(revision_id)
+
+        if snapshot is _MISSING:
+            snapshot = self._keep(revision_id, await self._load(revision_id))
+
+        return snapshot
+
+    async def snapshots(self, revisions=None):
+        """Iterate over the usernotes as of every revision, newest first.
+
+        See History.snapshots.
+
+        Usage:
+            async for revision, snapshot in history.snapshots():
+                print(revision['author'], snapshot.get_users())
+        """
+        if revisions is None:
+            revisions = await self.revisions()
+
+        for i in range(0, len(revisions), self.workers):
+            chunk = revisions[i:i + self.workers]
+            snapshots = await asyncio.gather(
+                *[self.snapshot(x['id']) for x in chunk]
+            )
+
+            for revision, snapshot in zip(chunk, snapshots):
+                if snapshot is not None:
+                    yield revision, snapshot
+
+    async def revision_at(self, timestamp):
+        """Return the revision that was current at a point in time.
+
+        See History.revision_at.
+        """
+        return self._find_revision(await self.revisions(), timestamp)
+
+    async def get_notes(self, user, at):
+        """Return a user's notes as they were at a point in time.
+
+        See History.get_notes.
+        """
+        revision = await self.revision_at(at)
+        snapshot = await self.snapshot(revision['id']) if revision else None
+
+        return snapshot.get_notes(user) if snapshot else []
+
+    async def provenance(self, note):
+        """Find the revisions that added and removed a note.
+
+        See History.provenance.
+        """
+        key = self._key(note)
+        result = {'added': None, 'removed': None}
+        newer = None  # The revision after the one being looked at
+        seen = False
+
+        async for revision, snapshot in self.snapshots():
+            present = any(self._key(x) == key
+                          for x in snapshot.get_notes(note.username))
+
+            if present and not seen:
+                seen = True
+                result['removed'] = newer
+            elif seen and not present:
+                result['added'] = newer
+                return result
+
+            newer = revision
+
+        if seen:
+            result['added'] = newer
+
+        return result
+
+    async def _load(self, revision_id):
+        """Read a revision from the persistent cache or the wiki."""
+        un = self.usernotes
+        cache = un.cache
+        notes = None
+
+        if cache is not None:
+            notes = await un._run(
+                cache.get, un.backend.name, self.cache_page, revision_id
+            )
+
+        if notes is None:
+            try:
+                page, _ = await un._read_page(un.page_name, revision_id)
+            except RuntimeError:
+                return None
+
+            notes = await un._run(un._decode_page, page)
+
+            if cache is not None:
+                await un._run(partial(
+                    cache.set, un.backend.name, self.cache_page, revision_id,
+                    notes, replace=False
+                ))
+
+        return Snapshot(un, notes, revision_id)
+
+
+class AsyncWatcher(Watcher):
+    """Follows the changes made to the page of an AsyncUserNotes.
+
+    Works like Watcher, but is iterated over with async for, and poll is a
+    coroutine. Comparing the revisions runs on the executor.
+
+    Returned by AsyncUserNotes.watch.
+    """
+
+    __iter__ = None  # Only async iteration is supported
+
+    def __init__(self, usernotes, interval=30, max_interval=300, backoff=2,
+                 stop=None):
+        """Constructor for the AsyncWatcher class.
+
+        Arguments:
+            usernotes: the usernotes to watch (AsyncUserNotes)
+            stop: ends the iteration when set, even while waiting
+                (asyncio.Event)
+
+        See Watcher for the other arguments.
+        """
+        super(AsyncWatcher, self).__init__(
+            usernotes, interval, max_interval, backoff,
+            stop if stop else asyncio.Event()
+        )
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'AsyncWatcher(usernotes={!r})'.format(self.usernotes)
+
+    async def __aiter__(self):
+        """Yield Events until stop is set (see Watcher.__iter__)."""
+        while not self.stop.is_set():
+            events = await self.poll()
+
+            for event in events:
+                yield event
+
+            self._back_off(events)
+
+            try:
+                await asyncio.wait_for(self.stop.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self):
+        """Check the page once and return the Events since the last poll.
+
+        See Watcher.poll.
+        """
+        un = self.usernotes
+
+        if self._snapshot is not None:
+            if await un._latest_revision() == self._snapshot.revision_id \
+                    and not un._unsaved_changes:
+                return []
+
+        async with un._async_lock:
+            if not un._unsaved_changes:
+                await un.get_json()
+
+            snapshot = un.snapshot()
+
+        return await un._run(self._advance, snapshot)
+
+
+class AsyncUserNotes(UserNotes):
+    """Represents an entire usernotes wiki page, for asyncio programs.
+
+    The counterpart of UserNotes for asyncpraw. Methods that use the wiki are
+    coroutines, and decoding and encoding the page (json and zlib) runs on an
+    executor so large pages do not block the event loop.
+
+    Usage:
+        un = AsyncUserNotes(reddit, await reddit.subreddit('subreddit'))
+        await un.add_note(Note('username', 'note', warning='spamwarn'))
+        notes = await un.get_notes('username')
+    """
+
+    def __init__(self, r, subreddit, cache=None, backend=None, metrics=None,
+                 compression=None, executor=None):
+        """Constructor for the AsyncUserNotes class.
+
+        The page is downloaded by the first coroutine that needs it.
+
+        Arguments:
+            r: the authenticated reddit instance (asyncpraw Reddit object)
+            subreddit: the subreddit the usernotes will be pulled from
+                (asyncpraw Subreddit object)
+            cache: see UserNotes (SQLiteCache)
+            backend: where the wiki page is stored. Defaults to the
+                subreddit's wiki (AsyncPRAWBackend or AsyncBackend)
+            metrics: see UserNotes (Metrics)
+            compression: see UserNotes (CompressionPolicy)
+            executor: runs the decoding, encoding and persistent cache
+                accesses. Defaults to the event loop's default executor
+                (concurrent.futures.Executor)
+        """
+        super(AsyncUserNotes, self).__init__(
+            r, subreddit, lazy_start=True, cache=cache,
+            backend=backend if backend else AsyncPRAWBackend(subreddit),
+            metrics=metrics, compression=compression
+        )
+        self.executor = executor
+        self._async_lock = asyncio.Lock()
+
+    def __repr__(self):
+        """Format the object's representation the same as praw would."""
+        return "AsyncUserNotes(subreddit=\'{}\')".format(self.backend.name)
+
+    async def get_json(self):
+        """Get the JSON stored on the usernotes wiki page.
+
+        See UserNotes.get_json.
+        """
+        return await _await_steps(self._get_json_steps())
+
+    async def _download(self):
+        """Replace the cache with the latest revision of the wiki page."""
+        self._count_request('wiki_reads')
+
+        with self.metrics.timer('fetch') as timer:
+            content, revision = await self.backend.read(self.page_name)
+            timer.size = len(content)
+
+        notes = await self._run(
+            lambda: self._expand_json(self._parse_page(content))
+        )
+        self._set_cache(notes, revision)
+        await self._run(self._store_cached)
+
+    async def is_current(self):
+        """Check whether the cached JSON matches the latest wiki revision.
+
+        See UserNotes.is_current.
+        """
+        if self.revision_id is None or self._unsaved_changes:
+            return False
+
+        return await self._latest_revision() == self.revision_id
+
+    async def _latest_revision(self, page=None):
+        """Return the ID of the newest revision of a wiki page, or None."""
+        self._count_request('revision_checks')
+
+        with self.metrics.timer('revision_check'):
+            return await self.backend.latest_revision(page or self.page_name)
+
+    async def _read_page(self, page, revision=None):
+        """Download a wiki page in the usernotes format without decoding it.
+
+        See UserNotes._read_page.
+        """
+        self._count_request('wiki_reads')
+
+        with self.metrics.timer('fetch') as timer:
+            content, revision = await self.backend.read(page, revision)
+            timer.size = len(content)
+
+        return await self._run(self._parse_page, content), revision
+
+    async def _init_notes(self):
+        """Set up the UserNotes page with the initial JSON schema."""
+        await _await_steps(self._init_notes_steps())
+
+    async def set_json(self, reason='', new_page=False):
+        """Send the JSON from the cache to the usernotes wiki page.
+
+        See UserNotes.set_json.
+        """
+        await _await_steps(self._set_json_steps(reason, new_page))
+
+    async def _write(self, compressed_json, reason, new_page):
+        """Upload compressed usernotes to the wiki page."""
+        self.revision_id = await self._upload(
+            self.page_name, compressed_json, reason, new_page, self.revision_id
+        )
+
+    async def _upload(self, page, content, reason, new_page, previous):
+        """Create or edit a wiki page (see UserNotes._upload)."""
+        self._count_request('wiki_writes')
+
+        with self.metrics.timer('upload') as timer:
+            timer.size = len(content)
+
+            if new_page:
+                return await self.backend.create(page, content, reason)
+            else:
+                return await self.backend.write(
+                    page, content, reason, previous=previous
+                )
+
+    async def _sleep(self, seconds):
+        """Wait between the attempts of set_json."""
+        await asyncio.sleep(seconds)
+
+    @asynccontextmanager
+    async def batch(self, reason=None):
+        """Group several changes into a single wiki revision.
+
+        See UserNotes.batch. Other coroutines wait for the batch to finish
+        before changing the usernotes.
+
+        Usage:
+            async with un.batch():
+                await un.add_note(note_a)
+                await un.add_note(note_b)
+        """
+        if self._in_batch():
+            yield self
+            return
+
+        async with self._async_lock:
+            await self.get_json()
+            undo = self._open_batch()
+            token = _open_batches.set(_open_batches.get() + (self._batch,))
+
+            try:
+                yield self
+
+                reason = self._close_batch(reason)
+
+                if reason:
+                    await self.set_json(reason)
+            except Exception:
+                self._undo_batch(undo)
+                raise
+            finally:
+                self._batch = None
+                _open_batches.reset(token)
+
+    @async_update_cache
+    async def get_notes(self, user, include_archive=False):
+        """Return a list of Note objects for the given user.
+
+        See UserNotes.get_notes.
+        """
+        notes = UserNotes.get_notes.__wrapped__(self, user)
+
+        if include_archive:
+            notes.extend(
+                await _await_steps(self._archived_notes_steps(user, notes))
+            )
+
+        return notes
+
+    query = async_update_cache(UserNotes.query.__wrapped__)
+    summaries = async_update_cache(UserNotes.summaries.__wrapped__)
+    search = async_update_cache(UserNotes.search.__wrapped__)
+    get_users = async_update_cache(UserNotes.get_users.__wrapped__)
+    remove_note = async_update_cache(
+        UserNotes.remove_note.__wrapped__, write=True
+    )
+    remove_user = async_update_cache(
+        UserNotes.remove_user.__wrapped__, write=True
+    )
+    compact_constants = async_update_cache(
+        UserNotes.compact_constants.__wrapped__, write=True
+    )
+    _add_note = async_update_cache(UserNotes.add_note.__wrapped__, write=True)
+    _remove_users = async_update_cache(
+        UserNotes._remove_users.__wrapped__, write=True
+    )
+
+    async def add_note(self, note, lazy=False):
+        """Add a note to the usernotes wiki page.
+
+        See UserNotes.add_note.
+        """
+        if not note.moderator:
+            note.moderator = (await self.r.user.me()).name
+
+        return await self._add_note(note, lazy=lazy)
+
+    async def peek_notes(self, user):
+        """Return a list of Note objects for the given user from the wiki page.
+
+        See UserNotes.peek_notes.
+        """
+        if self.cached_json and await self.is_current():
+            return await self.get_notes(user, lazy=True)
+
+        self._count_request('wiki_reads')
+
+        with self.metrics.timer('fetch') as timer:
+            content, _ = await self.backend.read(self.page_name)
+            timer.size = len(content)
+
+        notes = await self._run(self._parse_page, content)
+        entry = await self._run(stream.find_user, notes['blob'], user)
+
+        if entry is None:
+            return []
+
+        return [self._make_note(user, x, notes['constants'])
+                for x in entry['ns']]
+
+    async def export_notes(self, fp, format='jsonl'):
+        """Write every note to a file, one row per note.
+
+        See UserNotes.export_notes.
+        """
+        await self.get_json()
+        return transfer.write_rows(
+            fp, self._export_rows(self.snapshot()), format
+        )
+
+    async def import_notes(self, fp, format='jsonl', reason=None):
+        """Add the notes from a file in the format written by export_notes.
+
+        See UserNotes.import_notes. The file is read on the executor before
+        the batch opens.
+        """
+        rows = await self._run(lambda: list(transfer.read_rows(fp, format)))
+        me = None
+
+        if any(not x['moderator'] for x in rows):
+            me = (await self.r.user.me()).name
+
+        async with self.batch(reason):
+            return self._import_rows(rows, lambda: me)
+
+    async def prune_inactive_users(
+            self, checker, statuses=(accounts.DELETED, accounts.SUSPENDED),
+            reason=None):
+        """Remove the users whose reddit accounts were deleted or suspended.
+
+        See UserNotes.prune_inactive_users. The accounts are looked up on the
+        executor, as AccountChecker makes blocking requests.
+
+        Arguments:
+            checker: looks up the accounts. Needs a praw Reddit instance, as
+                asyncpraw is not supported by AccountChecker (AccountChecker)
+            statuses: see UserNotes.prune_inactive_users (tuple)
+            reason: see UserNotes.prune_inactive_users (str)
+
+        Returns a dict of the removed usernames -> account status
+        """
+        found = await self._run(checker.check, await self.get_users())
+
+        async with self.batch(reason=reason):
+            users = self.cached_json['users']
+            removed = dict((k, v) for k, v in found.items()
+                           if v in statuses and k in users)
+
+            if removed:
+                await self._remove_users(sorted(removed))
+
+        return removed
+
+    def watch(self, interval=30, max_interval=300, backoff=2, stop=None):
+        """Follow the changes made to the usernotes page.
+
+        See UserNotes.watch and AsyncWatcher.
+
+        Returns an AsyncWatcher
+
+        Usage:
+            async for event in un.watch(interval=10):
+                if isinstance(event, NoteAdded):
+                    print(event.username, event.note.warning)
+        """
+        return AsyncWatcher(self, interval, max_interval, backoff, stop)
+
+    def history(self, workers=8, max_cached=32):
+        """Read past revisions of the usernotes page.
+
+        See UserNotes.history and AsyncHistory.
+
+        Returns an AsyncHistory
+
+        Usage:
+            history = un.history()
+            notes = await history.get_notes('username', at=time.time() - 86400)
+        """
+        return AsyncHistory(self, workers, max_cached)
+
+    @async_update_cache(write=True)
+    async def prune(self, target_size=None, policies=None):
+        """Remove notes until the usernotes page fits in a size.
+
+        See UserNotes.prune.
+        """
+        removed = await _await_steps(
+            self._prune_steps(target_size, policies)
+        )
+        return self._prune_reason('prune', removed)
+
+    @async_update_cache(write=True)
+    async def archive(self, target_size=None, policies=None):
+        """Move notes to the archive until the usernotes page fits in a size.
+
+        See UserNotes.archive.
+        """
+        removed = await _await_steps(
+            self._prune_steps(target_size, policies, True)
+        )
+        return self._prune_reason('archive', removed)
+
+    async def get_archive_manifest(self):
+        """Get the manifest of the archive shards.
+
+        See UserNotes.get_archive_manifest.
+        """
+        return await _await_steps(self._archive_manifest_steps())
+
+    def _in_batch(self):
+        """Check whether the running coroutine holds a batch open."""
+        return (self._batch is not None and
+                any(x is self._batch for x in _open_batches.get()))
+
+    async def _run(self, func, *args):
+        """Run a blocking function on the executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
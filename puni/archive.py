@@ -0,0 +1,102 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+
+Helpers for the usernotes archive.
+
+Notes moved out of the usernotes page by UserNotes.archive are stored on
+archive shard pages (usernotes_archive_1, usernotes_archive_2, ...) in the same
+format as the usernotes page itself, each with its own constants. The manifest
+page (usernotes_archive) lists the shards and, in its BLOB, the shards that
+hold every archived user, so a user's archived notes can be read without
+downloading the other shards.
+"""
+
+
+def shard_page(manifest_page, number):
+    """Return the wiki page name of an archive shard.
+
+    Arguments:
+        manifest_page: the name of the manifest page (str)
+        number: the shard number, starting at 1 (int)
+    """
+    return '{}_{}'.format(manifest_page, number)
+
+
+def empty_manifest(schema):
+    """Return the manifest of an archive without shards.
+
+    Arguments:
+        schema: the usernotes schema version (int)
+    """
+    return {'ver': schema, 'shards': [], 'users': {}}
+
+
+def build_page(schema, users):
+    """Build a usernotes page from resolved notes.
+
+    Arguments:
+        schema: the usernotes schema version (int)
+        users: a map of usernames to lists of notes as returned by
+            UserNotes._resolve_note (dict)
+
+    Returns a dict in the decoded usernotes format, with constants holding
+    only the moderators and warnings the notes use
+    """
+    mods = {}
+    warnings = {}
+    page_users = {}
+
+    for username, notes in users.items():
+        page_users[username] = {'ns': [
+            {
+                'n': x['n'],
+                't': x['t'],
+                'm': mods.setdefault(x['m'], len(mods)),
+                'l': x['l'],
+                'w': warnings.setdefault(x['w'], len(warnings))
+            }
+            for x in sorted(notes, key=lambda x: x['t'], reverse=True)
+        ]}
+
+    return {
+        'ver': schema,
+        'users': page_users,
+        'constants': {
+            'users': sorted(mods, key=mods.get),
+            'warnings': sorted(warnings, key=warnings.get)
+        }
+    }
+
+
+def resolve_users(page):
+    """Return the notes of a decoded usernotes page in resolved form.
+
+    Arguments:
+        page: the decoded usernotes (dict)
+
+    Returns a map of usernames to lists of notes (see build_page)
+    """
+    constants = page['constants']
+
+    return dict(
+        (username, [{
+            'n': x['n'],
+            't': x['t'],
+            'm': constants['users'][x['m']],
+            'l': x['l'],
+            'w': constants['warnings'][x['w']]
+        } for x in user['ns']])
+        for username, user in page['users'].items()
+    )
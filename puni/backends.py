@@ -0,0 +1,317 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import json
+import os
+import random
+import threading
+import time
+
+from prawcore.exceptions import Conflict, NotFound
+
+
+class PageNotFound(KeyError):
+    """Raised when a wiki page or revision does not exist."""
+
+
+class EditConflict(RuntimeError):
+    """Raised when a wiki page was edited after the revision an edit was
+    based on."""
+
+
+class PRAWBackend(object):
+    """Stores wiki pages on reddit through PRAW.
+
+    All backends provide the same methods. Revisions are described by dicts
+    with 'id', 'timestamp', 'author' (a username or None) and 'reason' keys.
+    """
+
+    def __init__(self, subreddit):
+        """Constructor for the PRAWBackend class.
+
+        Arguments:
+            subreddit: the subreddit whose wiki is used (PRAW Subreddit object)
+        """
+        self.subreddit = subreddit
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'PRAWBackend(subreddit=\'{}\')'.format(self.name)
+
+    @property
+    def name(self):
+        """The name of the subreddit the pages belong to."""
+        return self.subreddit.display_name
+
+    def read(self, page, revision=None):
+        """Return the contents of a wiki page.
+
+        Arguments:
+            page: the wiki page name (str)
+            revision: the revision to read. Defaults to the latest (str)
+
+        Returns a (content, revision ID) tuple
+
+        Raises:
+            PageNotFound if the page or revision does not exist
+        """
+        wiki_page = self.subreddit.wiki[page]
+
+        if revision is not None:
+            wiki_page = wiki_page.revision(revision)
+
+        try:
+            return wiki_page.content_md, wiki_page.revision_id
+        except NotFound:
+            raise PageNotFound(page)
+
+    def revisions(self, page, limit=None):
+        """Iterate over the revisions of a wiki page, newest first.
+
+        Arguments:
+            page: the wiki page name (str)
+            limit: the maximum number of revisions to return (int)
+
+        Yields revision dicts
+        """
+        try:
+            for revision in self.subreddit.wiki[page].revisions(limit=limit):
+                author = revision.get('author')
+                yield {
+                    'id': revision['id'],
+                    'timestamp': revision.get('timestamp'),
+                    'author': getattr(author, 'name', author),
+                    'reason': revision.get('reason')
+                }
+        except NotFound:
+            return
+
+    def latest_revision(self, page):
+        """Return the ID of the newest revision of a page, or None."""
+        for revision in self.revisions(page, limit=1):
+            return revision['id']
+
+        return None
+
+    def write(self, page, content, reason='', previous=None):
+        """Replace the contents of an existing wiki page.
+
+        Arguments:
+            page: the wiki page name (str)
+            content: the new page contents (str)
+            reason: the change reason for the wiki changelog (str)
+            previous: the revision the edit is based on. If given, the edit
+                fails if the page has been edited since (str)
+
+        Returns the ID of the new revision, or None if it is not known
+
+        Raises:
+            EditConflict if the page was edited after previous
+        """
+        wiki_page = self.subreddit.wiki[page]
+
+        if previous is None:
+            wiki_page.edit(content, reason)
+            return None
+
+        try:
+            wiki_page.edit(content, reason, previous=previous)
+        except Conflict:
+            raise EditConflict(page)
+
+        # reddit does not return the new revision, but if the two newest
+        # revisions are previous and one after it, the newer one is ours
+        ids = [x['id'] for x in self.revisions(page, limit=2)]
+
+        if len(ids) == 2 and ids[1] == previous:
+            return ids[0]
+        else:
+            return None
+
+    def create(self, page, content, reason=''):
+        """Create a wiki page visible to moderators only.
+
+        Arguments:
+            page: the wiki page name (str)
+            content: the page contents (str)
+            reason: the change reason for the wiki changelog (str)
+
+        Returns the ID of the new revision, or None if it is not known
+        """
+        self.subreddit.wiki.create(page, content, reason)
+        # Set the page as hidden and available to moderators only
+        self.subreddit.wiki[page].mod.update(False, permlevel=2)
+        return None
+
+    def moderators(self):
+        """Return the usernames of the subreddit's moderators."""
+        return [x.name for x in self.subreddit.moderator()]
+
+
+class MemoryBackend(object):
+    """Stores wiki pages in memory, for testing and load testing offline.
+
+    Revisions are tracked like on reddit, and a delay can be added to every
+    request. Write conflicts can be provoked by setting conflict_rate, which
+    makes other "moderators" edit the page right before some of the edits
+    that are based on a previous revision.
+    """
+
+    def __init__(self, name='puni', moderators=(), latency=0,
+                 conflict_rate=0, seed=None):
+        """Constructor for the MemoryBackend class.
+
+        Arguments:
+            name: the name of the simulated subreddit (str)
+            moderators: the usernames of the simulated moderators (list)
+            latency: seconds every request takes (float)
+            conflict_rate: the probability an edit runs into a conflict (float)
+            seed: the seed for the conflict simulation (int)
+        """
+        self.name = name
+        self.latency = latency
+        self.conflict_rate = conflict_rate
+        self.pages = {}  # name -> list of revision dicts, oldest first
+        self.requests = 0
+        self._moderators = list(moderators)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._revision_count = 0
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'MemoryBackend(name=\'{}\')'.format(self.name)
+
+    def read(self, page, revision=None):
+        """Return the contents of a wiki page (see PRAWBackend.read)."""
+        with self._request():
+            revisions = self.pages.get(page)
+
+            if not revisions:
+                raise PageNotFound(page)
+
+            if revision is None:
+                found = revisions[-1]
+            else:
+                found = next((x for x in revisions if x['id'] == revision),
+                             None)
+
+                if found is None:
+                    raise PageNotFound(revision)
+
+            return found['content'], found['id']
+
+    def revisions(self, page, limit=None):
+        """Iterate over the revisions of a page (see PRAWBackend.revisions)."""
+        with self._request():
+            revisions = list(reversed(self.pages.get(page, [])))
+
+        for revision in revisions[:limit]:
+            yield dict((k, v) for k, v in revision.items() if k != 'content')
+
+    def latest_revision(self, page):
+        """Return the ID of the newest revision of a page, or None."""
+        with self._request():
+            revisions = self.pages.get(page)
+            return revisions[-1]['id'] if revisions else None
+
+    def write(self, page, content, reason='', previous=None):
+        """Replace the contents of a page (see PRAWBackend.write)."""
+        with self._request():
+            if page not in self.pages:
+                raise PageNotFound(page)
+
+            if previous is not None:
+                if self._random.random() < self.conflict_rate:
+                    self._add_revision(page, self.pages[page][-1]['content'],
+                                       'simulated edit', 'simulated')
+
+                if self.pages[page][-1]['id'] != previous:
+                    raise EditConflict(page)
+
+            return self._add_revision(page, content, reason)
+
+    def create(self, page, content, reason=''):
+        """Create a wiki page (see PRAWBackend.create)."""
+        with self._request():
+            return self._add_revision(page, content, reason)
+
+    def moderators(self):
+        """Return the usernames of the simulated moderators."""
+        with self._request():
+            return list(self._moderators)
+
+    def _add_revision(self, page, content, reason, author=None):
+        self._revision_count += 1
+        revision = {
+            'id': '{:x}'.format(self._revision_count),
+            'timestamp': time.time(),
+            'author': author,
+            'reason': reason,
+            'content': content
+        }
+        self.pages.setdefault(page, []).append(revision)
+        return revision['id']
+
+    def _request(self):
+        """Count a request, wait for the simulated latency and lock."""
+        self.requests += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        return self._lock
+
+
+class FileBackend(MemoryBackend):
+    """Stores wiki pages and their revisions in a local JSON file.
+
+    Takes the same options as MemoryBackend. The file is rewritten after every
+    edit, so it suits reproducible load tests rather than production use.
+    """
+
+    def __init__(self, path, **kwargs):
+        """Constructor for the FileBackend class.
+
+        Arguments:
+            path: the location of the JSON file, created if missing (str)
+            kwargs: options for MemoryBackend
+        """
+        super(FileBackend, self).__init__(**kwargs)
+        self.path = path
+
+        if os.path.exists(path):
+            with open(path) as fp:
+                self.pages = json.load(fp)
+
+            self._revision_count = sum(len(x) for x in self.pages.values())
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'FileBackend(path=\'{}\')'.format(self.path)
+
+    def _add_revision(self, page, content, reason, author=None):
+        revision = super(FileBackend, self)._add_revision(
+            page, content, reason, author
+        )
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.pages, fp)
+
+        getattr(os, 'replace', os.rename)(tmp_path, self.path)
+        return revision
@@ -16,19 +16,81 @@ with puni. If not, see http://www.gnu.org/licenses/.
 
 
 import json
+import math
 import time
 import re
 import zlib
 import base64
 import copy
+import threading
+import types
+from contextlib import contextmanager
 
-from prawcore.exceptions import NotFound
+from puni import accounts, archive, compact, links, stream, transfer
+from puni.backends import EditConflict, PageNotFound, PRAWBackend
+from puni.compression import CompressionPolicy, FixedCompression
 from puni.decorators import update_cache
+from puni.history import History
+from puni.index import NoteIndex, SizeIndex, SummaryIndex, TextIndex
+from puni.metrics import Metrics
+from puni.pruning import OldestFirst
+from puni.snapshot import Snapshot
+from puni.watch import Watcher
+
+
+class _Return(Exception):
+    """Ends the steps of a method with its result (see _run_steps).
+
+    Used as Python 2 generators can not return a value.
+    """
+
+    def __init__(self, value):
+        super(_Return, self).__init__(value)
+        self.value = value
+
+
+def _run_steps(steps):
+    """Run the steps of a method shared by UserNotes and AsyncUserNotes.
+
+    The steps are a generator holding the control flow of the method. It
+    yields the calls that do I/O as (function, arguments...) tuples, or other
+    steps to run first, and is sent back their results or has their
+    exceptions thrown into it. AsyncUserNotes runs the same steps with
+    aio._await_steps, as its I/O methods are coroutines.
+
+    Arguments:
+        steps: the steps to run (generator)
+
+    Returns the value of the _Return that ended the steps, or None
+    """
+    value = error = None
+
+    try:
+        while True:
+            if error is None:
+                step = steps.send(value)
+            else:
+                step, error = steps.throw(error), None
+
+            try:
+                if isinstance(step, types.GeneratorType):
+                    value = _run_steps(step)
+                else:
+                    value = step[0](*step[1:])
+            except Exception as e:
+                error = e
+    except StopIteration:
+        return None
+    except _Return as e:
+        return e.value
 
 
 class Note(object):
     """Represents an individual usernote."""
 
+    __slots__ = ('username', 'note', 'subreddit', 'time', 'moderator', 'link',
+                 'warning')
+
     warnings = [
         'none',
         'spamwatch',
@@ -61,15 +123,7 @@ class Note(object):
         self.moderator = mod
 
         # Compress link if necessary
-        full_link_re = re.compile(r'^https?://(\w{1,3}\.)?reddit.com/')
-        compr_link_re = re.compile(r'[ml],[A-Za-z\d]{2,}(,[A-Za-z\d]+)?')
-
-        if full_link_re.match(link):
-            self.link = Note._compress_url(link)
-        elif compr_link_re.match(link):
-            self.link = link
-        else:
-            self.link = ''
+        self.link = links.normalize(link)
 
         if warning in Note.warnings:
             self.warning = warning
@@ -93,65 +147,23 @@ class Note(object):
         if self.link == '':
             return None
         else:
-            return Note._expand_url(self.link, self.subreddit)
+            return links.expand_url(self.link, self.subreddit)
 
     @staticmethod
     def _compress_url(link):
         """Convert a reddit URL into the short-hand used by usernotes.
 
-        Arguments:
-            link: a link to a comment, submission, or message (str)
-
-        Returns a String of the shorthand URL
+        See links.compress_url.
         """
-        comment_re = re.compile(r'/comments/([A-Za-z\d]{2,})(?:/[^\s]+/([A-Za-z\d]+))?')
-        message_re = re.compile(r'/message/messages/([A-Za-z\d]+)')
-        matches = re.findall(comment_re, link)
-
-        if len(matches) == 0:
-            matches = re.findall(message_re, link)
-
-            if len(matches) == 0:
-                return None
-            else:
-                return 'm,' + matches[0]
-        else:
-            if matches[0][1] == '':
-                return 'l,' + matches[0][0]
-            else:
-                return 'l,' + matches[0][0] + ',' + matches[0][1]
+        return links.compress_url(link)
 
     @staticmethod
     def _expand_url(short_link, subreddit=None):
         """Convert a usernote's URL short-hand into a full reddit URL.
 
-        Arguments:
-            subreddit: the subreddit the URL is for (PRAW Subreddit object or str)
-            short_link: the compressed link from a usernote (str)
-
-        Returns a String of the full URL.
+        See links.expand_url.
         """
-        # Some URL structures for notes
-        message_scheme = 'https://reddit.com/message/messages/{}'
-        comment_scheme = 'https://reddit.com/r/{}/comments/{}/-/{}'
-        post_scheme = 'https://reddit.com/r/{}/comments/{}/'
-
-        if short_link == '':
-            return None
-        else:
-            parts = short_link.split(',')
-
-            if parts[0] == 'm':
-                return message_scheme.format(parts[1])
-            if parts[0] == 'l' and subreddit:
-                if len(parts) > 2:
-                    return comment_scheme.format(subreddit, parts[1], parts[2])
-                else:
-                    return post_scheme.format(subreddit, parts[1])
-            elif not subreddit:
-                raise ValueError('Subreddit name must be provided')
-            else:
-                return None
+        return links.expand_url(short_link, subreddit)
 
 
 class UserNotes(object):
@@ -161,8 +173,22 @@ class UserNotes(object):
     max_page_size = 524288  # Characters
     zlib_compression_strength = 9
     page_name = 'usernotes'
-
-    def __init__(self, r, subreddit, lazy_start=False):
+    archive_page_name = 'usernotes_archive'  # Shards are named ..._1, ..._2
+    max_reason_length = 256  # Characters allowed in a wiki change reason
+    commit_attempts = 4  # Edits tried before giving up on a conflicting page
+    commit_backoff = 0.5  # Seconds to wait after the first conflict, doubled
+    streaming_decode = False  # Decode the BLOB incrementally to save memory
+    compact_notes = False  # Store notes as slotted records to save memory
+    size_estimate_margin = 0.1  # Estimated overflow that fails without trying
+    prune_margin = 0.02  # Fraction of the target size that pruning leaves free
+    index_types = {'notes': NoteIndex, 'size': SizeIndex, 'text': TextIndex,
+                   'summary': SummaryIndex}
+    # Warning types from least to most severe, for summaries
+    warning_severity = ['gooduser', 'none', 'spamwatch', 'spamwarn',
+                        'abusewarn', 'ban', 'botban', 'permban']
+
+    def __init__(self, r, subreddit, lazy_start=False, cache=None,
+                 backend=None, metrics=None, compression=None):
         """Constuctor for the UserNotes class.
 
         Arguments:
@@ -171,21 +197,61 @@ class UserNotes(object):
                 Subreddit object)
             lazy_start: whether to download the usernotes immediately upon
                 instantiation (bool)
+            cache: a persistent cache of decoded usernotes, consulted before
+                downloading the wiki page (SQLiteCache)
+            backend: where the wiki page is stored. Defaults to the
+                subreddit's wiki (PRAWBackend, MemoryBackend or FileBackend)
+            metrics: receives the timings and counters of the wiki requests
+                and of encoding and decoding the page (Metrics)
+            compression: chooses the zlib settings for the page. Defaults to
+                escalating from level 1 up to zlib_compression_strength as the
+                page approaches max_page_size (CompressionPolicy)
         """
         self.r = r
         self.subreddit = subreddit
+        self.backend = backend if backend else PRAWBackend(subreddit)
+        self.cache = cache
+        self.metrics = metrics if metrics else Metrics()
+        self.compression = compression if compression else CompressionPolicy(
+            levels=[x for x in (1, 6) if x < self.zlib_compression_strength] +
+            [self.zlib_compression_strength]
+        )
+        # Archive pages are written rarely, so always compress them fully
+        self.archive_compression = FixedCompression(
+            self.zlib_compression_strength
+        )
         self.cached_json = {}
+        self.revision_id = None  # Wiki revision that cached_json was read from
+        self._unsaved_changes = False
+        self._oplog = []  # Changes made since the cache was downloaded
+        self._indexes = {}  # Built on demand by _index
+        self._indexed_users = None  # The users map the indexes describe
+        self._blob_ratio = None  # Compressed / serialized size of the BLOB
+        self._blob_ratio_size = 0
+        self._batch = None
+        self._manifest = None  # Decoded archive manifest
+        self._manifest_revision = None
+        self._shards = {}  # Shard page name -> (revision, decoded page)
+        self._lock = threading.RLock()  # Held by anything changing the cache
+        self._frozen_users = None  # Users map shared with snapshots
+        self._cow_users = None  # Users map copied from _frozen_users
+        self._owned_users = set()  # Entries of _cow_users copied already
+        self._constant_maps = {}  # Constants key -> (list, value -> index)
 
         if not lazy_start:
             self.get_json()
 
     def __repr__(self):
         """Format the object's representation the same as praw would."""
-        return "UserNotes(subreddit=\'{}\')".format(self.subreddit.display_name)
+        return "UserNotes(subreddit=\'{}\')".format(self.backend.name)
 
     def get_json(self):
         """Get the JSON stored on the usernotes wiki page.
 
+        If the page has not been edited since it was last downloaded (and the
+        cache holds no unsaved changes) the cached JSON is returned without
+        downloading or decoding the page again.
+
         Returns a dict representation of the usernotes (with the notes BLOB
         decoded).
 
@@ -193,45 +259,271 @@ class UserNotes(object):
             RuntimeError if the usernotes version is incompatible with this
                 version of puni.
         """
+        with self._lock:
+            return _run_steps(self._get_json_steps())
+
+    def _get_json_steps(self):
+        """The steps of get_json (see _run_steps)."""
+        if self.revision_id is not None or self.cache is not None:
+            latest = yield (self._latest_revision,)
+
+            if latest is not None and latest == self.revision_id:
+                if not self._unsaved_changes:
+                    self.metrics.increment('revision_hits')
+                    raise _Return(self.cached_json)
+            elif latest is not None:
+                if (yield (self._run, self._load_cached, latest)):
+                    self.metrics.increment('cache_loads')
+                    raise _Return(self.cached_json)
+
         try:
-            usernotes = self.subreddit.wiki[self.page_name].content_md
-            notes = json.loads(usernotes)
-        except NotFound:
-            self._init_notes()
-        else:
-            if notes['ver'] != self.schema:
-                raise RuntimeError(
-                    'Usernotes schema is v{0}, puni requires v{1}'.
-                    format(notes['ver'], self.schema)
-                )
+            yield (self._download,)
+        except PageNotFound:
+            yield self._init_notes_steps()
+
+        raise _Return(self.cached_json)
+
+    def _download(self):
+        """Replace the cache with the latest revision of the wiki page.
+
+        Any unsaved changes in the cache are discarded.
+
+        Raises:
+            PageNotFound if the usernotes page does not exist.
+            RuntimeError if the usernotes version is incompatible with this
+                version of puni.
+        """
+        notes, revision = self._fetch_page()
+        self._set_cache(self._expand_json(notes), revision)
+        self._store_cached()
+
+    def _fetch_page(self):
+        """Download the wiki page without decoding its BLOB.
+
+        Returns a (notes, revision) tuple of the page JSON (dict) and its
+        revision ID (str)
+
+        Raises:
+            PageNotFound if the usernotes page does not exist.
+            RuntimeError if the usernotes version is incompatible with this
+                version of puni.
+        """
+        return self._read_page(self.page_name)
+
+    def _read_page(self, page, revision=None):
+        """Download a wiki page in the usernotes format without decoding it.
+
+        Arguments:
+            page: the wiki page name (str)
+            revision: the revision to read. Defaults to the latest (str)
+
+        Returns a (notes, revision) tuple (see _fetch_page)
+
+        Raises:
+            PageNotFound if the page does not exist.
+            RuntimeError if the page's version is incompatible with this
+                version of puni.
+        """
+        self._count_request('wiki_reads')
+
+        with self.metrics.timer('fetch') as timer:
+            content, revision = self.backend.read(page, revision)
+            timer.size = len(content)
+
+        return self._parse_page(content), revision
 
-            self.cached_json = self._expand_json(notes)
+    def _parse_page(self, content):
+        """Parse the contents of a wiki page in the usernotes format.
 
-        return self.cached_json
+        Arguments:
+            content: the page contents (str)
+
+        Returns the page JSON with its BLOB still encoded (dict)
+
+        Raises:
+            RuntimeError if the page's version is incompatible with this
+                version of puni.
+        """
+        with self.metrics.timer('parse_page'):
+            notes = json.loads(content)
+
+        if notes['ver'] != self.schema:
+            raise RuntimeError(
+                'Usernotes schema is v{0}, puni requires v{1}'.
+                format(notes['ver'], self.schema)
+            )
+
+        return notes
+
+    def _load_cached(self, revision):
+        """Replace the cache with a revision from the persistent cache.
+
+        Arguments:
+            revision: the wiki revision ID to load (str)
+
+        Returns True if the revision was found in the persistent cache
+        """
+        if self.cache is None:
+            return False
+
+        notes = self.cache.get(
+            self.backend.name, self.page_name, revision,
+            object_hook=compact.CompactHook() if self.compact_notes else None
+        )
+
+        if notes is None or notes.get('ver') != self.schema:
+            return False
+
+        self._set_cache(notes, revision)
+        return True
+
+    def _store_cached(self):
+        """Save the cached JSON to the persistent cache, if there is one."""
+        if self.cache is not None and self.revision_id is not None:
+            self.cache.set(
+                self.backend.name,
+                self.page_name,
+                self.revision_id,
+                self.cached_json
+            )
+
+    def _set_cache(self, notes, revision):
+        """Replace the cached JSON, discarding any unsaved changes.
+
+        Arguments:
+            notes: the decoded usernotes (dict)
+            revision: the wiki revision the usernotes belong to (str)
+        """
+        self.cached_json = notes
+        self.revision_id = revision
+        self._unsaved_changes = False
+        self._oplog = []
+        self._indexes = {}
+
+    def is_current(self):
+        """Check whether the cached JSON matches the latest wiki revision.
+
+        Only the page's revision list is requested, which is far cheaper than
+        downloading and decoding the page itself.
+
+        Returns True if cached_json holds the latest revision of the page and
+        has no unsaved changes.
+        """
+        with self._lock:
+            if self.revision_id is None or self._unsaved_changes:
+                return False
+
+            return self._latest_revision() == self.revision_id
+
+    def _latest_revision(self, page=None):
+        """Return the ID of the newest revision of a wiki page.
+
+        Arguments:
+            page: the wiki page name. Defaults to the usernotes page (str)
+
+        Returns None if the page does not exist or has no revisions.
+        """
+        self._count_request('revision_checks')
+
+        with self.metrics.timer('revision_check'):
+            return self.backend.latest_revision(page or self.page_name)
+
+    def _count_request(self, counter):
+        """Count a request to the wiki.
+
+        Arguments:
+            counter: the counter for the kind of request (str)
+        """
+        self.metrics.increment('api_calls')
+        self.metrics.increment(counter)
 
     def _init_notes(self):
         """Set up the UserNotes page with the initial JSON schema."""
+        with self._lock:
+            _run_steps(self._init_notes_steps())
+
+    def _init_notes_steps(self):
+        """The steps of _init_notes (see _run_steps)."""
+        self.metrics.increment('api_calls')
+        moderators = yield (self.backend.moderators,)
         self.cached_json = {
             'ver': self.schema,
             'users': {},
             'constants': {
-                'users': [x.name for x in self.subreddit.moderator()],
-                'warnings': Note.warnings
+                'users': moderators,
+                'warnings': list(Note.warnings)
             }
         }
+        self.revision_id = None
+        self._oplog = []
+        self._indexes = {}
 
-        self.set_json('Initializing JSON via puni', True)
+        yield self._set_json_steps('Initializing JSON via puni', True)
 
     def set_json(self, reason='', new_page=False):
         """Send the JSON from the cache to the usernotes wiki page.
 
+        The edit is made against the revision the cache was downloaded from.
+        If somebody else edited the page in the meantime, the latest revision
+        is downloaded, the changes made through this object are replayed onto
+        it and the edit is retried, up to commit_attempts times in total.
+
         Arguments:
             reason: the change reason that will be posted to the wiki changelog
                 (str)
         Raises:
             OverflowError if the new JSON data is greater than max_page_size
+            EditConflict if the page kept changing for every attempt
+        """
+        with self._lock:
+            _run_steps(self._set_json_steps(reason, new_page))
+
+    def _set_json_steps(self, reason, new_page):
+        """The steps of set_json (see _run_steps)."""
+        attempt = 0
+
+        while True:
+            compressed_json = yield (self._run, self._encode_page)
+
+            try:
+                yield (self._write, compressed_json, reason, new_page)
+            except EditConflict:
+                self.metrics.increment('edit_conflicts')
+                attempt += 1
+
+                if attempt >= self.commit_attempts:
+                    raise
+
+                yield (self._sleep, self.commit_backoff * 2 ** (attempt - 1))
+                yield self._rebase_steps()
+            else:
+                break
+
+        self._unsaved_changes = False
+        self._oplog = []
+        yield (self._run, self._store_cached)
+
+    def _encode_page(self):
+        """Encode the cached JSON into the contents of the wiki page.
+
+        Returns a String
+
+        Raises:
+            OverflowError if the page is greater than max_page_size
         """
-        compressed_json = json.dumps(self._compress_json(self.cached_json))
+        estimate = self.estimated_page_size(calibrate=False)
+
+        if estimate > self.max_page_size * (1 + self.size_estimate_margin):
+            raise OverflowError(
+                'Usernotes page is too large (>{0} characters, estimated '
+                '{1})'.format(self.max_page_size, estimate)
+            )
+
+        compressed_page = self._compress_json(self.cached_json)
+
+        with self.metrics.timer('serialize_page') as timer:
+            compressed_json = json.dumps(compressed_page)
+            timer.size = len(compressed_json)
 
         if len(compressed_json) > self.max_page_size:
             raise OverflowError(
@@ -239,189 +531,1622 @@ class UserNotes(object):
                 format(self.max_page_size)
             )
 
-        if new_page:
-            self.subreddit.wiki.create(
-                self.page_name,
-                compressed_json,
-                reason
-            )
-            # Set the page as hidden and available to moderators only
-            self.subreddit.wiki[self.page_name].mod.update(False, permlevel=2)
-        else:
-            self.subreddit.wiki[self.page_name].edit(
-                compressed_json,
-                reason
-            )
+        return compressed_json
 
-    @update_cache
-    def get_notes(self, user):
-        """Return a list of Note objects for the given user.
+    def estimated_page_size(self, calibrate=True):
+        """Estimate the length of the wiki page if set_json were called now.
 
-        Return an empty list if no notes are found.
+        The serialized size of the notes is tracked exactly as notes are added
+        and removed, and is scaled by the compression ratio of the last upload.
+        This makes the estimate cheap enough to call after every change.
+
+        A ratio is only trusted if it was measured on notes of a similar size
+        (within a factor of two), as compression ratios vary with the amount
+        of data.
 
         Arguments:
-            user: the user to search for in the usernotes (str)
+            calibrate: whether to compress the notes once if no ratio can be
+                trusted. Otherwise the ratio of the downloaded page is used,
+                or 0 returned if there is none either (bool)
+
+        Returns an int number of characters
         """
-        # Try to search for all notes on a user, return an empty list if none
-        # are found.
-        try:
-            users_notes = []
-
-            for note in self.cached_json['users'][user]['ns']:
-                users_notes.append(Note(
-                    user=user,
-                    note=note['n'],
-                    subreddit=self.subreddit,
-                    mod=self._mod_from_index(note['m']),
-                    link=note['l'],
-                    warning=self._warning_from_index(note['w']),
-                    note_time=note['t']
-                ))
-
-            return users_notes
-        except KeyError:
-            # User not found
-            return []
+        with self._lock:
+            size = self._index('size').size()
+            ratio = self._trusted_ratio(self.compression.last_ratio,
+                                        self.compression.last_input_size, size)
+
+            if ratio is None and calibrate:
+                self._compress_json(self.cached_json)
+                ratio = self.compression.last_ratio
+            elif ratio is None:
+                ratio = self._trusted_ratio(
+                    self._blob_ratio, self._blob_ratio_size, size
+                )
 
-    @update_cache
-    def get_users(self):
-        """Return a list of all users with notes."""
-        return list(self.cached_json['users'].keys())
+                if ratio is None:
+                    return 0
 
-    def _mod_from_index(self, index):
-        """Return a moderator's name given an index.
+            page = copy.copy(self.cached_json)
+            page.pop('users', None)
+            page['blob'] = ''
+
+            # base64 turns every 3 bytes into 4 characters
+            return (len(json.dumps(page)) +
+                    int(math.ceil(size * ratio / 3.0)) * 4)
+
+    @staticmethod
+    def _trusted_ratio(ratio, measured_size, size):
+        """Return a compression ratio if it applies to a size, else None.
 
         Arguments:
-           index: the index in the constants array for moderators (int)
+            ratio: the compression ratio (float)
+            measured_size: the uncompressed size the ratio was measured on
+                (int)
+            size: the uncompressed size to apply the ratio to (int)
         """
-        return self.cached_json['constants']['users'][index]
+        if ratio is None or not measured_size / 2 <= size <= measured_size * 2:
+            return None
 
-    def _warning_from_index(self, index):
-        """Return a warning given an index.
+        return ratio
+
+    def _write(self, compressed_json, reason, new_page):
+        """Upload compressed usernotes to the wiki page.
 
         Arguments:
-           index: the index in the constants array for warning (int)
+            compressed_json: the page contents (str)
+            reason: the change reason for the wiki changelog (str)
+            new_page: whether the page has to be created (bool)
+
+        Raises:
+            EditConflict if the page was edited after revision_id
         """
-        return self.cached_json['constants']['warnings'][index]
+        self.revision_id = self._upload(
+            self.page_name, compressed_json, reason, new_page, self.revision_id
+        )
 
-    def _expand_json(self, j):
-        """Decompress the BLOB portion of the usernotes.
+    def _upload(self, page, content, reason, new_page, previous):
+        """Create or edit a wiki page.
 
         Arguments:
-            j: the JSON returned from the wiki page (dict)
+            page: the wiki page name (str)
+            content: the page contents (str)
+            reason: the change reason for the wiki changelog (str)
+            new_page: whether the page has to be created (bool)
+            previous: the revision the edit is based on, if known (str)
 
-        Returns a Dict with the 'blob' key removed and a 'users' key added
+        Returns the ID of the new revision, or None if it is not known
+
+        Raises:
+            EditConflict if the page was edited after previous
         """
-        decompressed_json = copy.copy(j)
-        decompressed_json.pop('blob', None)  # Remove BLOB portion of JSON
+        self._count_request('wiki_writes')
 
-        # Decode and decompress JSON
-        compressed_data = base64.b64decode(j['blob'])
-        original_json = zlib.decompress(compressed_data).decode('utf-8')
+        with self.metrics.timer('upload') as timer:
+            timer.size = len(content)
+
+            if new_page:
+                return self.backend.create(page, content, reason)
+            else:
+                return self.backend.write(
+                    page, content, reason, previous=previous
+                )
 
-        decompressed_json['users'] = json.loads(original_json)  # Insert users
+    def _rebase_steps(self):
+        """Replay the unsaved changes onto the latest revision of the page.
 
-        return decompressed_json
+        See _run_steps.
+        """
+        oplog = self._oplog
+        yield (self._download,)
 
-    def _compress_json(self, j):
-        """Compress the BLOB data portion of the usernotes.
+        for op in oplog:
+            self._apply(op)
+
+        self._oplog = oplog
+        self._unsaved_changes = True
+
+    def _run(self, func, *args):
+        """Run a blocking function for the steps of a method.
+
+        AsyncUserNotes runs it on its executor instead.
+        """
+        return func(*args)
+
+    def _sleep(self, seconds):
+        """Wait between the attempts of set_json."""
+        time.sleep(seconds)
+
+    @contextmanager
+    def batch(self, reason=None):
+        """Group several changes into a single wiki revision.
+
+        The usernotes are downloaded once when the batch opens. Every
+        @update_cache method called inside the block works on the cached copy
+        without further requests, and the result is uploaded with one
+        set_json call when the block exits. If the block (or the final upload)
+        raises, the cache is rolled back to its state when the batch opened.
+        Nested batches are folded into the outermost one, and other threads
+        wait for the batch to close before changing the usernotes.
 
         Arguments:
-            j: the JSON in Schema v5 format (dict)
+            reason: the change reason for the wiki changelog. Defaults to a
+                summary of the update messages of the batched changes (str)
 
-        Returns a dict with the 'users' key removed and 'blob' key added
+        Usage:
+            with un.batch():
+                un.add_note(note_a)
+                un.add_note(note_b)
         """
-        compressed_json = copy.copy(j)
-        compressed_json.pop('users', None)
+        with self._lock:
+            if self._batch is not None:
+                yield self
+                return
 
-        compressed_data = zlib.compress(
-            json.dumps(j['users']).encode('utf-8'),
-            self.zlib_compression_strength
-        )
-        b64_data = base64.b64encode(compressed_data).decode('utf-8')
+            self.get_json()
+            undo = self._open_batch()
 
-        compressed_json['blob'] = b64_data
+            try:
+                yield self
 
-        return compressed_json
+                reason = self._close_batch(reason)
 
-    @update_cache
-    def add_note(self, note):
-        """Add a note to the usernotes wiki page.
+                if reason:
+                    self.set_json(reason)
+            except Exception:
+                self._undo_batch(undo)
+                raise
+            finally:
+                self._batch = None
+
+    def _open_batch(self):
+        """Start collecting the update messages of a batch.
+
+        Returns what _undo_batch needs to roll the cache back (tuple)
+        """
+        undo = (self.snapshot(), self._unsaved_changes, list(self._oplog))
+        self._batch = []
+        return undo
+
+    def _close_batch(self, reason):
+        """Stop collecting the update messages of a batch.
 
         Arguments:
-            note: the note to be added (Note)
+            reason: the change reason given to batch (str)
 
-        Returns the update message for the usernotes wiki
+        Returns the change reason to upload the batch with, or None if
+        nothing changed
+        """
+        changes = self._batch
+        self._batch = None
 
-        Raises:
-            ValueError when the warning type of the note can not be found in the
-                stored list of warnings.
+        if not changes:
+            return None
+
+        return reason or self._batch_reason(changes)
+
+    def _undo_batch(self, undo):
+        """Roll the cache back to the state returned by _open_batch."""
+        snapshot, self._unsaved_changes, self._oplog = undo
+        self._restore(snapshot)
+
+    def snapshot(self):
+        """Return an immutable view of the cached usernotes.
+
+        The view is not affected by later changes, and can be read from any
+        number of threads without locking. Taking a snapshot is cheap: the
+        notes are shared until the UserNotes changes them, and only the
+        entries of the users that change are copied then.
+
+        Returns a Snapshot
+
+        Usage:
+            snapshot = un.snapshot()
+            notes = snapshot.get_notes('username')
         """
-        notes = self.cached_json
+        with self._lock:
+            page = copy.copy(self.cached_json)
+            constants = page.get('constants', {})
+            page['constants'] = dict(
+                (k, list(v)) for k, v in constants.items()
+            )
+            self._frozen_users = page.get('users')
 
-        if not note.moderator:
-            note.moderator = self.r.user.me().name
+            return Snapshot(self, page, self.revision_id)
 
-        # Get index of moderator in mod list from usernotes
-        # Add moderator to list if not already there
-        try:
-            mod_index = notes['constants']['users'].index(note.moderator)
-        except ValueError:
-            notes['constants']['users'].append(note.moderator)
-            mod_index = notes['constants']['users'].index(note.moderator)
+    def watch(self, interval=30, max_interval=300, backoff=2, stop=None):
+        """Follow the changes made to the usernotes page.
 
-        # Get index of warning type from warnings list
-        # Add warning type to list if not already there
-        try:
-            warn_index = notes['constants']['warnings'].index(note.warning)
-        except ValueError:
-            if note.warning in Note.warnings:
-                notes['constants']['warnings'].append(note.warning)
-                warn_index = notes['constants']['warnings'].index(note.warning)
-            else:
-                raise ValueError('Warning type not valid: ' + note.warning)
+        The page is polled through its revision list, and only downloaded
+        when a new revision appears. Polls slow down while nothing changes.
+        See Watcher for the arguments.
 
-        new_note = {
-            'n': note.note,
-            't': note.time,
-            'm': mod_index,
-            'l': note.link,
-            'w': warn_index
-        }
+        Returns a Watcher, which yields NoteAdded, NoteRemoved and UserRemoved
+        events when iterated over
 
-        try:
-            notes['users'][note.username]['ns'].insert(0, new_note)
-        except KeyError:
-            notes['users'][note.username] = {'ns': [new_note]}
+        Usage:
+            for event in un.watch(interval=10):
+                if isinstance(event, NoteAdded):
+                    print(event.username, event.note.warning)
+        """
+        return Watcher(self, interval, max_interval, backoff, stop)
 
-        return '"create new note on user {}" via puni'.format(note.username)
+    def history(self, workers=8, max_cached=32):
+        """Read past revisions of the usernotes page.
 
-    @update_cache
-    def remove_note(self, username, index):
-        """Remove a single usernote from the usernotes.
+        See History for the arguments.
+
+        Returns a History
+
+        Usage:
+            history = un.history()
+            notes = history.get_notes('username', at=time.time() - 86400)
+            removed_by = history.provenance(note)['removed']['author']
+        """
+        return History(self, workers, max_cached)
+
+    def _restore(self, snapshot):
+        """Replace the cached JSON with a snapshot taken from this object.
 
         Arguments:
-            username: the user that for whom you're removing a note (str)
-            index: the index of the note which is to be removed (int)
+            snapshot: the snapshot to go back to (Snapshot)
+        """
+        page = copy.copy(snapshot._page)
+        page['constants'] = dict(
+            (k, list(v)) for k, v in page['constants'].items()
+        )
+        self.cached_json = page
+        self.revision_id = snapshot.revision_id
+        self._frozen_users = page['users']
+        self._indexes = {}
 
-        Returns the update message for the usernotes wiki
+    def _batch_reason(self, changes):
+        """Combine the update messages of a batch into one change reason.
+
+        Arguments:
+            changes: the update messages returned by the batched methods (list)
+
+        Returns a String no longer than max_reason_length
         """
-        self.cached_json['users'][username]['ns'].pop(index)
+        if len(changes) == 1:
+            return changes[0]
 
-        # Go ahead and remove the user's entry if they have no more notes left
-        if len(self.cached_json['users'][username]['ns']) == 0:
-            del self.cached_json['users'][username]
+        suffix = '" via puni'
+        summaries = [re.sub(r'^"(.*)" via puni$', r'\1', x) for x in changes]
+        reason = '"{} changes: {}'.format(len(changes), '; '.join(summaries))
+        max_length = self.max_reason_length - len(suffix)
 
-        return '"delete note #{} on user {}" via puni'.format(index, username)
+        if len(reason) > max_length:
+            reason = reason[:max_length - 3] + '...'
+
+        return reason + suffix
 
     @update_cache
-    def remove_user(self, username):
-        """Remove all of a user's notes.
+    def get_notes(self, user, include_archive=False):
+        """Return a list of Note objects for the given user.
 
-        Arguments:
-            username: the user to have its notes removed (str)
+        Return an empty list if no notes are found.
 
-        Returns the update message for the usernotes wiki
+        Arguments:
+            user: the user to search for in the usernotes (str)
+            include_archive: whether to add the user's archived notes after
+                the others. Only the archive shards holding the user's notes
+                are downloaded, and they are cached (bool)
         """
-        del self.cached_json['users'][username]
-        return '"delete user {} from usernotes" via puni'.format(username)
+        # Try to search for all notes on a user, return an empty list if none
+        # are found.
+        try:
+            notes = [self._make_note(user, x)
+                     for x in self.cached_json['users'][user]['ns']]
+        except KeyError:
+            # User not found
+            notes = []
+
+        if include_archive:
+            notes.extend(_run_steps(self._archived_notes_steps(user, notes)))
+
+        return notes
+
+    @update_cache
+    def query(self, mod=None, warning=None, start=None, end=None, link=None):
+        """Return the notes matching every given criteria.
+
+        Lookups are served from indexes that are built on the first query and
+        kept up to date as notes are added and removed.
+
+        Arguments:
+            mod: the username of the moderator that created the note (str)
+            warning: the type of warning (str)
+            start: the earliest UNIX epoch timestamp to include (int)
+            end: the UNIX epoch timestamp to stop before (int)
+            link: a full reddit URL or usernote's shorthand format. Submission
+                links also match notes on the submission's comments (str)
+
+        Returns a list of Note objects, newest first.
+
+        Usage:
+            month_ago = int(time.time()) - 30 * 24 * 60 * 60
+            un.query(mod='moderator', warning='permban', start=month_ago)
+        """
+        entries = self._query_entries(
+            self._index('notes'), self._constant_index, mod, warning, start,
+            end, link
+        )
+
+        return [self._make_note(username, x) for username, x in entries]
+
+    @update_cache
+    def search(self, text, match='phrase', limit=None):
+        """Return the notes whose text matches a search, newest first.
+
+        Searches are served from an inverted index of the note texts, which
+        is built on the first search and kept up to date as notes are added
+        and removed. Case is ignored.
+
+        Arguments:
+            text: the words to search for, such as 'ban evasion' or a domain
+                (str)
+            match: 'phrase' for notes containing the text as written, 'all'
+                for notes containing all of its words in any order, or 'any'
+                for notes containing any of them (str)
+            limit: the maximum number of notes to return (int)
+
+        Returns a list of Note objects
+
+        Raises:
+            ValueError if match is not supported
+
+        Usage:
+            for note in un.search('ban evasion', limit=20):
+                print(note.username, note.note)
+        """
+        entries = self._index('text').search(text, match)
+
+        if limit is not None:
+            entries = entries[:limit]
+
+        return [self._make_note(username, x) for username, x in entries]
+
+    @update_cache
+    def summaries(self, usernames):
+        """Summarize the notes of many users at once.
+
+        Summaries are kept per user, built on the first call and updated as
+        notes are added and removed, so no notes are read to answer this.
+
+        Arguments:
+            usernames: the users to summarize (iterable of str)
+
+        Returns a dict of username -> dict with the 'count' of notes, the
+        time of the 'latest' note, the most severe 'warning' (see
+        warning_severity) and the sorted names of the 'moderators' who left
+        notes. Users without notes are left out
+
+        Usage:
+            for username, summary in un.summaries(authors).items():
+                print(username, summary['count'], summary['warning'])
+        """
+        index = self._index('summary')
+        constants = self.cached_json['constants']
+        ranks = dict((x, i) for i, x in enumerate(self.warning_severity))
+        summaries = {}
+
+        for username in usernames:
+            summary = index.summary(username, constants, ranks)
+
+            if summary is not None:
+                summaries[username] = summary
+
+        return summaries
+
+    @staticmethod
+    def _query_entries(index, constant_index, mod, warning, start, end,
+                       link):
+        """Look the criteria of query up in a NoteIndex.
+
+        Arguments:
+            index: the index of the notes (NoteIndex)
+            constant_index: looks up the constants the notes refer to, like
+                UserNotes._constant_index (function)
+            mod, warning, start, end, link: see query
+
+        Returns a list of (username, note) tuples, newest first
+        """
+        mod_index = None if mod is None else constant_index('users', mod)
+        warn_index = (None if warning is None else
+                      constant_index('warnings', warning))
+
+        if (mod is not None and mod_index is None) or \
+                (warning is not None and warn_index is None):
+            # Nobody has used this moderator or warning type
+            return []
+
+        if link is not None and '://' in link:
+            link = links.compress_url(link)
+
+        return index.query(
+            mod=mod_index, warning=warn_index, link=link, start=start, end=end
+        )
+
+    def _index(self, name):
+        """Return an index over the cached JSON, building it if needed.
+
+        Indexes are kept up to date by _apply and are dropped whenever the
+        cached JSON is replaced.
+
+        Arguments:
+            name: the name of the index in index_types (str)
+        """
+        if self._indexed_users is not self.cached_json['users']:
+            # The users map was replaced without going through _set_cache
+            self._indexes = {}
+            self._indexed_users = self.cached_json['users']
+
+        if name not in self._indexes:
+            self._indexes[name] = self.index_types[name](
+                self.cached_json['users']
+            )
+
+        return self._indexes[name]
+
+    def peek_notes(self, user):
+        """Return a list of Note objects for the given user from the wiki page.
+
+        Unlike get_notes, the page is decoded only up to the user's entry and
+        the rest of the page is never expanded in memory. The cached JSON is
+        used instead if it is current, and is left untouched otherwise.
+
+        Return an empty list if no notes are found.
+
+        Arguments:
+            user: the user to search for in the usernotes (str)
+        """
+        with self._lock:
+            if self.cached_json and self.is_current():
+                return self.get_notes(user, lazy=True)
+
+        notes, _ = self._fetch_page()
+        entry = stream.find_user(notes['blob'], user)
+
+        if entry is None:
+            return []
+
+        return [self._make_note(user, x, notes['constants'])
+                for x in entry['ns']]
+
+    def _make_note(self, username, note, constants=None):
+        """Create a Note object from a note stored in the cached JSON.
+
+        Arguments:
+            username: the user the note is attached to (str)
+            note: the note as stored in the usernotes JSON (dict)
+            constants: the constants to resolve the note's indices with.
+                Defaults to the cached JSON's constants (dict)
+        """
+        if constants is None:
+            constants = self.cached_json['constants']
+
+        return Note(
+            user=username,
+            note=note['n'],
+            subreddit=self.subreddit,
+            mod=constants['users'][note['m']],
+            link=note['l'],
+            warning=constants['warnings'][note['w']],
+            note_time=note['t']
+        )
+
+    @update_cache
+    def get_users(self):
+        """Return a list of all users with notes."""
+        return list(self.cached_json['users'].keys())
+
+    def _mod_from_index(self, index):
+        """Return a moderator's name given an index.
+
+        Arguments:
+           index: the index in the constants array for moderators (int)
+        """
+        return self.cached_json['constants']['users'][index]
+
+    def _warning_from_index(self, index):
+        """Return a warning given an index.
+
+        Arguments:
+           index: the index in the constants array for warning (int)
+        """
+        return self.cached_json['constants']['warnings'][index]
+
+    def _expand_json(self, j):
+        """Decompress the BLOB portion of the usernotes.
+
+        Arguments:
+            j: the JSON returned from the wiki page (dict)
+
+        Returns a Dict with the 'blob' key removed and a 'users' key added
+        """
+        decompressed_json = copy.copy(j)
+        decompressed_json.pop('blob', None)  # Remove BLOB portion of JSON
+        hook = compact.CompactHook() if self.compact_notes else None
+
+        if self.streaming_decode:
+            with self.metrics.timer('inflate'):
+                decompressed_json['users'] = stream.expand_users(
+                    j['blob'], object_hook=hook
+                )
+            return decompressed_json
+
+        # Decode and decompress JSON
+        with self.metrics.timer('decode') as timer:
+            compressed_data = base64.b64decode(j['blob'])
+            timer.size = len(compressed_data)
+
+        with self.metrics.timer('inflate') as timer:
+            original_json = zlib.decompress(compressed_data).decode('utf-8')
+            timer.size = len(original_json)
+
+        self._blob_ratio = (len(compressed_data) /
+                            float(max(len(original_json), 1)))
+        self._blob_ratio_size = len(original_json)
+
+        with self.metrics.timer('parse_users'):
+            decompressed_json['users'] = json.loads(
+                original_json, object_hook=hook
+            )
+
+        return decompressed_json
+
+    def _compress_json(self, j, compression=None):
+        """Compress the BLOB data portion of the usernotes.
+
+        Arguments:
+            j: the JSON in Schema v5 format (dict)
+            compression: the compression policy to use. Defaults to the
+                policy of the usernotes page (CompressionPolicy)
+
+        Returns a dict with the 'users' key removed and 'blob' key added
+        """
+        compression = compression if compression else self.compression
+        compressed_json = copy.copy(j)
+        compressed_json.pop('users', None)
+
+        # Compressed bytes that fit in the page next to the other keys
+        compressed_json['blob'] = ''
+        overhead = len(json.dumps(compressed_json))
+        budget = max(self.max_page_size - overhead, 0) * 3 // 4
+
+        with self.metrics.timer('serialize_users') as timer:
+            users_json = json.dumps(
+                j['users'], default=compact.json_default
+            ).encode('utf-8')
+            timer.size = len(users_json)
+
+        with self.metrics.timer('compress') as timer:
+            compressed_data = compression.compress(users_json, budget)
+            timer.size = len(compressed_data)
+
+        self.metrics.increment(
+            'compress_level_{}'.format(compression.last_level)
+        )
+
+        with self.metrics.timer('encode') as timer:
+            b64_data = base64.b64encode(compressed_data).decode('utf-8')
+            timer.size = len(b64_data)
+
+        compressed_json['blob'] = b64_data
+
+        return compressed_json
+
+    @update_cache(write=True)
+    def add_note(self, note):
+        """Add a note to the usernotes wiki page.
+
+        Arguments:
+            note: the note to be added (Note)
+
+        Returns the update message for the usernotes wiki
+
+        Raises:
+            ValueError when the warning type of the note can not be found in the
+                stored list of warnings.
+        """
+        if not note.moderator:
+            note.moderator = self.r.user.me().name
+
+        if (note.warning not in self.cached_json['constants']['warnings'] and
+                note.warning not in Note.warnings):
+            raise ValueError('Warning type not valid: ' + note.warning)
+
+        self._record(('add', note.username, [{
+            'n': note.note,
+            't': note.time,
+            'm': note.moderator,
+            'l': note.link,
+            'w': note.warning
+        }]))
+
+        return '"create new note on user {}" via puni'.format(note.username)
+
+    def export_notes(self, fp, format='jsonl'):
+        """Write every note to a file, one row per note.
+
+        Rows hold the username, time, moderator, warning type, note text,
+        shorthand link and full URL of a note. They are generated from a
+        snapshot while the file is written, so no Note objects are created and
+        other threads can keep changing the usernotes meanwhile.
+
+        Arguments:
+            fp: a file opened for writing text
+            format: 'jsonl' for one JSON object per line, or 'csv' (str)
+
+        Returns the number of notes written
+
+        Raises:
+            ValueError if the format is not supported
+        """
+        self.get_json()
+        return transfer.write_rows(
+            fp, self._export_rows(self.snapshot()), format
+        )
+
+    def _export_rows(self, snapshot):
+        """Yield the rows of export_notes.
+
+        Arguments:
+            snapshot: the usernotes to export (Snapshot)
+        """
+        constants = snapshot.constants
+        subreddit = self.backend.name
+        urls = {}  # Shorthand link -> URL, as links often repeat
+
+        for username, entry in snapshot.users.items():
+            for note in entry['ns']:
+                link = note['l']
+                url = urls.get(link)
+
+                if url is None and link:
+                    url = urls[link] = links.expand_url(link, subreddit)
+
+                yield {
+                    'username': username,
+                    'time': note['t'],
+                    'moderator': constants['users'][note['m']],
+                    'warning': constants['warnings'][note['w']],
+                    'note': note['n'],
+                    'link': link,
+                    'url': url
+                }
+
+    def import_notes(self, fp, format='jsonl', reason=None):
+        """Add the notes from a file in the format written by export_notes.
+
+        The file is read a row at a time and every note is added in a single
+        batch, so the page is downloaded and uploaded once. Notes the user
+        already has (with the same text, time, moderator, link and warning)
+        are skipped, as are repeated rows.
+
+        Rows without a moderator are attributed to the authenticated user,
+        and rows without a time to the current time. The link may be given as
+        a shorthand link or a full URL.
+
+        Arguments:
+            fp: a file opened for reading text
+            format: see export_notes (str)
+            reason: the change reason for the wiki changelog. Defaults to the
+                number of notes imported (str)
+
+        Returns the number of notes added
+
+        Raises:
+            ValueError if the format is not supported, a row is invalid or a
+                warning type is unknown
+        """
+        with self.batch(reason):
+            return self._import_rows(transfer.read_rows(fp, format),
+                                     lambda: self.r.user.me().name)
+
+    def _import_rows(self, rows, me):
+        """Add the notes of imported rows to the open batch.
+
+        Arguments:
+            rows: the rows returned by transfer.read_rows (iterable of dict)
+            me: returns the name of the authenticated user, for rows without
+                a moderator (function)
+
+        Returns the number of notes added (see import_notes)
+        """
+        known = {}  # username -> set of note tuples
+        warnings = None
+        name = None
+        added = 0
+
+        for row in rows:
+            username = row['username']
+            mod = row['moderator']
+
+            if not mod:
+                name = name if name else me()
+                mod = name
+
+            note = {
+                'n': row['note'],
+                't': row['time'] if row['time'] else int(time.time()),
+                'm': mod,
+                'l': links.normalize(row['link'] or row['url'] or ''),
+                'w': row['warning'] if row['warning'] else 'none'
+            }
+
+            if warnings is None:
+                warnings = set(Note.warnings)
+                warnings.update(self.cached_json['constants']['warnings'])
+
+            if note['w'] not in warnings:
+                raise ValueError('Warning type not valid: ' + note['w'])
+
+            if username not in known:
+                entry = self.cached_json['users'].get(username)
+                known[username] = set(
+                    self._note_key(self._resolve_note(x))
+                    for x in (entry['ns'] if entry else [])
+                )
+
+            key = self._note_key(note)
+
+            if key in known[username]:
+                continue
+
+            known[username].add(key)
+            self._record(('add', username, [note]))
+            added += 1
+
+        if added:
+            self._unsaved_changes = True
+            self._batch.append('"import {} notes" via puni'.format(added))
+
+        return added
+
+    @staticmethod
+    def _note_key(note):
+        """Return a hashable key of a note as returned by _resolve_note."""
+        return (note['n'], note['t'], note['m'], note['l'], note['w'])
+
+    @update_cache(write=True)
+    def remove_note(self, username, index):
+        """Remove a single usernote from the usernotes.
+
+        Arguments:
+            username: the user that for whom you're removing a note (str)
+            index: the index of the note which is to be removed (int)
+
+        Returns the update message for the usernotes wiki
+        """
+        note = self.cached_json['users'][username]['ns'][index]
+        self._record(('remove', username, [self._resolve_note(note)]))
+
+        return '"delete note #{} on user {}" via puni'.format(index, username)
+
+    @update_cache(write=True)
+    def remove_user(self, username):
+        """Remove all of a user's notes.
+
+        Arguments:
+            username: the user to have its notes removed (str)
+
+        Returns the update message for the usernotes wiki
+        """
+        notes = self.cached_json['users'][username]['ns']
+        self._record(
+            ('remove', username, [self._resolve_note(x) for x in notes])
+        )
+
+        return '"delete user {} from usernotes" via puni'.format(username)
+
+    @update_cache(write=True)
+    def compact_constants(self):
+        """Drop the moderators and warning types that no note refers to.
+
+        Former moderators stay in the constants forever otherwise, making the
+        page larger. The indices of every note are remapped in one pass.
+
+        Returns the update message for the usernotes wiki, or None if every
+        constant is in use
+        """
+        constants = self.cached_json['constants']
+        used = self._used_constants()
+        mods = len(constants['users']) - len(used['users'])
+        warnings = len(constants['warnings']) - len(used['warnings'])
+
+        if not mods and not warnings:
+            return None
+
+        self._record(('compact', None, []))
+
+        return ('"remove {} unused moderators and {} unused warnings" via '
+                'puni'.format(mods, warnings))
+
+    def _used_constants(self):
+        """Return the sets of constant indices the notes refer to.
+
+        Returns a dict with the 'users' and 'warnings' sets
+        """
+        mods = set()
+        warnings = set()
+
+        for entry in self.cached_json['users'].values():
+            for note in entry['ns']:
+                mods.add(note['m'])
+                warnings.add(note['w'])
+
+        return {'users': mods, 'warnings': warnings}
+
+    def _compact_constants(self):
+        """Drop unused constants and remap the notes (see compact_constants).
+
+        Only the entries of users whose notes change are copied; the others
+        are shared with the previous users map.
+        """
+        constants = self.cached_json['constants']
+        used = self._used_constants()
+        new_constants = dict(constants)
+        remap = {}
+
+        for key in ('users', 'warnings'):
+            remap[key] = {}
+            new_constants[key] = []
+
+            for i, value in enumerate(constants[key]):
+                if i in used[key]:
+                    remap[key][i] = len(new_constants[key])
+                    new_constants[key].append(value)
+
+        mods, warnings = remap['users'], remap['warnings']
+        users = {}
+        owned = set()
+
+        for username, entry in self.cached_json['users'].items():
+            if all(mods[x['m']] == x['m'] and warnings[x['w']] == x['w']
+                   for x in entry['ns']):
+                users[username] = entry
+                continue
+
+            new_entry = dict(entry)
+            new_entry['ns'] = [self._remap_note(x, mods, warnings)
+                               for x in entry['ns']]
+            users[username] = new_entry
+            owned.add(username)
+
+        self.cached_json['constants'] = new_constants
+        self.cached_json['users'] = users
+        self._cow_users = users
+        self._owned_users = owned
+        self._indexes = {}
+        self._indexed_users = users
+
+    @staticmethod
+    def _remap_note(note, mods, warnings):
+        """Return a copy of a stored note with new constant indices.
+
+        Arguments:
+            note: the note as stored in the usernotes JSON (dict)
+            mods: a map of old to new moderator indices (dict)
+            warnings: a map of old to new warning indices (dict)
+        """
+        if isinstance(note, compact.CompactNote):
+            return compact.CompactNote(note['n'], note['t'], mods[note['m']],
+                                       note['l'], warnings[note['w']])
+
+        new_note = dict(note)
+        new_note['m'] = mods[note['m']]
+        new_note['w'] = warnings[note['w']]
+        return new_note
+
+    @update_cache(write=True)
+    def prune(self, target_size=None, policies=None):
+        """Remove notes until the usernotes page fits in a size.
+
+        The notes to remove are chosen by plan_prune from the tracked size of
+        every note, so the page is only compressed once to verify the result
+        (and again in the rare case the estimate fell short).
+
+        Arguments:
+            target_size: the page size to fit in. Defaults to max_page_size
+                (int)
+            policies: the pruning policies to take notes from, in order.
+                Defaults to removing the oldest notes (list of PruningPolicy)
+
+        Returns the update message for the usernotes wiki, or None if nothing
+        had to be removed
+
+        Usage:
+            un.prune(policies=[UsersWithOnly('none'), WarningType('spamwatch'),
+                               OlderThan(365)])
+        """
+        removed = _run_steps(self._prune_steps(target_size, policies))
+        return self._prune_reason('prune', removed)
+
+    @update_cache(write=True)
+    def archive(self, target_size=None, policies=None):
+        """Move notes to the archive until the usernotes page fits in a size.
+
+        The notes are chosen like prune does, but are moved to the archive
+        shard pages instead of being deleted. They remain available through
+        get_notes(user, include_archive=True). The archive pages are written
+        before the usernotes page, so no note is lost if either edit fails.
+
+        Arguments:
+            target_size: the page size to fit in. Defaults to max_page_size
+                (int)
+            policies: the pruning policies to take notes from, in order.
+                Defaults to archiving the oldest notes (list of PruningPolicy)
+
+        Returns the update message for the usernotes wiki, or None if nothing
+        had to be archived
+
+        Raises:
+            EditConflict if the archive was changed by somebody else meanwhile
+            OverflowError if the notes of a single user do not fit on a shard
+
+        Usage:
+            un.archive(policies=[OlderThan(365)])
+            un.get_notes('spammer', include_archive=True)
+        """
+        removed = _run_steps(self._prune_steps(target_size, policies, True))
+        return self._prune_reason('archive', removed)
+
+    def prune_inactive_users(self, checker=None,
+                             statuses=(accounts.DELETED, accounts.SUSPENDED),
+                             reason=None):
+        """Remove the users whose reddit accounts were deleted or suspended.
+
+        The accounts are looked up by an AccountChecker, concurrently and
+        within reddit's rate limit, while other threads remain free to use the
+        usernotes. The users are then removed in a single wiki revision.
+
+        Arguments:
+            checker: looks up the accounts. Defaults to one sharing this
+                object's cache and metrics (AccountChecker)
+            statuses: the account statuses whose users are removed (tuple)
+            reason: the change reason for the wiki changelog (str)
+
+        Returns a dict of the removed usernames -> account status
+
+        Usage:
+            un.prune_inactive_users(checker=AccountChecker(r, workers=16))
+        """
+        if checker is None:
+            checker = accounts.AccountChecker(
+                self.r, cache=self.cache, metrics=self.metrics
+            )
+
+        found = checker.check(self.get_users())
+
+        with self.batch(reason=reason):
+            users = self.cached_json['users']
+            removed = dict((k, v) for k, v in found.items()
+                           if v in statuses and k in users)
+
+            if removed:
+                self._remove_users(sorted(removed))
+
+        return removed
+
+    @update_cache(write=True)
+    def _remove_users(self, usernames):
+        """Remove all of the notes of several users.
+
+        Arguments:
+            usernames: the users to remove (list of str)
+
+        Returns the update message for the usernotes wiki
+        """
+        for username in usernames:
+            notes = self.cached_json['users'][username]['ns']
+            self._record(
+                ('remove', username, [self._resolve_note(x) for x in notes])
+            )
+
+        return '"prune {} inactive users" via puni'.format(len(usernames))
+
+    def _prune_steps(self, target_size, policies, to_archive=False):
+        """Remove the notes selected by plan_prune until the page fits.
+
+        See _run_steps.
+
+        Arguments:
+            target_size: see prune (int)
+            policies: see prune (list of PruningPolicy)
+            to_archive: whether to copy the notes to the archive first (bool)
+
+        Returns a (notes, users) tuple of the number of notes removed and the
+        number of users they were removed from
+        """
+        target_size = target_size if target_size else self.max_page_size
+        removed_notes = 0
+        removed_from = set()
+
+        for _ in range(3):
+            plan = self.plan_prune(target_size, policies)
+
+            if not plan:
+                break
+
+            plan_users = self._group_plan(plan)
+
+            if to_archive:
+                yield self._write_archive_steps(plan_users)
+
+            for username, notes in plan_users.items():
+                self._record(('remove', username, notes))
+
+            removed_notes += len(plan)
+            removed_from.update(plan_users)
+            page = yield (
+                self._run,
+                lambda: json.dumps(self._compress_json(self.cached_json))
+            )
+
+            if len(page) <= target_size:
+                break
+
+        raise _Return((removed_notes, len(removed_from)))
+
+    @staticmethod
+    def _prune_reason(action, removed):
+        """Return the update message of prune or archive.
+
+        Arguments:
+            action: 'prune' or 'archive' (str)
+            removed: the tuple returned by _prune_steps
+
+        Returns a String, or None if no note was removed
+        """
+        removed_notes, removed_from = removed
+
+        if not removed_notes:
+            return None
+
+        return '"{} {} notes from {} users" via puni'.format(
+            action, removed_notes, removed_from
+        )
+    def _group_plan(self, plan):
+        """Group the notes selected by plan_prune by user.
+
+        Returns a dict of usernames -> lists of notes as returned by
+        _resolve_note
+        """
+        users = {}
+
+        for username, note in plan:
+            users.setdefault(username, []).append(self._resolve_note(note))
+
+        return users
+
+    def plan_prune(self, target_size=None, policies=None):
+        """Select the notes to remove for the page to fit in a size.
+
+        Candidates are taken from the policies in order, and their serialized
+        size is scaled by the last compression ratio until enough space is
+        freed. The usernotes are not changed.
+
+        Arguments:
+            target_size: the page size to fit in. Defaults to max_page_size
+                (int)
+            policies: the pruning policies to take notes from, in order.
+                Defaults to removing the oldest notes (list of PruningPolicy)
+
+        Returns a list of (username, note) tuples, with notes as stored in
+        cached_json. The list holds every candidate if they do not free
+        enough space.
+        """
+        with self._lock:
+            target_size = target_size if target_size else self.max_page_size
+            excess = (self.estimated_page_size() -
+                      target_size * (1 - self.prune_margin))
+
+            if excess <= 0:
+                return []
+
+            # Page characters per serialized character, after base64
+            scale = self.compression.last_ratio * 4 / 3.0
+            users = self.cached_json['users']
+            notes_left = {}
+            selected = []
+            seen = set()
+            saved = 0
+
+            for policy in policies if policies else [OldestFirst()]:
+                for username, note in policy.candidates(self):
+                    if id(note) in seen:
+                        continue
+
+                    seen.add(id(note))
+                    selected.append((username, note))
+                    left = notes_left.get(username,
+                                          len(users[username]['ns'])) - 1
+                    notes_left[username] = left
+                    saved += (len(json.dumps(
+                        note, default=compact.json_default
+                    )) + 2) * scale
+
+                    if left == 0:
+                        # The whole '"name": {"ns": []}, ' entry goes too
+                        saved += (len(json.dumps(username)) + 14) * scale
+
+                    if saved >= excess:
+                        return selected
+
+            return selected
+
+    def get_archive_manifest(self):
+        """Get the manifest of the archive shards.
+
+        The manifest is downloaded again only if its page was edited since.
+
+        Returns a dict with a 'shards' list, holding a dict for every shard
+        with its 'page', 'revision', the number of 'users' and 'notes', and
+        the 'start' and 'end' times of its notes; and a 'users' map of
+        usernames to the numbers of the shards holding their notes
+        """
+        return _run_steps(self._archive_manifest_steps())
+
+    def _archive_manifest_steps(self):
+        """The steps of get_archive_manifest (see _run_steps)."""
+        latest = yield (self._latest_revision, self.archive_page_name)
+
+        if latest is None:
+            self._manifest = archive.empty_manifest(self.schema)
+            self._manifest_revision = None
+        elif latest != self._manifest_revision or self._manifest is None:
+            notes, revision = yield (self._read_page, self.archive_page_name)
+            self._manifest = yield (self._run, self._decode_page, notes)
+            self._manifest_revision = revision
+
+        raise _Return(self._manifest)
+
+    def _archived_notes_steps(self, user, current=()):
+        """Return a user's notes from the archive, newest first.
+
+        See _run_steps.
+
+        Arguments:
+            user: the user to search for in the archive (str)
+            current: notes to leave out, such as the user's notes on the
+                usernotes page (list of Note objects)
+        """
+        manifest = yield self._archive_manifest_steps()
+        shards = []
+
+        for number in manifest['users'].get(user, []):
+            shard = manifest['shards'][number - 1]
+            shards.append((yield self._load_shard_steps(shard)))
+
+        raise _Return(self._merge_archived(user, shards, current))
+
+    def _merge_archived(self, user, shards, current=()):
+        """Collect a user's notes from the decoded archive shards.
+
+        Arguments:
+            user: the user whose notes are collected (str)
+            shards: the decoded shards holding the user's notes (list)
+            current: see _archived_notes_steps (list of Note objects)
+
+        Returns a list of Note objects, newest first
+        """
+        seen = set((x.note, x.time, x.moderator, x.link, x.warning)
+                   for x in current)
+        notes = []
+
+        for page in shards:
+            entry = page['users'].get(user, {'ns': []})
+
+            for x in entry['ns']:
+                note = self._make_note(user, x, page['constants'])
+                key = (note.note, note.time, note.moderator, note.link,
+                       note.warning)
+
+                # Notes archived by an edit that never reached the usernotes
+                # page are on both
+                if key not in seen:
+                    seen.add(key)
+                    notes.append(note)
+
+        notes.sort(key=lambda x: x.time, reverse=True)
+        return notes
+
+    def _load_shard_steps(self, shard):
+        """Return the decoded contents of an archive shard.
+
+        Shards are kept in memory, and in the persistent cache if there is
+        one, for as long as the manifest lists the same revision. See
+        _run_steps.
+
+        Arguments:
+            shard: the shard's entry in the manifest (dict)
+        """
+        page, revision = shard['page'], shard['revision']
+        cached = self._shards.get(page)
+
+        if revision is not None:
+            if cached is not None and cached[0] == revision:
+                raise _Return(cached[1])
+
+            if self.cache is not None:
+                notes = yield (
+                    self._run, self.cache.get, self.backend.name, page,
+                    revision
+                )
+
+                if notes is not None:
+                    self._shards[page] = (revision, notes)
+                    raise _Return(notes)
+
+        notes, revision = yield (self._read_page, page)
+        notes = yield (self._run, self._decode_page, notes)
+        self._shards[page] = (revision, notes)
+
+        if self.cache is not None and revision is not None:
+            yield (self._run, self.cache.set, self.backend.name, page,
+                   revision, notes)
+
+        raise _Return(notes)
+
+    def _write_archive_steps(self, users):
+        """Add notes to the archive shards and update the manifest.
+
+        The last shard is filled up before new shards are created. See
+        _run_steps.
+
+        Arguments:
+            users: a map of usernames to lists of notes as returned by
+                _resolve_note (dict)
+
+        Raises:
+            EditConflict if the archive was changed by somebody else meanwhile
+            OverflowError if the notes of a single user do not fit on a shard
+        """
+        manifest = copy.deepcopy((yield self._archive_manifest_steps()))
+        shards = manifest['shards']
+        last = None
+
+        if shards:
+            last = yield self._load_shard_steps(shards[-1])
+
+        number, pages = yield (
+            self._run, self._plan_archive, manifest, last, users
+        )
+        reason = '"archive notes" via puni'
+
+        for page, content in pages:
+            name = archive.shard_page(self.archive_page_name, number)
+            new_page = number > len(shards)
+            revision = yield (
+                self._upload, name, content, reason, new_page,
+                None if new_page else shards[number - 1]['revision']
+            )
+            self._add_shard(manifest, number, name, page, revision)
+
+            if self.cache is not None and revision is not None:
+                yield (self._run, self.cache.set, self.backend.name, name,
+                       revision, page)
+
+            number += 1
+
+        content = yield (self._run, self._encode_manifest, manifest)
+        self._manifest_revision = yield (
+            self._upload, self.archive_page_name, content, reason,
+            self._manifest_revision is None, self._manifest_revision
+        )
+        self._manifest = manifest
+
+    def _plan_archive(self, manifest, last, users):
+        """Split the notes to archive into shard pages.
+
+        The users of the last shard are taken off the manifest, as the shard
+        is packed again along with the new notes, possibly spilling users
+        over to new shards.
+
+        Arguments:
+            manifest: a copy of the archive manifest to update (dict)
+            last: the decoded last shard, if there is one (dict)
+            users: see _write_archive_steps (dict)
+
+        Returns a (number, pages) tuple of the number of the first shard to
+        write (int) and the pages returned by _pack_archive (list)
+        """
+        pending = dict((k, list(v)) for k, v in users.items())
+        number = max(len(manifest['shards']), 1)
+
+        if last is not None:
+            for username, notes in archive.resolve_users(last).items():
+                pending.setdefault(username, []).extend(notes)
+
+            for username in list(manifest['users']):
+                numbers = manifest['users'][username]
+
+                if number in numbers:
+                    numbers.remove(number)
+
+                if not numbers:
+                    del manifest['users'][username]
+
+        return number, self._pack_archive(sorted(pending.items()))
+
+    def _add_shard(self, manifest, number, name, page, revision):
+        """Record a written shard in the manifest and the shard cache.
+
+        Arguments:
+            manifest: the archive manifest being updated (dict)
+            number: the shard's number, starting at 1 (int)
+            name: the shard's wiki page name (str)
+            page: the decoded shard (dict)
+            revision: the ID of the shard's new revision (str)
+        """
+        times = [x['t'] for user in page['users'].values()
+                 for x in user['ns']]
+        manifest['shards'][number - 1:number] = [{
+            'page': name,
+            'revision': revision,
+            'users': len(page['users']),
+            'notes': len(times),
+            'start': min(times),
+            'end': max(times)
+        }]
+
+        for username in page['users']:
+            manifest['users'].setdefault(username, []).append(number)
+
+        self._shards[name] = (revision, page)
+
+    def _encode_manifest(self, manifest):
+        """Return the page contents of the archive manifest.
+
+        Raises:
+            OverflowError if the manifest does not fit on a page
+        """
+        content = json.dumps(
+            self._compress_json(manifest, self.archive_compression)
+        )
+
+        if len(content) > self.max_page_size:
+            raise OverflowError(
+                'Archive manifest is too large (>{0} characters)'.
+                format(self.max_page_size)
+            )
+
+        return content
+
+    def _pack_archive(self, users):
+        """Split archived notes into pages that fit in max_page_size.
+
+        Arguments:
+            users: (username, notes) tuples, with notes as returned by
+                _resolve_note (list)
+
+        Returns a list of (page, content) tuples of the decoded page (dict)
+        and the page contents to upload (str)
+
+        Raises:
+            OverflowError if the notes of a single user do not fit on a page
+        """
+        page = archive.build_page(self.schema, dict(users))
+        content = json.dumps(
+            self._compress_json(page, self.archive_compression)
+        )
+
+        if len(content) <= self.max_page_size:
+            return [(page, content)]
+        elif len(users) == 1:
+            raise OverflowError(
+                'Archived notes of user {0} are too large (>{1} characters)'.
+                format(users[0][0], self.max_page_size)
+            )
+
+        half = len(users) // 2
+        return self._pack_archive(users[:half]) + \
+            self._pack_archive(users[half:])
+
+    def _decode_page(self, notes):
+        """Decode the BLOB of an archive page.
+
+        Unlike _expand_json, the page is not taken as the usernotes page.
+
+        Arguments:
+            notes: the JSON returned from the wiki page (dict)
+
+        Returns a Dict with the 'blob' key replaced by a 'users' key
+        """
+        decoded = copy.copy(notes)
+
+        with self.metrics.timer('inflate'):
+            decoded['users'] = stream.expand_users(decoded.pop('blob'))
+
+        return decoded
+
+    def _record(self, op):
+        """Apply a change to the cache and add it to the operation log.
+
+        The log is replayed onto a fresh copy of the usernotes if set_json
+        runs into an edit conflict.
+
+        Arguments:
+            op: a (kind, username, notes) tuple, where kind is 'add',
+                'remove' or 'compact' (see compact_constants) and notes is a
+                list of notes as returned by _resolve_note (tuple)
+        """
+        self._apply(op)
+        self._oplog.append(op)
+
+    def _apply(self, op):
+        """Apply a change from the operation log to the cache.
+
+        Notes are matched by content rather than position, so a change can be
+        applied to a revision that other moderators have edited since. Notes
+        that can no longer be found are skipped.
+
+        Data shared with snapshots is copied before it is changed.
+
+        Arguments:
+            op: a (kind, username, notes) tuple (see _record) (tuple)
+        """
+        kind, username, notes = op
+
+        if kind == 'compact':
+            self._compact_constants()
+            return
+
+        users = self._writable_users()
+
+        if kind == 'add':
+            for note in notes:
+                new_note = self._unresolve_note(note)
+
+                if self.compact_notes:
+                    new_note = compact.compact_note(new_note)
+
+                if username in users:
+                    user_notes = self._writable_notes(users, username)
+                    i = 0
+
+                    # Notes are stored newest first
+                    while i < len(user_notes) and \
+                            user_notes[i]['t'] > new_note['t']:
+                        i += 1
+
+                    user_notes.insert(i, new_note)
+                else:
+                    users[username] = {'ns': [new_note]}
+                    self._owned_users.add(username)
+
+                for index in self._indexes.values():
+                    index.add(username, new_note)
+        elif username in users:
+            user_notes = self._writable_notes(users, username)
+
+            for note in notes:
+                for i, stored_note in enumerate(user_notes):
+                    if self._resolve_note(stored_note) == note:
+                        user_notes.pop(i)
+
+                        for index in self._indexes.values():
+                            index.remove(username, stored_note)
+                        break
+
+            # Go ahead and remove the user's entry if they have no more notes
+            if len(user_notes) == 0:
+                del users[username]
+
+    def _writable_users(self):
+        """Return the cached users map, copying it if snapshots share it."""
+        users = self.cached_json['users']
+
+        if users is self._frozen_users:
+            # Only the map is copied; the user entries are copied as needed
+            frozen, users = users, dict(users)
+            self.cached_json['users'] = users
+            self._frozen_users = None
+            self._cow_users = users
+            self._owned_users = set()
+
+            if self._indexed_users is frozen:
+                for index in self._indexes.values():
+                    index.rebind(users)
+
+                self._indexed_users = users
+            else:
+                # The indexes describe a users map that was replaced since
+                self._indexes = {}
+                self._indexed_users = None
+
+        return users
+
+    def _writable_notes(self, users, username):
+        """Return a user's list of notes, copying it if snapshots share it.
+
+        Arguments:
+            users: the map returned by _writable_users (dict)
+            username: the user whose notes will be changed (str)
+        """
+        if users is self._cow_users and username not in self._owned_users:
+            entry = dict(users[username])
+            entry['ns'] = list(entry['ns'])
+            users[username] = entry
+            self._owned_users.add(username)
+
+        return users[username]['ns']
+
+    def _resolve_note(self, note):
+        """Replace the constant indices of a stored note with their values.
+
+        Arguments:
+            note: a note as stored in cached_json (dict)
+
+        Returns a dict with the moderator name and warning type in place of
+        their indices
+        """
+        return {
+            'n': note['n'],
+            't': note['t'],
+            'm': self._mod_from_index(note['m']),
+            'l': note['l'],
+            'w': self._warning_from_index(note['w'])
+        }
+
+    def _unresolve_note(self, note):
+        """Convert a resolved note back into the stored representation.
+
+        Moderators and warning types missing from the constants are added.
+
+        Arguments:
+            note: a note as returned by _resolve_note (dict)
+
+        Returns a dict suitable for storage in cached_json
+        """
+        return {
+            'n': note['n'],
+            't': note['t'],
+            'm': self._constant_index('users', note['m'], add=True),
+            'l': note['l'],
+            'w': self._constant_index('warnings', note['w'], add=True)
+        }
+
+    def _constant_index(self, key, value, add=False):
+        """Return the index of a value in the constants.
+
+        Lookups go through a map of the values to their indices, which is
+        rebuilt whenever the list of constants was replaced or grew behind
+        its back.
+
+        Arguments:
+            key: the constants to search, 'users' or 'warnings' (str)
+            value: the moderator or warning type to look up (str)
+            add: whether to add the value to the constants if missing (bool)
+
+        Returns the index (int), or None if the value is missing and add is
+        False
+        """
+        values = self.cached_json['constants'][key]
+        cached = self._constant_maps.get(key)
+
+        if cached is None or cached[0] is not values or \
+                len(cached[1]) != len(values):
+            lookup = {}
+
+            for i, x in enumerate(values):
+                lookup.setdefault(x, i)
+
+            if len(lookup) != len(values):
+                # Duplicate values can't be checked with the length, so keep
+                # the map from being reused
+                values = None
+
+            cached = (values, lookup)
+            self._constant_maps[key] = cached
+
+        index = cached[1].get(value)
+
+        if index is None and add:
+            self.cached_json['constants'][key].append(value)
+            index = len(self.cached_json['constants'][key]) - 1
+            cached[1][value] = index
+
+        return index
@@ -0,0 +1,151 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import json
+import sqlite3
+from contextlib import closing
+
+from puni.compact import json_default
+
+
+class SQLiteCache(object):
+    """Stores decoded usernotes on disk, keyed by subreddit and revision.
+
+    A fresh process can load the usernotes of an unchanged wiki page from the
+    cache instead of downloading and decompressing the page again. It also
+    keeps the account statuses found by AccountChecker. The cache file may be
+    shared by any number of processes.
+    """
+
+    def __init__(self, path):
+        """Constructor for the SQLiteCache class.
+
+        Arguments:
+            path: the location of the SQLite database file (str)
+        """
+        self.path = path
+
+        with closing(self._connect()) as db, db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS usernotes ('
+                'subreddit TEXT NOT NULL, '
+                'page TEXT NOT NULL, '
+                'revision TEXT NOT NULL, '
+                'data TEXT NOT NULL, '
+                'PRIMARY KEY (subreddit, page, revision))'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS accounts ('
+                'username TEXT PRIMARY KEY, '
+                'status TEXT NOT NULL, '
+                'fullname TEXT, '
+                'checked REAL NOT NULL)'
+            )
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'SQLiteCache(path=\'{}\')'.format(self.path)
+
+    def get(self, subreddit, page, revision, object_hook=None):
+        """Return the cached usernotes for a revision of a wiki page.
+
+        Arguments:
+            subreddit: the subreddit name (str)
+            page: the wiki page name (str)
+            revision: the wiki revision ID (str)
+            object_hook: passed to json.loads (function)
+
+        Returns the decoded usernotes (dict), or None if they are not cached
+        """
+        with closing(self._connect()) as db:
+            row = db.execute(
+                'SELECT data FROM usernotes '
+                'WHERE subreddit = ? AND page = ? AND revision = ?',
+                (subreddit.lower(), page, revision)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return json.loads(row[0], object_hook=object_hook)
+
+    def set(self, subreddit, page, revision, notes, replace=True):
+        """Store the decoded usernotes for a revision of a wiki page.
+
+        Arguments:
+            subreddit: the subreddit name (str)
+            page: the wiki page name (str)
+            revision: the wiki revision ID (str)
+            notes: the decoded usernotes (dict)
+            replace: whether to drop the other revisions stored for the page
+                (bool)
+        """
+        data = json.dumps(notes, separators=(',', ':'), default=json_default)
+
+        with closing(self._connect()) as db, db:
+            if replace:
+                db.execute(
+                    'DELETE FROM usernotes WHERE subreddit = ? AND page = ?',
+                    (subreddit.lower(), page)
+                )
+
+            db.execute(
+                'INSERT OR REPLACE INTO usernotes VALUES (?, ?, ?, ?)',
+                (subreddit.lower(), page, revision, data)
+            )
+
+    def get_accounts(self, usernames):
+        """Return the stored account statuses of users.
+
+        Arguments:
+            usernames: the lowercase usernames (list of str)
+
+        Returns a dict of username -> (status, fullname, time checked) for the
+        users that are stored
+        """
+        accounts = {}
+
+        with closing(self._connect()) as db:
+            # Stay below SQLite's limit on the number of query parameters
+            for i in range(0, len(usernames), 500):
+                chunk = usernames[i:i + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = db.execute(
+                    'SELECT username, status, fullname, checked FROM accounts '
+                    'WHERE username IN ({})'.format(placeholders), chunk
+                )
+
+                for row in rows:
+                    accounts[row[0]] = tuple(row[1:])
+
+        return accounts
+
+    def set_accounts(self, accounts):
+        """Store account statuses, as returned by get_accounts.
+
+        Arguments:
+            accounts: username -> (status, fullname, time checked) (dict)
+        """
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                'INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?)',
+                [(k,) + tuple(v) for k, v in accounts.items()]
+            )
+
+    def _connect(self):
+        """Open a connection to the database file."""
+        return sqlite3.connect(self.path, timeout=30)
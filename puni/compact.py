@@ -0,0 +1,144 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+class _Record(object):
+    """A read-only record that can be used like the dict it replaces.
+
+    Subclasses list their keys in __slots__. Records compare equal to dicts
+    with the same items, and json_default turns them back into dicts when
+    serializing.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for key, value in zip(self.__slots__, values):
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise TypeError('{} is read-only'.format(type(self).__name__))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        try:
+            return dict(self.items()) == dict(other.items())
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return '{}({})'.format(type(self).__name__, dict(self.items()))
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        _Record.__init__(self, *[state[x] for x in self.__slots__])
+
+    def get(self, key, default=None):
+        """Return the value of a key, or default if there is no such key."""
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def keys(self):
+        """Return the keys of the record."""
+        return list(self.__slots__)
+
+    def items(self):
+        """Return (key, value) tuples of the record."""
+        return [(x, getattr(self, x)) for x in self.__slots__]
+
+
+class CompactNote(_Record):
+    """A note as stored in the usernotes JSON, without a dict per note."""
+
+    __slots__ = ('n', 't', 'm', 'l', 'w')
+
+
+class CompactUser(_Record):
+    """A user's entry in the usernotes JSON, holding only its notes."""
+
+    __slots__ = ('ns',)
+
+
+NOTE_KEYS = frozenset(CompactNote.__slots__)
+
+
+class CompactHook(object):
+    """A json object_hook that builds compact records while parsing.
+
+    Objects shaped like notes and user entries become CompactNote and
+    CompactUser records. Note texts and links are deduplicated within the
+    parse, so a note repeated on many users (such as a raid note) is only
+    stored once. Any other object is left as a dict, so nothing is lost.
+    """
+
+    def __init__(self):
+        """Constructor for the CompactHook class."""
+        self.strings = {}
+
+    def __call__(self, obj):
+        """Convert a parsed JSON object."""
+        if len(obj) == 5 and set(obj) == NOTE_KEYS:
+            strings = self.strings
+            return CompactNote(
+                strings.setdefault(obj['n'], obj['n']),
+                obj['t'],
+                obj['m'],
+                strings.setdefault(obj['l'], obj['l']),
+                obj['w']
+            )
+        elif len(obj) == 1 and 'ns' in obj and isinstance(obj['ns'], list):
+            return CompactUser(obj['ns'])
+
+        return obj
+
+
+def compact_note(note):
+    """Convert a note dict into a CompactNote.
+
+    Arguments:
+        note: a note as stored in the usernotes JSON (dict)
+    """
+    return CompactNote(note['n'], note['t'], note['m'], note['l'], note['w'])
+
+
+def json_default(obj):
+    """Serialize compact records; pass as json.dumps(..., default=...)."""
+    if isinstance(obj, _Record):
+        return dict(obj.items())
+
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
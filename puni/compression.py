@@ -0,0 +1,119 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import zlib
+
+
+class CompressionPolicy(object):
+    """Chooses zlib settings for the usernotes BLOB from the size budget.
+
+    Pages far below max_page_size are compressed at a fast level, and the
+    level is only escalated when the output would not leave enough headroom
+    below the budget. The last ratio seen at every level is remembered, so
+    levels that are predicted to fall short are skipped without trying them.
+
+    The output is always a standard zlib stream (15 bit window with a zlib
+    header), which Toolbox can read regardless of the settings chosen.
+    """
+
+    def __init__(self, levels=(1, 6, 9), headroom=0.2, mem_level=9,
+                 strategy=zlib.Z_DEFAULT_STRATEGY):
+        """Constructor for the CompressionPolicy class.
+
+        Arguments:
+            levels: the zlib levels to try, fastest first. The last level is
+                used whenever the others leave too little headroom (tuple)
+            headroom: the fraction of the budget that must remain free to
+                settle for a level other than the last (float)
+            mem_level: the zlib memLevel, 1-9 (int)
+            strategy: the zlib strategy, such as zlib.Z_FILTERED (int)
+        """
+        self.levels = tuple(levels)
+        self.headroom = headroom
+        self.mem_level = mem_level
+        self.strategy = strategy
+        self.ratios = {}  # level -> last compressed / uncompressed ratio
+        self.ratio_sizes = {}  # level -> uncompressed size of the last ratio
+        self.last_level = None
+        self.last_ratio = None
+        self.last_input_size = 0
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'CompressionPolicy(levels={})'.format(self.levels)
+
+    def compress(self, data, budget=None):
+        """Compress data with the fastest level that leaves enough headroom.
+
+        Arguments:
+            data: the data to compress (bytes)
+            budget: the maximum number of compressed bytes. If None the last
+                level is used (int)
+
+        Returns the compressed bytes. The chosen level, the compression ratio
+        and the size of data are stored in last_level, last_ratio and
+        last_input_size.
+        """
+        target = None if budget is None else budget * (1 - self.headroom)
+        compressed = None
+
+        for i, level in enumerate(self.levels):
+            last = i == len(self.levels) - 1
+
+            if not last:
+                if target is None:
+                    continue
+
+                ratio = self.ratios.get(level)
+                measured_size = self.ratio_sizes.get(level, 0)
+
+                # Ratios measured on much less or more data don't apply
+                if (ratio is not None and
+                        measured_size / 2 <= len(data) <= measured_size * 2 and
+                        len(data) * ratio > target):
+                    continue  # Known to fall short, don't bother trying
+
+            compressed = self._compress(data, level)
+            self.ratios[level] = len(compressed) / float(max(len(data), 1))
+            self.ratio_sizes[level] = len(data)
+
+            if last or len(compressed) <= target:
+                self.last_level = level
+                self.last_ratio = self.ratios[level]
+                self.last_input_size = len(data)
+                break
+
+        return compressed
+
+    def _compress(self, data, level):
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, zlib.MAX_WBITS, self.mem_level, self.strategy
+        )
+        return compressor.compress(data) + compressor.flush()
+
+
+class FixedCompression(CompressionPolicy):
+    """Always compresses at the same zlib level."""
+
+    def __init__(self, level=9, **kwargs):
+        """Constructor for the FixedCompression class.
+
+        Arguments:
+            level: the zlib level (int)
+            kwargs: mem_level and strategy, see CompressionPolicy
+        """
+        super(FixedCompression, self).__init__(levels=(level,), **kwargs)
@@ -15,31 +15,79 @@ with puni. If not, see http://www.gnu.org/licenses/.
 """
 
 
-from functools import wraps
+from functools import partial, wraps
 
 
-def update_cache(func):
+def update_cache(func=None, write=False):
     """Decorate functions that modify the internally stored usernotes JSON.
 
-    Ensures that updates are mirrored onto reddit.
+    Ensures that updates are mirrored onto reddit. While a batch is open (see
+    UserNotes.batch) the wiki is neither read nor written; update messages are
+    collected and committed together when the batch closes.
+
+    Can be applied bare (@update_cache) or with arguments
+    (@update_cache(write=True)). Calls hold the object's lock, if it has one,
+    so threads sharing a UserNotes take turns.
 
     Arguments:
         func: the function being decorated
+        write: whether the function only changes the usernotes. Such functions
+            skip downloading the page when a revision is already cached, as
+            set_json replays them onto the latest revision on conflict. If
+            one raises KeyError or IndexError on the cached page, the page is
+            downloaded and the function run again, in case the user or note
+            was added by somebody else meanwhile (bool)
     """
+    if func is None:
+        return partial(update_cache, write=write)
+
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         """The wrapper function."""
+        lock = getattr(self, '_lock', None)
+
+        if lock is None:
+            return call(self, *args, **kwargs)
+
+        with lock:
+            return call(self, *args, **kwargs)
+
+    def call(self, *args, **kwargs):
+        """Run func between downloading and uploading the usernotes."""
         lazy = kwargs.get('lazy', False)
         kwargs.pop('lazy', None)
+        batch = getattr(self, '_batch', None)
+        metrics = getattr(self, 'metrics', None)
 
-        if not lazy:
+        if metrics is not None:
+            metrics.increment('update_cache')
+        cached = (getattr(self, 'revision_id', None) is not None and
+                  not getattr(self, '_unsaved_changes', False))
+        skipped = not lazy and batch is None and write and cached
+
+        if not lazy and batch is None and not skipped:
             self.get_json()
 
-        ret = func(self, *args, **kwargs)
+        try:
+            ret = func(self, *args, **kwargs)
+        except (KeyError, IndexError):
+            if not skipped:
+                raise
+
+            # The cached page may predate what func looked for
+            self.get_json()
+            ret = func(self, *args, **kwargs)
 
         # If returning a string assume it is an update message
+        if isinstance(ret, str):
+            # The change only lives in the cache until set_json succeeds
+            self._unsaved_changes = True
+
         if isinstance(ret, str) and not lazy:
-            self.set_json(ret)
+            if batch is None:
+                self.set_json(ret)
+            else:
+                batch.append(ret)
         else:
             return ret
 
@@ -0,0 +1,268 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from puni.snapshot import Snapshot
+
+_MISSING = object()
+
+
+class History(object):
+    """Reads past revisions of the usernotes page.
+
+    Revisions are downloaded and decoded on a pool of threads. Decoded
+    revisions are kept in memory (the max_cached most recently used) and in
+    the persistent cache of the UserNotes, if it has one, so a revision is
+    only ever downloaded once. The revision list is kept as well, and only the
+    revisions newer than the newest known one are listed again. Revisions
+    written by an incompatible version of the usernotes schema are skipped.
+
+    Returned by UserNotes.history.
+    """
+
+    def __init__(self, usernotes, workers=8, max_cached=32):
+        """Constructor for the History class.
+
+        Arguments:
+            usernotes: the usernotes whose page is read (UserNotes)
+            workers: the number of revisions downloaded at the same time (int)
+            max_cached: the number of decoded revisions kept in memory (int)
+        """
+        self.usernotes = usernotes
+        self.workers = workers
+        self.max_cached = max_cached
+        self._snapshots = OrderedDict()  # Revision ID -> Snapshot or None
+        self._revisions = []  # Newest first
+        self._lock = threading.Lock()
+        self._revisions_lock = threading.Lock()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'History(usernotes={!r})'.format(self.usernotes)
+
+    @property
+    def cache_page(self):
+        """The page name the revisions are stored under in the cache."""
+        # Kept apart from the page itself, as storing the current revision
+        # drops every other revision stored for its page
+        return self.usernotes.page_name + ':history'
+
+    def revisions(self, limit=None):
+        """Return the revisions of the usernotes page, newest first.
+
+        The listing is read until it reaches the newest revision returned by
+        an earlier call, so known revisions are not requested again.
+
+        Arguments:
+            limit: the maximum number of revisions to return (int)
+
+        Returns a list of revision dicts with 'id', 'timestamp', 'author' and
+        'reason' keys
+        """
+        un = self.usernotes
+
+        with self._revisions_lock:
+            un._count_request('revision_checks')
+            known = self._revisions[0]['id'] if self._revisions else None
+            new = []
+
+            for revision in un.backend.revisions(un.page_name):
+                if revision['id'] == known:
+                    self._revisions = new + self._revisions
+                    break
+
+                new.append(revision)
+            else:
+                # The known revisions are gone, as the page was recreated
+                self._revisions = new
+
+            revisions = self._revisions
+
+        return revisions[:limit] if limit else list(revisions)
+
+    def snapshot(self, revision_id):
+        """Return the usernotes as of a revision.
+
+        Arguments:
+            revision_id: the wiki revision ID (str)
+
+        Returns a Snapshot, or None if the revision uses an unsupported
+        schema
+
+        Raises:
+            PageNotFound if the revision does not exist
+        """
+        snapshot = self._cached(revision_id)
+
+        if snapshot is _MISSING:
+            snapshot = self._keep(revision_id, self._load(revision_id))
+
+        return snapshot
+
+    def snapshots(self, revisions=None):
+        """Iterate over the usernotes as of every revision, newest first.
+
+        Revisions are decoded workers at a time, so stopping the iteration
+        early avoids downloading the older ones.
+
+        Arguments:
+            revisions: the revisions to read. Defaults to all of them (list of
+                revision dicts)
+
+        Yields (revision dict, Snapshot) tuples, skipping revisions that use
+        an unsupported schema
+        """
+        if revisions is None:
+            revisions = self.revisions()
+
+        pool = ThreadPool(max(1, min(self.workers, len(revisions))))
+
+        try:
+            for i in range(0, len(revisions), self.workers):
+                chunk = revisions[i:i + self.workers]
+                snapshots = pool.map(self.snapshot, [x['id'] for x in chunk])
+
+                for revision, snapshot in zip(chunk, snapshots):
+                    if snapshot is not None:
+                        yield revision, snapshot
+        finally:
+            pool.close()
+
+    def revision_at(self, timestamp):
+        """Return the revision that was current at a point in time.
+
+        Arguments:
+            timestamp: a UNIX epoch timestamp in seconds (float)
+
+        Returns a revision dict, or None if the page did not exist yet
+        """
+        return self._find_revision(self.revisions(), timestamp)
+
+    def get_notes(self, user, at):
+        """Return a user's notes as they were at a point in time.
+
+        Arguments:
+            user: the user to search for in the usernotes (str)
+            at: a UNIX epoch timestamp in seconds (float)
+
+        Returns a list of Note objects, empty if the user had no notes
+        """
+        revision = self.revision_at(at)
+        snapshot = self.snapshot(revision['id']) if revision else None
+
+        return snapshot.get_notes(user) if snapshot else []
+
+    def provenance(self, note):
+        """Find the revisions that added and removed a note.
+
+        The note is matched on its user, text, time and moderator. If it was
+        removed and added back several times, the latest such revisions are
+        returned.
+
+        Arguments:
+            note: the note to look for (Note)
+
+        Returns a dict with 'added' and 'removed' revision dicts. 'removed'
+        is None if the note is still present, and both are None if it was
+        never found. A note present since the oldest revision that could be
+        read is taken to be added by that revision
+        """
+        key = self._key(note)
+        result = {'added': None, 'removed': None}
+        newer = None  # The revision after the one being looked at
+        seen = False
+
+        for revision, snapshot in self.snapshots():
+            present = any(self._key(x) == key
+                          for x in snapshot.get_notes(note.username))
+
+            if present and not seen:
+                seen = True
+                result['removed'] = newer
+            elif seen and not present:
+                result['added'] = newer
+                return result
+
+            newer = revision
+
+        if seen:
+            result['added'] = newer
+
+        return result
+
+    def _load(self, revision_id):
+        """Read a revision from the persistent cache or the wiki.
+
+        Returns a Snapshot, or None if the revision uses an unsupported
+        schema
+        """
+        un = self.usernotes
+        cache = un.cache
+        notes = None
+
+        if cache is not None:
+            notes = cache.get(un.backend.name, self.cache_page, revision_id)
+
+        if notes is None:
+            try:
+                page, _ = un._read_page(un.page_name, revision_id)
+            except RuntimeError:
+                return None
+
+            notes = un._decode_page(page)
+
+            if cache is not None:
+                cache.set(un.backend.name, self.cache_page, revision_id,
+                          notes, replace=False)
+
+        return Snapshot(un, notes, revision_id)
+
+    def _cached(self, revision_id):
+        """Return a revision's Snapshot from memory, or _MISSING."""
+        with self._lock:
+            if revision_id not in self._snapshots:
+                return _MISSING
+
+            self._snapshots[revision_id] = self._snapshots.pop(revision_id)
+            return self._snapshots[revision_id]
+
+    def _keep(self, revision_id, snapshot):
+        """Keep a loaded Snapshot in memory and return it."""
+        with self._lock:
+            self._snapshots[revision_id] = snapshot
+
+            while len(self._snapshots) > self.max_cached:
+                self._snapshots.popitem(last=False)
+
+        return snapshot
+
+    @staticmethod
+    def _find_revision(revisions, timestamp):
+        """Return the newest revision made at or before a time, or None."""
+        for revision in revisions:
+            if revision['timestamp'] <= timestamp:
+                return revision
+
+        return None
+
+    @staticmethod
+    def _key(note):
+        """Return the values a note is matched on by provenance."""
+        return (note.username.lower(), note.note, note.time, note.moderator)
@@ -0,0 +1,433 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import json
+import re
+from bisect import bisect_left, insort
+
+from puni.compact import json_default
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class NoteIndex(object):
+    """Secondary indexes over the notes stored in the usernotes JSON.
+
+    Notes are indexed by moderator index, warning index, link and time. Each
+    entry is a (username, note) tuple referencing the note dict stored in the
+    usernotes JSON, so the indexes stay valid for as long as the dicts do.
+    """
+
+    def __init__(self, users):
+        """Constructor for the NoteIndex class.
+
+        Arguments:
+            users: the 'users' portion of the usernotes JSON (dict)
+        """
+        self.entries = {}  # id(note) -> (username, note)
+        self.by_mod = {}
+        self.by_warning = {}
+        self.by_link = {}
+        self.times = []  # Sorted list of (time, id(note))
+
+        for username, user in users.items():
+            for note in user['ns']:
+                self.add(username, note)
+
+    def add(self, username, note):
+        """Add a note to the indexes.
+
+        Arguments:
+            username: the user the note is attached to (str)
+            note: the note as stored in the usernotes JSON (dict)
+        """
+        key = id(note)
+        entry = (username, note)
+        self.entries[key] = entry
+
+        self.by_mod.setdefault(note['m'], {})[key] = entry
+        self.by_warning.setdefault(note['w'], {})[key] = entry
+
+        for link in self.link_keys(note['l']):
+            self.by_link.setdefault(link, {})[key] = entry
+
+        insort(self.times, (note['t'], key))
+
+    def remove(self, username, note):
+        """Remove a note from the indexes.
+
+        Arguments:
+            username: the user the note is attached to (str)
+            note: the note as stored in the usernotes JSON (dict)
+        """
+        key = id(note)
+
+        if self.entries.pop(key, None) is None:
+            return
+
+        self._discard(self.by_mod, note['m'], key)
+        self._discard(self.by_warning, note['w'], key)
+
+        for link in self.link_keys(note['l']):
+            self._discard(self.by_link, link, key)
+
+        i = bisect_left(self.times, (note['t'], key))
+
+        if i < len(self.times) and self.times[i] == (note['t'], key):
+            self.times.pop(i)
+
+    def rebind(self, users):
+        """Switch to a copy of the users map holding the same notes.
+
+        Arguments:
+            users: the new 'users' portion of the usernotes JSON (dict)
+        """
+        pass
+
+    def query(self, mod=None, warning=None, link=None, start=None, end=None):
+        """Return the entries matching every given criteria.
+
+        Arguments:
+            mod: the index of the moderator in the constants (int)
+            warning: the index of the warning in the constants (int)
+            link: a link in usernotes' shorthand format (str)
+            start: the earliest note time to include (int)
+            end: the note time to stop before (int)
+
+        Returns a list of (username, note) tuples, newest first
+        """
+        candidates = None
+
+        for index, value in ((self.by_mod, mod), (self.by_warning, warning),
+                             (self.by_link, link)):
+            if value is None:
+                continue
+
+            bucket = index.get(value, {})
+
+            if candidates is None:
+                candidates = bucket
+            else:
+                # Intersect the smaller set against the larger one
+                if len(bucket) < len(candidates):
+                    candidates, bucket = bucket, candidates
+                candidates = dict(
+                    (k, v) for k, v in candidates.items() if k in bucket
+                )
+
+        lo = 0 if start is None else bisect_left(self.times, (start,))
+        hi = len(self.times) if end is None else bisect_left(self.times, (end,))
+
+        if candidates is None:
+            keys = self.times[lo:hi]
+        elif len(candidates) < hi - lo:
+            keys = sorted(
+                (v[1]['t'], k) for k, v in candidates.items()
+                if (start is None or v[1]['t'] >= start) and
+                (end is None or v[1]['t'] < end)
+            )
+        else:
+            keys = [x for x in self.times[lo:hi] if x[1] in candidates]
+
+        return [self.entries[k] for _, k in reversed(keys)]
+
+    @staticmethod
+    def link_keys(link):
+        """Return the keys a shorthand link is indexed under.
+
+        Comment links are indexed under both the comment and its submission,
+        so a submission lookup finds notes on any of its comments.
+
+        Arguments:
+            link: a link in usernotes' shorthand format (str)
+
+        Returns a list of Strings
+        """
+        if not link:
+            return []
+
+        parts = link.split(',')
+
+        if parts[0] == 'l' and len(parts) > 2:
+            return [','.join(parts[:2]), link]
+        else:
+            return [link]
+
+    @staticmethod
+    def _discard(index, value, key):
+        """Remove a key from an index bucket, dropping the bucket if empty."""
+        bucket = index.get(value)
+
+        if bucket is not None:
+            bucket.pop(key, None)
+
+            if not bucket:
+                del index[value]
+
+
+class SizeIndex(object):
+    """Tracks the length of the users map serialized with json.dumps.
+
+    The serialized length of every user's entry is stored, and entries touched
+    by a change are measured again the next time the size is requested, so the
+    total never requires serializing the whole map.
+    """
+
+    def __init__(self, users):
+        """Constructor for the SizeIndex class.
+
+        Arguments:
+            users: the 'users' portion of the usernotes JSON (dict)
+        """
+        self.users = users
+        self.sizes = {}
+        self.total = 0
+        self.dirty = set()
+
+        for username in users:
+            self._measure(username)
+
+    def add(self, username, note):
+        """Mark a user whose notes changed (see NoteIndex.add)."""
+        self.dirty.add(username)
+
+    def remove(self, username, note):
+        """Mark a user whose notes changed (see NoteIndex.remove)."""
+        self.dirty.add(username)
+
+    def rebind(self, users):
+        """Switch to a copy of the users map (see NoteIndex.rebind)."""
+        self.users = users
+
+    def size(self):
+        """Return the length of json.dumps of the users map."""
+        for username in self.dirty:
+            self._measure(username)
+
+        self.dirty.clear()
+
+        if not self.sizes:
+            return 2  # {}
+
+        # Braces, plus ', ' between the entries
+        return 2 + self.total + 2 * (len(self.sizes) - 1)
+
+    def _measure(self, username):
+        """Update the stored length of a user's '"name": {...}' entry."""
+        self.total -= self.sizes.pop(username, 0)
+
+        if username in self.users:
+            size = (len(json.dumps(username)) + 2 +
+                    len(json.dumps(self.users[username],
+                                   default=json_default)))
+            self.sizes[username] = size
+            self.total += size
+
+
+class SummaryIndex(object):
+    """Per-user note counts, latest note times, warnings and moderators.
+
+    Every user's summary is updated as notes are added and removed, so
+    summarizing many users never looks at their notes. Warnings and
+    moderators are kept as constant indices with the number of notes using
+    them, and are only resolved to names when read.
+    """
+
+    def __init__(self, users):
+        """Constructor for the SummaryIndex class.
+
+        Arguments:
+            users: the 'users' portion of the usernotes JSON (dict)
+        """
+        self.users = users
+        self.summaries = {}  # username -> {'count', 'latest', 'w', 'm'}
+
+        for username, user in users.items():
+            for note in user['ns']:
+                self.add(username, note)
+
+    def add(self, username, note):
+        """Count a note in its user's summary (see NoteIndex.add)."""
+        summary = self.summaries.get(username)
+
+        if summary is None:
+            summary = self.summaries[username] = {
+                'count': 0, 'latest': note['t'], 'w': {}, 'm': {}
+            }
+
+        summary['count'] += 1
+        summary['latest'] = max(summary['latest'], note['t'])
+        summary['w'][note['w']] = summary['w'].get(note['w'], 0) + 1
+        summary['m'][note['m']] = summary['m'].get(note['m'], 0) + 1
+
+    def remove(self, username, note):
+        """Remove a note from its user's summary (see NoteIndex.remove)."""
+        summary = self.summaries.get(username)
+
+        if summary is None:
+            return
+
+        summary['count'] -= 1
+
+        if summary['count'] <= 0:
+            del self.summaries[username]
+            return
+
+        self._discount(summary['w'], note['w'])
+        self._discount(summary['m'], note['m'])
+
+        if note['t'] >= summary['latest']:
+            # The user's notes no longer hold the removed note
+            summary['latest'] = max(x['t'] for x in self.users[username]['ns'])
+
+    def rebind(self, users):
+        """Switch to a copy of the users map (see NoteIndex.rebind)."""
+        self.users = users
+
+    def summary(self, username, constants, ranks):
+        """Return the summary of a user, with the constants resolved.
+
+        Arguments:
+            username: the user to summarize (str)
+            constants: the 'constants' portion of the usernotes JSON (dict)
+            ranks: the severity of every warning type, higher being worse.
+                Types missing from it rank as 'none' (dict)
+
+        Returns a dict with the 'count', 'latest', 'warning' and
+        'moderators' keys, or None if the user has no notes
+        """
+        summary = self.summaries.get(username)
+
+        if summary is None:
+            return None
+
+        default = ranks.get('none', 0)
+        warnings = [constants['warnings'][x] for x in summary['w']]
+
+        return {
+            'count': summary['count'],
+            'latest': summary['latest'],
+            'warning': max(warnings, key=lambda x: ranks.get(x, default)),
+            'moderators': sorted(constants['users'][x] for x in summary['m'])
+        }
+
+    @staticmethod
+    def _discount(counts, key):
+        """Decrease a count, dropping it once it reaches zero."""
+        counts[key] -= 1
+
+        if not counts[key]:
+            del counts[key]
+
+
+class TextIndex(object):
+    """Inverted index of the words in the note texts.
+
+    Words are case-folded, and every word maps to the notes containing it,
+    so a search only looks at the notes holding all of its words.
+    """
+
+    def __init__(self, users):
+        """Constructor for the TextIndex class.
+
+        Arguments:
+            users: the 'users' portion of the usernotes JSON (dict)
+        """
+        self.postings = {}  # word -> {id(note): (username, note)}
+
+        for username, user in users.items():
+            for note in user['ns']:
+                self.add(username, note)
+
+    def add(self, username, note):
+        """Add a note to the index (see NoteIndex.add)."""
+        entry = (username, note)
+
+        for word in set(tokenize(note['n'])):
+            self.postings.setdefault(word, {})[id(note)] = entry
+
+    def remove(self, username, note):
+        """Remove a note from the index (see NoteIndex.remove)."""
+        for word in set(tokenize(note['n'])):
+            NoteIndex._discard(self.postings, word, id(note))
+
+    def rebind(self, users):
+        """Switch to a copy of the users map (see NoteIndex.rebind)."""
+        pass
+
+    def search(self, text, match='phrase'):
+        """Return the entries of the notes matching a text.
+
+        Arguments:
+            text: the words to search for (str)
+            match: 'phrase' for notes containing the text as written (ignoring
+                case and whitespace), 'all' for notes containing all of its
+                words in any order, or 'any' for notes containing any of them
+                (str)
+
+        Returns a list of (username, note) tuples, newest first
+
+        Raises:
+            ValueError if match is not supported
+        """
+        if match not in ('phrase', 'all', 'any'):
+            raise ValueError('Unsupported match: {}'.format(match))
+
+        words = set(tokenize(text))
+        buckets = sorted((self.postings.get(x, {}) for x in words), key=len)
+
+        if not buckets:
+            return []
+
+        if match == 'any':
+            found = {}
+
+            for bucket in buckets:
+                found.update(bucket)
+        else:
+            # Intersect starting from the rarest word
+            found = buckets[0]
+
+            for bucket in buckets[1:]:
+                found = dict((k, v) for k, v in found.items() if k in bucket)
+
+        entries = list(found.values())
+
+        if match == 'phrase':
+            phrase = normalize(text)
+            entries = [x for x in entries if phrase in normalize(x[1]['n'])]
+
+        entries.sort(key=lambda x: x[1]['t'], reverse=True)
+        return entries
+
+
+def tokenize(text):
+    """Split a text into case-folded words.
+
+    Arguments:
+        text: the text to split (str)
+
+    Returns a list of Strings
+    """
+    return WORD_RE.findall(normalize(text))
+
+
+def normalize(text):
+    """Case-fold a text and collapse its whitespace to single spaces."""
+    folded = text.casefold() if hasattr(text, 'casefold') else text.lower()
+    return ' '.join(folded.split())
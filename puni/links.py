@@ -0,0 +1,131 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+
+Conversion between reddit URLs and the shorthand links stored in usernotes:
+
+    l,<submission>            a submission
+    l,<submission>,<comment>  a comment
+    m,<message>               a modmail message
+"""
+
+
+import re
+
+
+FULL_LINK_RE = re.compile(r'^https?://(\w{1,3}\.)?reddit.com/')
+SHORT_LINK_RE = re.compile(r'[ml],[A-Za-z\d]{2,}(,[A-Za-z\d]+)?')
+COMMENT_RE = re.compile(
+    r'/comments/([A-Za-z\d]{2,})(?:/[^\s]+/([A-Za-z\d]+))?'
+)
+MESSAGE_RE = re.compile(r'/message/messages/([A-Za-z\d]+)')
+
+MESSAGE_SCHEME = 'https://reddit.com/message/messages/{}'
+COMMENT_SCHEME = 'https://reddit.com/r/{}/comments/{}/-/{}'
+POST_SCHEME = 'https://reddit.com/r/{}/comments/{}/'
+
+
+def compress_url(link):
+    """Convert a reddit URL into the short-hand used by usernotes.
+
+    Arguments:
+        link: a link to a comment, submission, or message (str)
+
+    Returns a String of the shorthand URL, or None if the URL is not
+    recognized
+    """
+    match = COMMENT_RE.search(link)
+
+    if match is None:
+        match = MESSAGE_RE.search(link)
+        return None if match is None else 'm,' + match.group(1)
+    elif match.group(2):
+        return 'l,' + match.group(1) + ',' + match.group(2)
+    else:
+        return 'l,' + match.group(1)
+
+
+def expand_url(short_link, subreddit=None):
+    """Convert a usernote's URL short-hand into a full reddit URL.
+
+    Arguments:
+        short_link: the compressed link from a usernote (str)
+        subreddit: the subreddit the URL is for (PRAW Subreddit object or str)
+
+    Returns a String of the full URL, or None if there is no link
+
+    Raises:
+        ValueError if the link needs a subreddit and none is given
+    """
+    if short_link == '':
+        return None
+
+    parts = short_link.split(',')
+
+    if parts[0] == 'm':
+        return MESSAGE_SCHEME.format(parts[1])
+    if parts[0] == 'l' and subreddit:
+        if len(parts) > 2:
+            return COMMENT_SCHEME.format(subreddit, parts[1], parts[2])
+        else:
+            return POST_SCHEME.format(subreddit, parts[1])
+    elif not subreddit:
+        raise ValueError('Subreddit name must be provided')
+    else:
+        return None
+
+
+def normalize(link):
+    """Convert a link given for a note into the form stored in usernotes.
+
+    Arguments:
+        link: a reddit URL or a shorthand link (str)
+
+    Returns a String of the shorthand link, or an empty String if the link is
+    not recognized
+    """
+    if FULL_LINK_RE.match(link):
+        return compress_url(link) or ''
+    elif SHORT_LINK_RE.match(link):
+        return link
+    else:
+        return ''
+
+
+def compress_links(links):
+    """Convert many reddit URLs with compress_url.
+
+    Arguments:
+        links: the URLs (iterable of str)
+
+    Returns a list of Strings, or None for unrecognized URLs
+    """
+    return [compress_url(x) for x in links]
+
+
+def expand_links(links, subreddit=None):
+    """Convert many usernote shorthand links with expand_url.
+
+    Arguments:
+        links: the shorthand links (iterable of str)
+        subreddit: the subreddit the URLs are for (PRAW Subreddit object or
+            str)
+
+    Returns a list of Strings, or None where there is no link
+
+    Raises:
+        ValueError if a link needs a subreddit and none is given
+    """
+    subreddit = str(subreddit) if subreddit else None
+    return [expand_url(x, subreddit) for x in links]
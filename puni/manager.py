@@ -0,0 +1,186 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+from multiprocessing.pool import ThreadPool
+
+from puni.base import UserNotes
+
+
+class UserNotesManager(object):
+    """Loads and searches the usernotes of many subreddits at once.
+
+    Pages are downloaded and decoded on a pool of threads (zlib and the
+    network release the GIL), and every subreddit shares the same reddit
+    session. Users are looked up in a combined index over all subreddits, so
+    finding a user's notes everywhere makes no requests.
+    """
+
+    def __init__(self, r, subreddits, workers=8, lazy_start=False,
+                 backends=None, **kwargs):
+        """Constructor for the UserNotesManager class.
+
+        Arguments:
+            r: the authenticated reddit instance (PRAW Reddit Object)
+            subreddits: the subreddits to manage (list of PRAW Subreddit
+                objects or names)
+            workers: the number of pages downloaded at the same time (int)
+            lazy_start: whether to download the usernotes immediately upon
+                instantiation (bool)
+            backends: the backend of each subreddit, keyed by name. Defaults to
+                the subreddits' wikis (dict)
+            kwargs: options for every UserNotes, such as cache or metrics
+        """
+        self.r = r
+        self.workers = workers
+        self.usernotes = {}  # Subreddit name -> UserNotes
+        self._users = {}  # Lowercase username -> {subreddit name: username}
+        self._indexed = {}  # Subreddit name -> state of the indexed page
+        self._names = {}  # Subreddit name -> lowercase usernames indexed
+
+        for subreddit in subreddits:
+            if r is not None and not hasattr(subreddit, 'display_name'):
+                subreddit = r.subreddit(subreddit)
+
+            name = str(subreddit)
+            backend = backends.get(name) if backends else None
+            self.usernotes[name] = UserNotes(
+                r, subreddit, lazy_start=True, backend=backend, **kwargs
+            )
+
+        if not lazy_start:
+            self.refresh()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'UserNotesManager(subreddits={})'.format(len(self.usernotes))
+
+    def __getitem__(self, name):
+        """Return the UserNotes of a subreddit."""
+        return self.usernotes[name]
+
+    def __iter__(self):
+        """Iterate over the names of the subreddits."""
+        return iter(self.usernotes)
+
+    def __len__(self):
+        """Return the number of subreddits."""
+        return len(self.usernotes)
+
+    def refresh(self):
+        """Bring the usernotes of every subreddit up to date concurrently.
+
+        Pages that did not change since they were last loaded are not
+        downloaded again (see UserNotes.get_json).
+
+        Returns a dict of subreddit names to the exceptions raised for the
+        pages that could not be loaded. The other pages are updated anyway.
+        """
+        results = self._map(lambda name, un: un.get_json(),
+                            list(self.usernotes.items()))
+        return dict((name, error) for name, (_, error) in results.items()
+                    if error is not None)
+
+    def notes_for_user(self, username, include_archive=False):
+        """Return a user's notes on every subreddit.
+
+        The notes already loaded are searched without making any requests;
+        call refresh to pick up changes made elsewhere. Usernames are matched
+        case-insensitively, like reddit does.
+
+        Arguments:
+            username: the user to search for (str)
+            include_archive: whether to add the user's archived notes. The
+                archives are checked concurrently, one request per subreddit
+                and shard holding the user (bool)
+
+        Returns a dict of subreddit names to lists of Note objects, only
+        holding the subreddits with notes on the user
+        """
+        self._update_index()
+        found = self._users.get(username.lower(), {})
+
+        if not include_archive:
+            return dict(
+                (name, self.usernotes[name].get_notes(stored, lazy=True))
+                for name, stored in found.items()
+            )
+
+        def get_notes(name, un):
+            return un.get_notes(found.get(name, username), lazy=True,
+                                include_archive=True)
+
+        results = self._map(get_notes, list(self.usernotes.items()))
+
+        for name, (_, error) in results.items():
+            if error is not None:
+                raise error
+
+        return dict((name, notes) for name, (notes, _) in results.items()
+                    if notes)
+
+    def _update_index(self):
+        """Index the users of the pages that changed since the last lookup."""
+        for name, un in self.usernotes.items():
+            users = un.cached_json.get('users', {})
+            state = (id(users), un.revision_id, len(users))
+
+            if self._indexed.get(name) == state:
+                continue
+
+            for key in self._names.get(name, ()):
+                self._users[key].pop(name, None)
+
+                if not self._users[key]:
+                    del self._users[key]
+
+            names = set()
+
+            for stored in users:
+                key = stored.lower()
+                self._users.setdefault(key, {})[name] = stored
+                names.add(key)
+
+            self._names[name] = names
+            self._indexed[name] = state
+
+    def _map(self, func, items):
+        """Call func on every UserNotes on the thread pool.
+
+        Arguments:
+            func: a function taking a subreddit name and its UserNotes
+            items: (subreddit name, UserNotes) tuples (list)
+
+        Returns a dict of subreddit names to (result, exception) tuples
+        """
+        def call(item):
+            name, un = item
+
+            try:
+                return name, (func(name, un), None)
+            except Exception as e:
+                return name, (None, e)
+
+        if not items:
+            return {}
+
+        pool = ThreadPool(min(self.workers, len(items)))
+
+        try:
+            return dict(pool.map(call, items))
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,149 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+
+UserNotes reports the following stages to Metrics.timing, with the number of
+bytes (characters for text) each stage produced:
+
+    fetch            downloading the wiki page
+    revision_check   asking the wiki for its latest revision
+    upload           writing the wiki page
+    parse_page       json.loads of the wiki page
+    decode           base64 decoding of the BLOB
+    inflate          zlib decompression of the BLOB
+    parse_users      json.loads of the decompressed BLOB
+    serialize_users  json.dumps of the users map
+    compress         zlib compression of the users map
+    encode           base64 encoding of the BLOB
+    serialize_page   json.dumps of the wiki page
+
+And the following counters to Metrics.increment:
+
+    api_calls        requests made to the wiki, of any kind
+    wiki_reads       full downloads of the wiki page
+    wiki_writes      edits of the wiki page (including retries)
+    revision_checks  requests for the latest revision
+    revision_hits    reads answered by the cache as the page was unchanged
+    cache_loads      reads answered by the persistent cache
+    edit_conflicts   edits rejected because the page changed
+    update_cache     calls to methods decorated with update_cache
+    compress_level_N pages compressed at zlib level N
+
+AccountChecker reports the following counters, and counts its requests in
+api_calls:
+
+    account_lookups     accounts fetched one at a time
+    account_batches     batches of known accounts checked by fullname
+    account_cache_hits  accounts answered by earlier results
+"""
+
+
+import threading
+from timeit import default_timer
+
+
+class Metrics(object):
+    """Receives timings and counters from UserNotes.
+
+    This base class discards everything. Subclass it and override timing and
+    increment to forward measurements elsewhere, such as a Prometheus
+    exporter.
+    """
+
+    def timing(self, stage, seconds, size=None):
+        """Record how long a stage took.
+
+        Arguments:
+            stage: the name of the stage (str)
+            seconds: the duration of the stage (float)
+            size: the number of bytes the stage produced, if applicable (int)
+        """
+        pass
+
+    def increment(self, counter, value=1):
+        """Increase a counter.
+
+        Arguments:
+            counter: the name of the counter (str)
+            value: the amount to increase it by (int)
+        """
+        pass
+
+    def timer(self, stage):
+        """Return a context manager that reports its duration to timing.
+
+        Set the size attribute of the returned object inside the block to
+        report a size. Nothing is reported if the block raises.
+
+        Arguments:
+            stage: the name of the stage (str)
+        """
+        return _Timer(self, stage)
+
+
+class MetricsCollector(Metrics):
+    """Accumulates timings and counters in memory. Thread-safe."""
+
+    def __init__(self):
+        """Constructor for the MetricsCollector class."""
+        self.timings = {}  # stage -> {'count', 'seconds', 'bytes'}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'MetricsCollector(stages={}, counters={})'.format(
+            len(self.timings), len(self.counters)
+        )
+
+    def timing(self, stage, seconds, size=None):
+        """Add the duration and size to the stage's totals."""
+        with self._lock:
+            totals = self.timings.setdefault(
+                stage, {'count': 0, 'seconds': 0.0, 'bytes': 0}
+            )
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['bytes'] += size or 0
+
+    def increment(self, counter, value=1):
+        """Add value to the counter."""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+
+class _Timer(object):
+    """Context manager returned by Metrics.timer."""
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.size = None
+        self.start = None
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.metrics.timing(
+                self.stage, default_timer() - self.start, self.size
+            )
@@ -0,0 +1,145 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import time
+
+
+class PruningPolicy(object):
+    """Selects the notes that may be removed to make the usernotes smaller.
+
+    Subclasses implement candidates, yielding notes in the order they should
+    be removed. UserNotes.prune removes candidates until the page fits.
+    """
+
+    def candidates(self, usernotes):
+        """Yield (username, note) tuples of notes that may be removed.
+
+        Arguments:
+            usernotes: the usernotes being pruned (UserNotes)
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return '{}()'.format(type(self).__name__)
+
+
+class OldestFirst(PruningPolicy):
+    """Removes notes starting with the oldest."""
+
+    def candidates(self, usernotes):
+        """Yield every note, oldest first."""
+        index = usernotes._index('notes')
+
+        for _, key in list(index.times):
+            yield index.entries[key]
+
+
+class OlderThan(PruningPolicy):
+    """Removes notes older than a number of days, oldest first."""
+
+    def __init__(self, days):
+        """Constructor for the OlderThan class.
+
+        Arguments:
+            days: the age in days after which notes may be removed (float)
+        """
+        self.days = days
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'OlderThan(days={})'.format(self.days)
+
+    def candidates(self, usernotes):
+        """Yield the notes older than the cutoff, oldest first."""
+        cutoff = time.time() - self.days * 24 * 60 * 60
+        index = usernotes._index('notes')
+
+        for note_time, key in list(index.times):
+            if note_time >= cutoff:
+                break
+
+            yield index.entries[key]
+
+
+class WarningType(PruningPolicy):
+    """Removes notes with any of the given warning types, oldest first."""
+
+    def __init__(self, *warnings):
+        """Constructor for the WarningType class.
+
+        Arguments:
+            warnings: the warning types that may be removed, such as
+                'spamwatch' (str)
+        """
+        self.warnings = warnings
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'WarningType({})'.format(', '.join(map(repr, self.warnings)))
+
+    def candidates(self, usernotes):
+        """Yield the notes with a matching warning type, oldest first."""
+        index = usernotes._index('notes')
+        entries = []
+
+        for warning in self.warnings:
+            warn_index = usernotes._constant_index('warnings', warning)
+
+            if warn_index is not None:
+                entries.extend(index.by_warning.get(warn_index, {}).values())
+
+        entries.sort(key=lambda x: x[1]['t'])
+
+        for entry in entries:
+            yield entry
+
+
+class UsersWithOnly(PruningPolicy):
+    """Removes users whose notes all have the given warning types.
+
+    The users whose latest note is the oldest are removed first. By default,
+    users that only have 'none' notes are removed.
+    """
+
+    def __init__(self, *warnings):
+        """Constructor for the UsersWithOnly class.
+
+        Arguments:
+            warnings: the warning types a user's notes must all have (str)
+        """
+        self.warnings = warnings or ('none',)
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'UsersWithOnly({})'.format(', '.join(map(repr, self.warnings)))
+
+    def candidates(self, usernotes):
+        """Yield every note of the matching users."""
+        indices = set(usernotes._constant_index('warnings', x)
+                      for x in self.warnings)
+        indices.discard(None)
+        users = [
+            (max(x['t'] for x in user['ns']), username, user['ns'])
+            for username, user in usernotes.cached_json['users'].items()
+            if user['ns'] and all(x['w'] in indices for x in user['ns'])
+        ]
+        users.sort(key=lambda x: x[0])
+
+        for _, username, notes in users:
+            for note in list(notes):
+                yield username, note
@@ -0,0 +1,115 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import threading
+
+from puni.index import NoteIndex
+
+
+class Snapshot(object):
+    """An immutable view of the usernotes at one point in time.
+
+    Snapshots are returned by UserNotes.snapshot. They share the note data
+    with the UserNotes they were taken from, which copies whatever it changes
+    afterwards instead of changing it in place, so taking a snapshot is cheap
+    and reading one never needs a lock. Snapshots never make requests.
+    """
+
+    def __init__(self, usernotes, page, revision_id):
+        """Constructor for the Snapshot class.
+
+        Arguments:
+            usernotes: the usernotes the snapshot was taken from (UserNotes)
+            page: the decoded usernotes, which must not be changed (dict)
+            revision_id: the wiki revision the page is based on (str)
+        """
+        self.usernotes = usernotes
+        self.revision_id = revision_id
+        self._page = page
+        self._index = None
+        self._constant_maps = None  # Constants key -> {value: index}
+        self._index_lock = threading.Lock()
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'Snapshot(revision_id={!r}, users={})'.format(
+            self.revision_id, len(self.users)
+        )
+
+    @property
+    def users(self):
+        """The 'users' portion of the usernotes JSON. Do not modify it."""
+        return self._page['users']
+
+    @property
+    def constants(self):
+        """The 'constants' portion of the usernotes JSON."""
+        return self._page['constants']
+
+    def get_notes(self, user):
+        """Return a list of Note objects for the given user.
+
+        Return an empty list if no notes are found.
+
+        Arguments:
+            user: the user to search for in the usernotes (str)
+        """
+        entry = self.users.get(user)
+
+        if entry is None:
+            return []
+
+        return [self.usernotes._make_note(user, x, self.constants)
+                for x in entry['ns']]
+
+    def get_users(self):
+        """Return a list of all users with notes."""
+        return list(self.users.keys())
+
+    def query(self, mod=None, warning=None, start=None, end=None, link=None):
+        """Return the notes matching every given criteria.
+
+        See UserNotes.query. The index is built on the first query.
+        """
+        with self._index_lock:
+            if self._index is None:
+                self._index = NoteIndex(self.users)
+
+        entries = self.usernotes._query_entries(
+            self._index, self._constant_index, mod, warning, start, end, link
+        )
+
+        return [self.usernotes._make_note(username, x, self.constants)
+                for username, x in entries]
+
+    def _constant_index(self, key, value):
+        """Return the index of a value in the constants, or None.
+
+        See UserNotes._constant_index. The constants of a snapshot never
+        change, so their maps are built once.
+        """
+        with self._index_lock:
+            if self._constant_maps is None:
+                self._constant_maps = {}
+
+                for name, values in self.constants.items():
+                    lookup = self._constant_maps[name] = {}
+
+                    for i, x in enumerate(values):
+                        lookup.setdefault(x, i)
+
+        return self._constant_maps[key].get(value)
@@ -0,0 +1,169 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import base64
+import codecs
+import json
+import re
+import zlib
+
+
+CHUNK_SIZE = 65536  # Characters of the BLOB decoded at a time
+WHITESPACE_RE = re.compile(r'\s*')
+
+
+def iter_blob(blob, chunk_size=CHUNK_SIZE):
+    """Decode and decompress a usernotes BLOB a piece at a time.
+
+    Arguments:
+        blob: the base64 encoded, zlib compressed BLOB (str)
+        chunk_size: the number of BLOB characters to decode at a time (int)
+
+    Yields Strings of decompressed JSON text
+    """
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    step = max(4, chunk_size - chunk_size % 4)  # Whole base64 quanta
+
+    for i in range(0, len(blob), step):
+        data = decompressor.decompress(base64.b64decode(blob[i:i + step]))
+        yield decoder.decode(data)
+
+    yield decoder.decode(decompressor.flush(), True)
+
+
+def iter_users(blob, chunk_size=CHUNK_SIZE, object_hook=None):
+    """Parse the users map of a usernotes BLOB one user at a time.
+
+    Only the entry being parsed and one chunk of decompressed text are held in
+    memory besides the entries already yielded.
+
+    Arguments:
+        blob: the base64 encoded, zlib compressed BLOB (str)
+        chunk_size: the number of BLOB characters to decode at a time (int)
+        object_hook: passed to the JSON decoder of every entry (function)
+
+    Yields (username, entry) tuples in the order they are stored
+
+    Raises:
+        ValueError if the BLOB does not hold a JSON object
+    """
+    reader = _Reader(iter_blob(blob, chunk_size), object_hook)
+    reader.expect('{')
+
+    if reader.peek() == '}':
+        return
+
+    while True:
+        username = reader.value()
+        reader.expect(':')
+        yield username, reader.value()
+
+        if reader.peek() == ',':
+            reader.expect(',')
+        else:
+            reader.expect('}')
+            return
+
+
+def expand_users(blob, chunk_size=CHUNK_SIZE, object_hook=None):
+    """Decode the users map of a usernotes BLOB with a low peak memory usage.
+
+    Arguments:
+        blob: the base64 encoded, zlib compressed BLOB (str)
+        chunk_size: the number of BLOB characters to decode at a time (int)
+        object_hook: passed to the JSON decoder of every entry (function)
+
+    Returns a dict equal to json.loads of the decompressed BLOB
+    """
+    return dict(iter_users(blob, chunk_size, object_hook))
+
+
+def find_user(blob, username, chunk_size=CHUNK_SIZE):
+    """Return a single user's entry, decoding no more of the BLOB than needed.
+
+    Arguments:
+        blob: the base64 encoded, zlib compressed BLOB (str)
+        username: the user to search for (str)
+        chunk_size: the number of BLOB characters to decode at a time (int)
+
+    Returns the user's entry (dict), or None if the user has no notes
+    """
+    for name, entry in iter_users(blob, chunk_size):
+        if name == username:
+            return entry
+
+    return None
+
+
+class _Reader(object):
+    """Reads JSON values from a stream of text chunks."""
+
+    def __init__(self, chunks, object_hook=None):
+        self.chunks = chunks
+        self.decoder = json.JSONDecoder(object_hook=object_hook)
+        self.buffer = ''
+        self.pos = 0
+
+    def _fill(self):
+        """Append the next chunk to the buffer, dropping consumed text.
+
+        Returns False when the stream is exhausted.
+        """
+        chunk = next(self.chunks, None)
+
+        if chunk is None:
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at the end."""
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be char."""
+        found = self.peek()
+
+        if found != char:
+            raise ValueError(
+                'Expected {!r} in usernotes BLOB, found {!r}'.format(char, found)
+            )
+
+        self.pos += 1
+
+    def value(self):
+        """Consume and return the next JSON value.
+
+        The users map only contains strings and objects, so a value that fails
+        to parse is either incomplete (and more text is read) or invalid.
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except ValueError:
+                if not self._fill():
+                    raise
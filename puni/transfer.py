@@ -0,0 +1,133 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import csv
+import json
+import sys
+
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('username', 'time', 'moderator', 'warning', 'note', 'link', 'url')
+
+
+def write_rows(fp, rows, format='jsonl'):
+    """Write note rows to a file as they are generated.
+
+    Arguments:
+        fp: a file opened for writing text
+        rows: dicts with the keys in FIELDS (iterable)
+        format: 'jsonl' for one JSON object per line, or 'csv' (str)
+
+    Returns the number of rows written
+
+    Raises:
+        ValueError if the format is not supported
+    """
+    _check_format(format)
+    count = 0
+
+    if format == 'csv':
+        writer = csv.DictWriter(_csv_file(fp, True), FIELDS)
+        writer.writeheader()
+
+        for row in rows:
+            writer.writerow(_csv_row(row, True))
+            count += 1
+    else:
+        for row in rows:
+            fp.write(u'{}\n'.format(json.dumps(row, sort_keys=True)))
+            count += 1
+
+    return count
+
+
+def read_rows(fp, format='jsonl'):
+    """Read note rows from a file one at a time.
+
+    Arguments:
+        fp: a file opened for reading text
+        format: see write_rows (str)
+
+    Yields dicts with the keys in FIELDS. Missing values are None, and the
+    time is an int
+
+    Raises:
+        ValueError if the format is not supported or a row is invalid
+    """
+    _check_format(format)
+
+    if format == 'csv':
+        rows = (_csv_row(x, False)
+                for x in csv.DictReader(_csv_file(fp, False)))
+    else:
+        rows = (json.loads(line) for line in fp if line.strip())
+
+    for number, row in enumerate(rows, 1):
+        row = dict((x, row.get(x) or None) for x in FIELDS)
+
+        if not row['username'] or not row['note']:
+            raise ValueError(
+                'Row {} has no username or note'.format(number)
+            )
+
+        try:
+            row['time'] = int(row['time']) if row['time'] else None
+        except ValueError:
+            raise ValueError('Row {} has an invalid time'.format(number))
+
+        yield row
+
+
+if sys.version_info < (3,):
+    class _Utf8Writer(object):
+        """Write the byte strings of the csv module to a text file."""
+
+        def __init__(self, fp):
+            self.fp = fp
+
+        def write(self, data):
+            self.fp.write(data.decode('utf-8'))
+
+    def _csv_file(fp, writing):
+        """Adapt a text file to the csv module, which only handles bytes."""
+        if writing:
+            return _Utf8Writer(fp)
+
+        return (line.encode('utf-8') for line in fp)
+
+    def _csv_row(row, writing):
+        """Encode the text of a row for the csv module, or decode it."""
+        if writing:
+            return dict((k, v.encode('utf-8') if isinstance(v, unicode) else v)
+                        for k, v in row.items())
+
+        return dict((k, v.decode('utf-8') if isinstance(v, str) else v)
+                    for k, v in row.items())
+else:
+    def _csv_file(fp, writing):
+        """Return the file, as the csv module handles text."""
+        return fp
+
+    def _csv_row(row, writing):
+        """Return the row, as the csv module handles text."""
+        return row
+
+
+def _check_format(format):
+    """Raise ValueError if format is not one of FORMATS."""
+    if format not in FORMATS:
+        raise ValueError('Unsupported format: {}'.format(format))
@@ -0,0 +1,221 @@
+"""Copyright 2017 teaearlgraycold.
+
+This file is part of puni
+
+puni is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License as published by the
+Free Software Foundation, either version 3 of the License, or (at your option)
+any later version.
+
+puni is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details. You should have received a copy of the GNU General Public License along
+with puni. If not, see http://www.gnu.org/licenses/.
+"""
+
+
+import threading
+from collections import Counter
+
+
+class Event(object):
+    """A change to the usernotes found by a Watcher."""
+
+    def __init__(self, username, revision_id):
+        """Constructor for the Event class.
+
+        Arguments:
+            username: the user whose notes changed (str)
+            revision_id: the wiki revision the change was found in (str)
+        """
+        self.username = username
+        self.revision_id = revision_id
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return '{}(username=\'{}\')'.format(type(self).__name__, self.username)
+
+
+class NoteAdded(Event):
+    """A note was added to a user."""
+
+    def __init__(self, username, revision_id, note):
+        """Constructor for the NoteAdded class.
+
+        Arguments:
+            note: the added note (Note)
+        """
+        super(NoteAdded, self).__init__(username, revision_id)
+        self.note = note
+
+
+class NoteRemoved(Event):
+    """A note was removed from a user that still has other notes."""
+
+    def __init__(self, username, revision_id, note):
+        """Constructor for the NoteRemoved class.
+
+        Arguments:
+            note: the removed note (Note)
+        """
+        super(NoteRemoved, self).__init__(username, revision_id)
+        self.note = note
+
+
+class UserRemoved(Event):
+    """Every note of a user was removed."""
+
+    def __init__(self, username, revision_id, notes):
+        """Constructor for the UserRemoved class.
+
+        Arguments:
+            notes: the removed notes (list of Note)
+        """
+        super(UserRemoved, self).__init__(username, revision_id)
+        self.notes = notes
+
+
+class Watcher(object):
+    """Polls the usernotes page and reports what changed between revisions.
+
+    Only the page's revision list is requested while nothing changes, and the
+    delay between polls grows by backoff up to max_interval. When a new
+    revision appears it is downloaded, and every user's notes are reduced to a
+    hash so only the users whose hash changed are compared note by note.
+
+    Returned by UserNotes.watch.
+    """
+
+    def __init__(self, usernotes, interval=30, max_interval=300, backoff=2,
+                 stop=None):
+        """Constructor for the Watcher class.
+
+        Arguments:
+            usernotes: the usernotes to watch (UserNotes)
+            interval: the seconds between polls after a change (float)
+            max_interval: the most seconds between polls (float)
+            backoff: the factor the delay grows by after every poll without
+                changes (float)
+            stop: ends the iteration when set, even while waiting
+                (threading.Event)
+        """
+        self.usernotes = usernotes
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.stop = stop if stop else threading.Event()
+        self.delay = interval
+        self._snapshot = None
+        self._digests = {}
+
+    def __repr__(self):
+        """Format the object's representation."""
+        return 'Watcher(usernotes={!r})'.format(self.usernotes)
+
+    def __iter__(self):
+        """Yield Events until stop is set.
+
+        The usernotes as of the first poll are the baseline, so changes made
+        before the iteration starts are not reported.
+        """
+        while not self.stop.is_set():
+            events = self.poll()
+
+            for event in events:
+                yield event
+
+            self._back_off(events)
+            self.stop.wait(self.delay)
+
+    def poll(self):
+        """Check the page once and return the Events since the last poll.
+
+        Returns a list of Events, grouped by user
+        """
+        un = self.usernotes
+
+        if self._snapshot is not None:
+            if un._latest_revision() == self._snapshot.revision_id and \
+                    not un._unsaved_changes:
+                return []
+
+        with un._lock:
+            if not un._unsaved_changes:
+                un.get_json()
+
+            snapshot = un.snapshot()
+
+        return self._advance(snapshot)
+
+    def _back_off(self, events):
+        """Set the delay until the next poll after a poll found events."""
+        if events:
+            self.delay = self.interval
+        else:
+            self.delay = min(self.delay * self.backoff, self.max_interval)
+
+    def _advance(self, snapshot):
+        """Move on to a newer snapshot and return the Events since the last.
+
+        Arguments:
+            snapshot: the usernotes as of the latest poll (Snapshot)
+
+        Returns a list of Events, grouped by user
+        """
+        previous, self._snapshot = self._snapshot, snapshot
+        digests = self._digest(self._snapshot)
+        old_digests, self._digests = self._digests, digests
+
+        if previous is None:
+            return []
+
+        events = []
+        revision_id = self._snapshot.revision_id
+
+        for username in sorted(set(old_digests) | set(digests)):
+            if old_digests.get(username) == digests.get(username):
+                continue
+
+            old_notes = previous.get_notes(username)
+            notes = self._snapshot.get_notes(username)
+
+            if not notes:
+                events.append(UserRemoved(username, revision_id, old_notes))
+                continue
+
+            old_keys = Counter(self._key(x) for x in old_notes)
+            keys = Counter(self._key(x) for x in notes)
+
+            for note in old_notes:
+                if old_keys[self._key(note)] > keys[self._key(note)]:
+                    old_keys[self._key(note)] -= 1
+                    events.append(NoteRemoved(username, revision_id, note))
+
+            for note in notes:
+                if keys[self._key(note)] > old_keys[self._key(note)]:
+                    keys[self._key(note)] -= 1
+                    events.append(NoteAdded(username, revision_id, note))
+
+        return events
+
+    @staticmethod
+    def _digest(snapshot):
+        """Return a hash of every user's notes, by username."""
+        mods = snapshot.constants['users']
+        warnings = snapshot.constants['warnings']
+        digests = {}
+
+        for username, entry in snapshot.users.items():
+            digests[username] = hash(tuple(
+                (x['n'], x['t'], mods[x['m']], x['l'], warnings[x['w']])
+                for x in entry['ns']
+            ))
+
+        return digests
+
+    @staticmethod
+    def _key(note):
+        """Return a hashable key of a Note."""
+        return (note.note, note.time, note.moderator, note.link, note.warning)
+
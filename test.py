@@ -1,2 +1,28 @@
+import sys
+
 from tests.note_tests import *
 from tests.usernotes_tests import *
+from tests.batch_tests import *
+from tests.cache_tests import *
+from tests.conflict_tests import *
+from tests.query_tests import *
+from tests.stream_tests import *
+from tests.backend_tests import *
+from tests.metrics_tests import *
+from tests.compression_tests import *
+from tests.size_tests import *
+from tests.pruning_tests import *
+from tests.archive_tests import *
+from tests.manager_tests import *
+from tests.snapshot_tests import *
+from tests.compact_tests import *
+from tests.constants_tests import *
+from tests.transfer_tests import *
+from tests.search_tests import *
+from tests.accounts_tests import *
+from tests.watch_tests import *
+from tests.history_tests import *
+from tests.summary_tests import *
+
+if sys.version_info >= (3, 7):
+    from tests.aio_tests import *
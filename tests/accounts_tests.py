@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import threading
+from prawcore.exceptions import NotFound
+from puni import (Note, SQLiteCache, AccountChecker, TokenBucket,
+                  MetricsCollector)
+from tests import fakes
+from tests.fakes import FakeResponse
+
+
+class Fake(object):
+    """An object with the given attributes."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeAccounts(object):
+    """Answers account lookups from a dict of username -> status."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests = []
+        self.redditors = Fake(partial_redditors=self.partial)
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        username = path.split('/')[1]
+
+        with self._lock:
+            self.requests.append(('about', username))
+
+        status = self.statuses.get(username, 'deleted')
+
+        if status == 'deleted':
+            raise NotFound(FakeResponse(404))
+        elif status == 'suspended':
+            return Fake(name=username, is_suspended=True)
+        elif status == 'error':
+            raise RuntimeError('server error')
+
+        return Fake(name=username, fullname='t2_' + username)
+
+    def partial(self, ids):
+        with self._lock:
+            self.requests.append(('batch', tuple(ids)))
+
+        for fullname in ids:
+            if self.statuses.get(fullname[3:]) == 'active':
+                yield Fake(fullname=fullname, name=fullname[3:])
+
+
+def make_usernotes(usernames):
+    un = fakes.make_usernotes([Note(x, 'note', mod='mod') for x in usernames])
+    return un, un.backend
+
+
+def unlimited():
+    return TokenBucket(rate=1000, capacity=1000)
+
+
+def test_check_statuses():
+    """Assert that every kind of account is told apart."""
+    r = FakeAccounts({'a': 'active', 'b': 'suspended', 'd': 'error'})
+    checker = AccountChecker(r, bucket=unlimited())
+
+    assert checker.check(['a', 'b', 'c', 'd']) == {
+        'a': 'active', 'b': 'suspended', 'c': 'deleted', 'd': None
+    }
+
+
+def test_results_reused():
+    """Assert that known accounts are not looked up again."""
+    r = FakeAccounts({'a': 'active'})
+    metrics = MetricsCollector()
+    checker = AccountChecker(r, bucket=unlimited(), metrics=metrics)
+    checker.check(['a', 'b'])
+    del r.requests[:]
+
+    assert checker.check(['A', 'b']) == {'A': 'active', 'b': 'deleted'}
+    assert r.requests == []
+    assert metrics.counters['account_cache_hits'] == 2
+
+
+def test_stale_results_batched():
+    """Assert that expired active accounts are checked by fullname."""
+    r = FakeAccounts(dict(('user{}'.format(i), 'active') for i in range(150)))
+    checker = AccountChecker(r, bucket=unlimited(), max_age=0)
+    usernames = ['user{}'.format(i) for i in range(150)]
+    checker.check(usernames)
+    del r.requests[:]
+    r.statuses['user7'] = 'suspended'
+
+    statuses = checker.check(usernames)
+
+    assert statuses['user7'] == 'suspended'
+    assert statuses['user8'] == 'active'
+    assert sorted(len(x[1]) for x in r.requests if x[0] == 'batch') == \
+        [50, 100]
+    assert [x for x in r.requests if x[0] == 'about'] == [('about', 'user7')]
+
+
+def test_persistent_results():
+    """Assert that results are shared through the SQLiteCache."""
+    directory = tempfile.mkdtemp()
+
+    try:
+        cache = SQLiteCache(os.path.join(directory, 'cache.db'))
+        r = FakeAccounts({'a': 'active', 'b': 'error'})
+        AccountChecker(r, bucket=unlimited(), cache=cache).check(['a', 'b'])
+        del r.requests[:]
+
+        checker = AccountChecker(r, bucket=unlimited(), cache=cache)
+
+        assert checker.check(['a', 'b']) == {'a': 'active', 'b': None}
+        assert r.requests == [('about', 'b')]  # Failures are not stored
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_token_bucket():
+    """Assert that the bucket waits once its tokens are used up."""
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0],
+                         sleep=sleep)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert waits == [0.5, 0.5]
+
+    bucket.update(remaining=10, seconds_to_reset=100)
+
+    assert bucket.rate == 0.1
+
+
+def test_prune_inactive_users():
+    """Assert that inactive users are removed in a single revision."""
+    un, backend = make_usernotes(['a', 'b', 'c', 'd'])
+    revisions = len(list(backend.revisions('usernotes')))
+    r = FakeAccounts({'a': 'active', 'b': 'suspended', 'd': 'error'})
+
+    removed = un.prune_inactive_users(
+        checker=AccountChecker(r, bucket=unlimited())
+    )
+
+    assert removed == {'b': 'suspended', 'c': 'deleted'}
+    assert sorted(un.get_users()) == ['a', 'd']
+
+    latest = list(backend.revisions('usernotes'))
+    assert len(latest) == revisions + 1
+    assert latest[0]['reason'] == '"prune 2 inactive users" via puni'
@@ -0,0 +1,337 @@
+import asyncio
+import io
+from puni import (AsyncUserNotes, AsyncBackend, UserNotes, Note, MemoryBackend,
+                  MetricsCollector, NoteAdded, NoteRemoved)
+from nose.tools import assert_raises
+
+
+def make_usernotes(**kwargs):
+    """Return AsyncUserNotes on an in-memory wiki."""
+    backend = MemoryBackend(moderators=['teaearlgraycold'], **kwargs)
+    return AsyncUserNotes(None, 'test', backend=AsyncBackend(backend),
+                          metrics=MetricsCollector())
+
+
+def test_async_add_and_get():
+    """Assert that notes can be added and read through asyncio."""
+    un = make_usernotes()
+
+    async def run():
+        await un.add_note(Note('spammer', 'first', mod='teaearlgraycold'))
+        await un.add_note(Note('spammer', 'second', mod='teaearlgraycold',
+                               warning='spamwarn'))
+        return (await un.get_notes('spammer'), await un.summaries(['spammer']),
+                await un.search('second'))
+
+    notes, summaries, found = asyncio.run(run())
+    un2 = UserNotes(None, 'test', backend=un.backend.backend)
+
+    assert [x.note for x in notes] == ['second', 'first']
+    assert summaries['spammer']['warning'] == 'spamwarn'
+    assert [x.note for x in found] == ['second']
+    assert [x.note for x in un2.get_notes('spammer')] == ['second', 'first']
+    assert un.metrics.counters['wiki_reads'] == 1
+
+
+def test_async_concurrent_changes():
+    """Assert that concurrent coroutines do not lose each other's changes."""
+    un = make_usernotes(latency=0.01)
+
+    async def run():
+        await un.get_json()
+        await asyncio.gather(*[
+            un.add_note(Note('user{}'.format(i), 'note', mod='teaearlgraycold'))
+            for i in range(5)
+        ])
+
+    asyncio.run(run())
+    un2 = UserNotes(None, 'test', backend=un.backend.backend)
+
+    assert sorted(un2.get_users()) == ['user{}'.format(i) for i in range(5)]
+
+
+def test_async_batch_and_conflicts():
+    """Assert that batches commit once and conflicts are retried."""
+    un = make_usernotes(conflict_rate=0.5, seed=3)
+    un.commit_backoff = 0
+    un.commit_attempts = 10
+
+    async def run():
+        async with un.batch():
+            for i in range(3):
+                await un.add_note(Note('user{}'.format(i), 'note',
+                                       mod='teaearlgraycold'))
+
+        await un.remove_user('user1')
+        return await un.get_users()
+
+    users = asyncio.run(run())
+    reasons = [x['reason'] for x in un.backend.backend.revisions('usernotes')]
+
+    assert sorted(users) == ['user0', 'user2']
+    assert any(x.startswith('"3 changes: ') for x in reasons)
+    assert 'simulated edit' in reasons
+
+
+def test_async_batch_rollback():
+    """Assert that a failing batch leaves the cache untouched."""
+    un = make_usernotes()
+
+    async def run():
+        await un.add_note(Note('user', 'note', mod='teaearlgraycold'))
+
+        with assert_raises(KeyError):
+            async with un.batch():
+                await un.remove_user('user')
+                await un.remove_user('nobody')
+
+        return await un.get_users(lazy=True)
+
+    assert asyncio.run(run()) == ['user']
+
+
+def test_async_compact_constants():
+    """Assert that unused constants are dropped through asyncio."""
+    un = make_usernotes()
+
+    async def run():
+        await un.add_note(Note('spammer', 'gone', mod='former'))
+        await un.add_note(Note('troll', 'kept', mod='teaearlgraycold'))
+        await un.remove_user('spammer')
+        await un.compact_constants()
+
+    asyncio.run(run())
+    un2 = UserNotes(None, 'test', backend=un.backend.backend)
+
+    assert un2.cached_json['constants']['users'] == ['teaearlgraycold']
+
+
+def test_async_export():
+    """Assert that notes can be exported through asyncio."""
+    un = make_usernotes()
+    fp = io.StringIO()
+
+    async def run():
+        await un.add_note(Note('spammer', 'first', mod='teaearlgraycold'))
+        return await un.export_notes(fp)
+
+    assert asyncio.run(run()) == 1
+    assert '"note": "first"' in fp.getvalue()
+
+
+def test_async_batch_excludes_other_tasks():
+    """Assert that other coroutines wait for a batch instead of joining it."""
+    un = make_usernotes()
+
+    async def failing_batch(started):
+        async with un.batch():
+            await un.add_note(Note('a', 'rolled back', mod='teaearlgraycold'))
+            started.set()
+            await asyncio.sleep(0.05)
+            raise ValueError
+
+    async def run():
+        await un.get_json()
+        started = asyncio.Event()
+        task = asyncio.ensure_future(failing_batch(started))
+        await started.wait()
+        await un.add_note(Note('b', 'kept', mod='teaearlgraycold'))
+
+        with assert_raises(ValueError):
+            await task
+
+        return await un.get_users(lazy=True)
+
+    assert asyncio.run(run()) == ['b']
+    un2 = UserNotes(None, 'test', backend=un.backend.backend)
+    assert un2.get_users() == ['b']
+
+
+def test_async_prune_and_archive():
+    """Assert that notes can be pruned and archived through asyncio."""
+    un = make_usernotes()
+    backend = un.backend.backend
+
+    async def run():
+        async with un.batch():
+            for i in range(200):
+                await un.add_note(Note('user{}'.format(i % 50),
+                                       'note number {}'.format(i),
+                                       mod='teaearlgraycold', note_time=i + 1))
+
+        size = len(backend.read('usernotes')[0])
+        await un.archive(size * 3 // 4)
+        await un.prune(size // 2)
+        manifest = await un.get_archive_manifest()
+        user = next(iter(manifest['users']))
+        return (size, user, await un.get_notes(user),
+                await un.get_notes(user, include_archive=True))
+
+    size, user, notes, with_archive = asyncio.run(run())
+    un2 = UserNotes(None, 'test', backend=backend)
+
+    assert len(backend.read('usernotes')[0]) <= size // 2
+    assert len(with_archive) > len(notes)
+    assert [x.note for x in with_archive] == \
+        [x.note for x in un2.get_notes(user, include_archive=True)]
+
+
+def test_async_import():
+    """Assert that exported notes can be imported through asyncio."""
+    source = UserNotes(None, 'test', backend=MemoryBackend(moderators=['mod']))
+    source.add_note(Note('spammer', 'first', mod='mod', link='l,abc12'))
+    source.add_note(Note('troll', 'second', mod='mod', warning='ban'))
+    fp = io.StringIO()
+    source.export_notes(fp)
+    un = make_usernotes()
+
+    async def run():
+        added = await un.import_notes(io.StringIO(fp.getvalue()))
+        again = await un.import_notes(io.StringIO(fp.getvalue()))
+        return added, again, await un.get_notes('spammer')
+
+    added, again, notes = asyncio.run(run())
+    un2 = UserNotes(None, 'test', backend=un.backend.backend)
+
+    assert (added, again) == (2, 0)
+    assert [(x.note, x.link) for x in notes] == [('first', 'l,abc12')]
+    assert sorted(un2.get_users()) == ['spammer', 'troll']
+
+
+def test_async_prune_inactive_users():
+    """Assert that users of deleted and suspended accounts are removed."""
+    un = make_usernotes()
+
+    class FakeChecker(object):
+        def check(self, usernames):
+            return dict((x, x.split('_')[0]) for x in usernames)
+
+    async def run():
+        async with un.batch():
+            for username in ('active_a', 'deleted_b', 'suspended_c'):
+                await un.add_note(Note(username, 'note',
+                                       mod='teaearlgraycold'))
+
+        removed = await un.prune_inactive_users(FakeChecker())
+        return removed, await un.get_users()
+
+    removed, users = asyncio.run(run())
+
+    assert removed == {'deleted_b': 'deleted', 'suspended_c': 'suspended'}
+    assert users == ['active_a']
+    assert UserNotes(None, 'test', backend=un.backend.backend).get_users() == \
+        ['active_a']
+
+
+def test_async_watch():
+    """Assert that changes by another client are reported through asyncio."""
+    un = make_usernotes()
+    other = UserNotes(None, 'test', backend=un.backend.backend)
+
+    async def run():
+        await un.add_note(Note('a', 'first', mod='teaearlgraycold'))
+        stop = asyncio.Event()
+        watcher = un.watch(interval=0.001, max_interval=0.004, stop=stop)
+        polls = []
+        poll = watcher.poll
+
+        async def counted_poll():
+            polls.append(watcher.delay)
+
+            if len(polls) == 2:
+                with other.batch():
+                    other.add_note(Note('a', 'second', mod='teaearlgraycold'))
+                    other.remove_note('a', 1)
+            elif len(polls) == 4:
+                stop.set()
+
+            return await poll()
+
+        watcher.poll = counted_poll
+        return [x async for x in watcher]
+
+    events = asyncio.run(run())
+
+    assert [(type(x), x.note.note) for x in events] == \
+        [(NoteRemoved, 'first'), (NoteAdded, 'second')]
+
+
+def test_async_history():
+    """Assert that past revisions are read through asyncio."""
+    backend = MemoryBackend(moderators=['mod'])
+    source = UserNotes(None, 'test', backend=backend)
+    source.add_note(Note('a', 'first', mod='mod', note_time=1))
+    source.add_note(Note('a', 'second', mod='mod', note_time=2))
+    source.remove_note('a', 1)
+
+    for i, revision in enumerate(backend.pages['usernotes']):
+        revision['timestamp'] = 100 * (i + 1)
+
+    un = AsyncUserNotes(None, 'test', backend=AsyncBackend(backend))
+    history = un.history(workers=2)
+
+    async def run():
+        first = (await history.get_notes('a', at=250))[0]
+        return (first, [x.note for x in await history.get_notes('a', at=350)],
+                await history.provenance(first))
+
+    first, notes, found = asyncio.run(run())
+
+    assert first.note == 'first'
+    assert notes == ['second', 'first']
+    assert (found['added']['timestamp'], found['removed']['timestamp']) == \
+        (200, 400)
+
+
+def test_async_matches_sync():
+    """Assert that UserNotes and AsyncUserNotes make the same edits."""
+    notes = [Note('user{}'.format(i % 50), 'note number {}'.format(i),
+                  mod='teaearlgraycold', note_time=i + 1) for i in range(200)]
+    un = make_usernotes(conflict_rate=0.5, seed=1)
+    sync = UserNotes(None, 'test', lazy_start=True, metrics=MetricsCollector(),
+                     backend=MemoryBackend(moderators=['teaearlgraycold'],
+                                           conflict_rate=0.5, seed=1))
+
+    for usernotes in (un, sync):
+        usernotes.commit_backoff = 0
+        usernotes.commit_attempts = 10
+
+    async def run():
+        for note in notes[:10]:
+            await un.add_note(note)
+
+        async with un.batch():
+            for note in notes[10:]:
+                await un.add_note(note)
+
+        un.backend.backend.conflict_rate = 0  # Archive edits are not retried
+        size = len(un.backend.backend.read('usernotes')[0])
+        await un.archive(size * 3 // 4)
+        await un.prune(size // 2)
+        return await un.get_notes('user0', include_archive=True)
+
+    def run_sync():
+        for note in notes[:10]:
+            sync.add_note(note)
+
+        with sync.batch():
+            for note in notes[10:]:
+                sync.add_note(note)
+
+        sync.backend.conflict_rate = 0
+        size = len(sync.backend.read('usernotes')[0])
+        sync.archive(size * 3 // 4)
+        sync.prune(size // 2)
+        return sync.get_notes('user0', include_archive=True)
+
+    def edits(backend):
+        return dict((k, [(x['content'], x['reason'], x['author']) for x in v])
+                    for k, v in backend.pages.items())
+
+    async_notes = asyncio.run(run())
+    sync_notes = run_sync()
+
+    assert [x.note for x in async_notes] == [x.note for x in sync_notes]
+    assert edits(un.backend.backend) == edits(sync.backend)
+    assert un.metrics.counters == sync.metrics.counters
+    assert un.metrics.counters['edit_conflicts'] > 0
@@ -0,0 +1,73 @@
+import time
+from puni import UserNotes, Note, MetricsCollector, OlderThan
+from tests import fakes
+
+
+def note_keys(notes):
+    """Return the contents of Note objects as a sorted list of tuples."""
+    return sorted((x.username, x.note, x.time, x.moderator, x.link, x.warning)
+                  for x in notes)
+
+
+def test_archive_moves_notes():
+    """Assert that archived notes leave the page but can still be read."""
+    un = fakes.make_usernotes(generated=500, now=int(time.time()),
+                              metrics=MetricsCollector())
+    users = un.get_users()
+    before = note_keys(n for u in users for n in un.get_notes(u))
+    target = len(un.backend.read('usernotes')[0]) // 2
+    un.archive(target)
+
+    assert len(un.backend.read('usernotes')[0]) <= target
+    assert 'usernotes_archive_1' in un.backend.pages
+
+    un2 = UserNotes(None, 'test', backend=un.backend)
+    after = note_keys(n for u in users
+                      for n in un2.get_notes(u, include_archive=True))
+
+    assert after == before
+    manifest = un2.get_archive_manifest()
+    assert sum(x['notes'] for x in manifest['shards']) == \
+        len(before) - sum(len(u['ns'])
+                          for u in un2.cached_json['users'].values())
+
+
+def test_archive_reads_only_needed_shards():
+    """Assert that only the shards holding a user's notes are downloaded."""
+    un = fakes.make_usernotes(generated=500, now=int(time.time()),
+                              metrics=MetricsCollector())
+    un.max_page_size = len(un.backend.read('usernotes')[0]) // 3
+    un.archive(un.max_page_size // 2)
+    manifest = un.get_archive_manifest()
+
+    assert len(manifest['shards']) > 1
+
+    un2 = UserNotes(None, 'test', backend=un.backend, lazy_start=True,
+                    metrics=MetricsCollector())
+    un2.get_json()
+    user = next(iter(manifest['users']))
+    un2.metrics.reset()
+    notes = un2.get_notes(user, include_archive=True)
+    un2.get_notes(user, include_archive=True)
+
+    assert notes
+    assert un2.metrics.counters['wiki_reads'] == \
+        1 + len(manifest['users'][user])
+
+
+def test_archive_fills_last_shard():
+    """Assert that archiving again adds to the existing shard."""
+    un = fakes.make_usernotes(generated=500, now=int(time.time()),
+                              metrics=MetricsCollector())
+    un.archive(policies=[OlderThan(30 * 365)])  # Nothing that old
+    assert 'usernotes_archive' not in un.backend.pages
+
+    target = len(un.backend.read('usernotes')[0]) * 3 // 4
+    un.archive(target)
+    un.archive(target * 3 // 4)
+    un.add_note(Note('new_user', 'note', mod='mod_0'))
+
+    assert [x['page'] for x in un.get_archive_manifest()['shards']] == \
+        ['usernotes_archive_1']
+    assert len(un.backend.pages['usernotes_archive_1']) == 2
+    assert len(un.get_notes('new_user', include_archive=True)) == 1
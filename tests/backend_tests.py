@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+from puni import UserNotes, Note, MemoryBackend, FileBackend
+from nose.tools import assert_raises
+
+
+def test_memory_backend():
+    """Assert that UserNotes works offline against the in-memory wiki."""
+    backend = MemoryBackend(moderators=['teaearlgraycold'])
+    un = UserNotes(None, 'test', backend=backend)
+    un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+    un2 = UserNotes(None, 'test', backend=backend)
+
+    assert un2.get_json()['constants']['users'] == ['teaearlgraycold']
+    assert [x.note for x in un2.get_notes('spammer')] == ['note']
+    assert len(backend.pages['usernotes']) == 2
+
+
+def test_memory_backend_conflicts():
+    """Assert that simulated conflicts are resolved by retrying the edit."""
+    backend = MemoryBackend(moderators=['teaearlgraycold'], conflict_rate=0.5,
+                            seed=1)
+    un = UserNotes(None, 'test', backend=backend)
+    un.commit_backoff = 0
+    un.commit_attempts = 10
+
+    for i in range(10):
+        un.add_note(Note('user{}'.format(i), 'note', mod='teaearlgraycold'))
+
+    reasons = [x['reason'] for x in backend.revisions('usernotes')]
+
+    assert 'simulated edit' in reasons
+    assert len(UserNotes(None, 'test', backend=backend).get_users()) == 10
+
+
+def test_page_not_found():
+    """Assert that reading a missing page raises PageNotFound."""
+    backend = MemoryBackend()
+
+    assert_raises(KeyError, backend.read, 'usernotes')
+    assert backend.latest_revision('usernotes') is None
+
+
+def test_file_backend():
+    """Assert that the file backend keeps pages between instances."""
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'wiki.json')
+
+    try:
+        un = UserNotes(None, 'test', backend=FileBackend(path))
+        un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+        un2 = UserNotes(None, 'test', backend=FileBackend(path))
+
+        assert un2.get_users() == ['spammer']
+        assert un2.revision_id == un.revision_id
+    finally:
+        shutil.rmtree(tmp_dir)
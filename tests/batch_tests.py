@@ -0,0 +1,48 @@
+from puni import UserNotes, Note
+from nose.tools import assert_raises
+from tests.fakes import FakeReddit, FakeSubreddit
+
+
+def test_batch_single_write():
+    """Assert that a batch performs one read and one write for many changes."""
+    sub = FakeSubreddit()
+    un = UserNotes(FakeReddit(), sub)
+    del sub.wiki.requests[:]
+
+    with un.batch():
+        for i in range(20):
+            un.add_note(Note('user{}'.format(i), 'note', mod='teaearlgraycold'))
+
+    page_requests = [x for x in sub.wiki.requests if x[0] != 'revisions']
+
+    assert page_requests == [('read', 'usernotes'), ('edit', 'usernotes')]
+    assert len(UserNotes(FakeReddit(), sub).get_users()) == 20
+    assert sub.wiki.pages['usernotes'][-1]['reason'].startswith('"20 changes: ')
+
+
+def test_batch_reason():
+    """Assert that an explicit batch reason is used for the wiki revision."""
+    sub = FakeSubreddit()
+    un = UserNotes(FakeReddit(), sub)
+
+    with un.batch(reason='raid cleanup'):
+        un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+        un.remove_user('spammer')
+
+    assert sub.wiki.pages['usernotes'][-1]['reason'] == 'raid cleanup'
+
+
+def test_batch_rollback():
+    """Assert that an exception inside a batch discards the batched changes."""
+    sub = FakeSubreddit()
+    un = UserNotes(FakeReddit(), sub)
+    revisions = len(sub.wiki.pages['usernotes'])
+
+    def failing_batch():
+        with un.batch():
+            un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+            raise KeyError('spammer')
+
+    assert_raises(KeyError, failing_batch)
+    assert 'spammer' not in un.cached_json['users']
+    assert len(sub.wiki.pages['usernotes']) == revisions
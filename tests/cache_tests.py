@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from puni import UserNotes, Note, SQLiteCache
+from tests.fakes import FakeReddit, FakeSubreddit
+
+
+def test_unchanged_page_not_downloaded():
+    """Assert that reads of an unchanged page only check the revision list."""
+    sub = FakeSubreddit()
+    UserNotes(FakeReddit(), sub)
+    un = UserNotes(FakeReddit(), sub)
+    del sub.wiki.requests[:]
+
+    un.get_users()
+    un.get_notes('teaearlgraycold')
+
+    assert ('read', 'usernotes') not in sub.wiki.requests
+
+
+def test_changed_page_downloaded():
+    """Assert that an edit by someone else invalidates the cached JSON."""
+    sub = FakeSubreddit()
+    un = UserNotes(FakeReddit(), sub)
+    other = UserNotes(FakeReddit(), sub)
+    other.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+
+    assert 'spammer' in un.get_users()
+
+
+def test_lazy_changes_discarded():
+    """Assert that get_json still discards unsaved lazy changes."""
+    sub = FakeSubreddit()
+    un = UserNotes(FakeReddit(), sub)
+    un.add_note(Note('spammer', 'note', mod='teaearlgraycold'), lazy=True)
+
+    assert 'spammer' not in un.get_users()
+
+
+def test_persistent_cache():
+    """Assert that a new process loads an unchanged page from the disk cache."""
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        cache = SQLiteCache(os.path.join(tmp_dir, 'usernotes.db'))
+        sub = FakeSubreddit()
+        un = UserNotes(FakeReddit(), sub, cache=cache)
+        un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+        del sub.wiki.requests[:]
+
+        un2 = UserNotes(FakeReddit(), sub, cache=cache)
+
+        assert ('read', 'usernotes') not in sub.wiki.requests
+        assert un2.get_json() == un.cached_json
+        assert un2.get_notes('spammer')[0].note == 'note'
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+from puni import UserNotes, Note, SQLiteCache
+from puni.compact import CompactNote
+from nose.plugins.skip import SkipTest
+from tests import fakes
+
+
+def make_backend():
+    """Return an in-memory wiki holding generated usernotes."""
+    return fakes.make_usernotes(generated=1000).backend
+
+
+def make_compact(backend, **kwargs):
+    """Return UserNotes storing notes as compact records."""
+    un = UserNotes(None, 'test', backend=backend, lazy_start=True, **kwargs)
+    un.compact_notes = True
+    un.get_json()
+    return un
+
+
+def users_json(un):
+    """Return the users map the way it is compressed into the BLOB."""
+    blob = un._compress_json(un.cached_json)['blob']
+    return UserNotes(None, 'test', backend=un.backend, lazy_start=True) \
+        ._expand_json({'ver': un.schema, 'blob': blob})['users']
+
+
+def test_compact_round_trip():
+    """Assert that compact notes encode to the same page."""
+    backend = make_backend()
+    un = UserNotes(None, 'test', backend=backend)
+    compact = make_compact(backend)
+    user = next(iter(compact.cached_json['users']))
+
+    assert isinstance(compact.cached_json['users'][user]['ns'][0],
+                      CompactNote)
+    assert users_json(compact) == users_json(un) == un.cached_json['users']
+    # Key order, and so the compressed size, can differ on Python 2
+    size = un.estimated_page_size()
+    assert abs(compact.estimated_page_size() - size) < size * 0.05
+
+
+def test_compact_changes():
+    """Assert that the usual operations work on compact notes."""
+    backend = make_backend()
+    un = make_compact(backend)
+    user = un.get_users()[0]
+    count = len(un.get_notes(user))
+    snapshot = un.snapshot()
+
+    un.add_note(Note(user, 'new note', mod='mod_1', warning='ban'))
+    un.remove_note(user, 1)
+
+    assert len(un.get_notes(user)) == count
+    assert un.get_notes(user)[0].note == 'new note'
+    assert un.query(mod='mod_1', warning='ban')[0].note == 'new note'
+    assert len(snapshot.get_notes(user)) == count
+    assert UserNotes(None, 'test', backend=backend).get_notes(user)[0].note \
+        == 'new note'
+
+
+def test_compact_cache():
+    """Assert that compact notes survive the persistent cache."""
+    backend = make_backend()
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        cache = SQLiteCache(os.path.join(tmp_dir, 'cache.db'))
+        make_compact(backend, cache=cache)
+        un = make_compact(backend, cache=cache)
+        user = un.get_users()[0]
+
+        assert isinstance(un.cached_json['users'][user]['ns'][0],
+                          CompactNote)
+        assert users_json(un) == \
+            UserNotes(None, 'test', backend=backend).cached_json['users']
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_compact_saves_memory():
+    """Assert that compact notes take substantially less memory."""
+    try:
+        import tracemalloc
+    except ImportError:  # Python 2
+        raise SkipTest('tracemalloc is not available')
+
+    backend = make_backend()
+    page = json.loads(backend.read('usernotes')[0])
+    sizes = []
+
+    for compact in (False, True):
+        un = UserNotes(None, 'test', backend=backend, lazy_start=True)
+        un.compact_notes = compact
+        tracemalloc.start()
+        users = un._expand_json(page)['users']
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del users
+
+    assert sizes[1] < sizes[0] * 0.8
+
+
+def test_note_has_no_dict():
+    """Assert that Note objects are slotted."""
+    assert not hasattr(Note('user', 'note'), '__dict__')
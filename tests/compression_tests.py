@@ -0,0 +1,45 @@
+import base64
+import zlib
+from puni import UserNotes, Note, MemoryBackend, FixedCompression
+from benchmarks.data import generate_users
+
+
+def make_usernotes(**kwargs):
+    """Return lazily started UserNotes holding generated notes."""
+    un = UserNotes(None, 'test', lazy_start=True, backend=MemoryBackend(),
+                   **kwargs)
+    un.cached_json = {
+        'ver': UserNotes.schema,
+        'users': generate_users(300),
+        'constants': {'users': ['mod_' + str(i) for i in range(60)],
+                      'warnings': list(Note.warnings)}
+    }
+    return un
+
+
+def test_fast_level_with_headroom():
+    """Assert that a small page is compressed at the fastest level."""
+    un = make_usernotes()
+    page = un._compress_json(un.cached_json)
+
+    assert un.compression.last_level == 1
+    assert zlib.decompress(base64.b64decode(page['blob']))
+
+
+def test_escalation_near_limit():
+    """Assert that the level is escalated when the page nears the limit."""
+    un = make_usernotes()
+    size = len(un._compress_json(un.cached_json)['blob'])
+    un.max_page_size = int(size * 0.9)
+    page = un._compress_json(un.cached_json)
+
+    assert un.compression.last_level == 9
+    assert un._expand_json(page) == un.cached_json
+
+
+def test_fixed_compression():
+    """Assert that FixedCompression always uses its level."""
+    un = make_usernotes(compression=FixedCompression(6))
+    un._compress_json(un.cached_json)
+
+    assert un.compression.last_level == 6
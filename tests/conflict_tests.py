@@ -0,0 +1,84 @@
+from puni import UserNotes, Note
+from nose.tools import assert_raises
+from puni.backends import EditConflict
+from tests.fakes import FakeReddit, FakeSubreddit
+
+
+def make_usernotes(sub):
+    """Return a UserNotes object that does not sleep between retries."""
+    un = UserNotes(FakeReddit(), sub)
+    un.commit_backoff = 0
+    return un
+
+
+def test_write_skips_download():
+    """Assert that a change to cached usernotes does not download the page."""
+    sub = FakeSubreddit()
+    un = make_usernotes(sub)
+    un.get_json()
+    del sub.wiki.requests[:]
+    un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+
+    assert ('read', 'usernotes') not in sub.wiki.requests
+    assert ('edit', 'usernotes') in sub.wiki.requests
+
+
+def test_stale_cache_refreshed():
+    """Assert that users and notes added by another client can be removed."""
+    sub = FakeSubreddit()
+    un = make_usernotes(sub)
+    un2 = make_usernotes(sub)
+    un.get_json()
+    un2.add_note(Note('spammer', 'first', mod='teaearlgraycold'))
+    un2.add_note(Note('troll', 'note', mod='teaearlgraycold'))
+    un2.add_note(Note('troll', 'second', mod='teaearlgraycold'))
+
+    un.remove_user('spammer')
+    un.remove_note('troll', 1)
+
+    assert un2.get_users() == ['troll']
+    assert [x.note for x in un2.get_notes('troll')] == ['second']
+    assert_raises(KeyError, un.remove_user, 'nobody')
+
+
+def test_conflict_merge():
+    """Assert that concurrent edits are merged instead of overwritten."""
+    sub = FakeSubreddit()
+    un = make_usernotes(sub)
+    un2 = make_usernotes(sub)
+    un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+    un.add_note(Note('troll', 'old note', mod='teaearlgraycold'))
+    un2.get_json()
+
+    un.add_note(Note('troll', 'new note', mod='othermod', warning='ban'))
+    un2.remove_note('troll', 0)
+    un2.add_note(Note('spammer', 'second note', mod='thirdmod'))
+    notes = UserNotes(FakeReddit(), sub).get_json()
+
+    assert [x['n'] for x in notes['users']['spammer']['ns']] == \
+        ['second note', 'note']
+    assert [x['n'] for x in notes['users']['troll']['ns']] == ['new note']
+    assert notes['constants']['users'][
+        notes['users']['troll']['ns'][0]['m']] == 'othermod'
+    assert notes['constants']['users'][
+        notes['users']['spammer']['ns'][0]['m']] == 'thirdmod'
+
+
+def test_conflict_retries_exhausted():
+    """Assert that a page which keeps changing eventually raises EditConflict."""
+    sub = FakeSubreddit()
+    un = make_usernotes(sub)
+    un.get_json()
+    download = un._download
+
+    def download_and_edit():
+        download()
+        sub.wiki.add_revision('usernotes', sub.wiki.pages['usernotes'][-1][
+            'content'])
+
+    un._download = download_and_edit
+    sub.wiki.add_revision('usernotes', sub.wiki.pages['usernotes'][-1][
+        'content'])
+
+    assert_raises(EditConflict, un.add_note,
+                  Note('spammer', 'note', mod='teaearlgraycold'))
@@ -0,0 +1,63 @@
+from puni import UserNotes, Note
+from tests import fakes
+
+
+MODERATORS = ['mod_a', 'mod_b', 'mod_c']
+NOTES = [
+    Note('user1', 'note', mod='mod_a', warning='ban'),
+    Note('user2', 'note', mod='mod_b', warning='spamwarn'),
+    Note('user3', 'note', mod='mod_c', warning='ban'),
+]
+
+
+def resolved(un):
+    """Return every note with its moderator and warning type."""
+    return sorted((x.username, x.moderator, x.warning)
+                  for user in un.get_users() for x in un.get_notes(user))
+
+
+def test_compact_constants():
+    """Assert that unused constants are dropped and notes remapped."""
+    un = fakes.make_usernotes(NOTES, moderators=MODERATORS)
+    un.remove_user('user2')
+    before = resolved(un)
+    snapshot = un.snapshot()
+    size = len(un.backend.read('usernotes')[0])
+    un.compact_constants()
+
+    assert un.cached_json['constants'] == {
+        'users': ['mod_a', 'mod_c'], 'warnings': ['ban']
+    }
+    assert resolved(un) == before
+    assert resolved(UserNotes(None, 'test', backend=un.backend)) == before
+    assert len(un.backend.read('usernotes')[0]) < size
+    assert [x.moderator for x in snapshot.get_notes('user3')] == ['mod_c']
+    assert un.query(mod='mod_c')[0].username == 'user3'
+    assert un.compact_constants() is None
+
+
+def test_compact_constants_conflict():
+    """Assert that compaction is replayed after an edit conflict."""
+    un = fakes.make_usernotes(NOTES, moderators=MODERATORS)
+    un.commit_backoff = 0
+    un.remove_user('user2')
+    other = UserNotes(None, 'test', backend=un.backend)
+    other.add_note(Note('user4', 'note', mod='mod_d', warning='gooduser'))
+    un.compact_constants()
+
+    assert un.cached_json['constants']['users'] == ['mod_a', 'mod_c', 'mod_d']
+    assert resolved(un)[-1] == ('user4', 'mod_d', 'gooduser')
+
+
+def test_constant_index():
+    """Assert that the reverse lookup follows changes to the constants."""
+    un = fakes.make_usernotes(NOTES, moderators=MODERATORS)
+    constants = un.cached_json['constants']
+
+    assert un._constant_index('users', 'mod_b') == 1
+    assert un._constant_index('users', 'mod_x') is None
+    assert un._constant_index('users', 'mod_x', add=True) == 3
+    assert constants['users'][3] == 'mod_x'
+
+    constants['users'] = ['mod_x']
+    assert un._constant_index('users', 'mod_x') == 0
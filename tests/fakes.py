@@ -0,0 +1,151 @@
+"""Minimal stand-ins for the parts of PRAW that puni talks to.
+
+They keep every wiki page in memory so the UserNotes logic can be exercised
+without network access or reddit credentials. make_usernotes sets up
+UserNotes on a MemoryBackend instead.
+"""
+
+
+from puni import UserNotes, MemoryBackend
+from benchmarks.data import generate_users
+
+
+GENERATED_MODS = ['mod_' + str(i) for i in range(60)]
+
+
+class FakeUser(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeWikiPage(object):
+    def __init__(self, wiki, name):
+        self.wiki = wiki
+        self.name = name
+
+    @property
+    def content_md(self):
+        self.wiki.requests.append(('read', self.name))
+
+        if self.name not in self.wiki.pages:
+            from prawcore.exceptions import NotFound
+            raise NotFound(FakeResponse(404))
+
+        return self.wiki.pages[self.name][-1]['content']
+
+    @property
+    def revision_id(self):
+        return self.wiki.pages[self.name][-1]['id']
+
+    def edit(self, content, reason=None, **other_settings):
+        self.wiki.requests.append(('edit', self.name))
+        previous = other_settings.get('previous')
+
+        if previous is not None and previous != self.revision_id:
+            from prawcore.exceptions import Conflict
+            raise Conflict(FakeResponse(409))
+
+        self.wiki.add_revision(self.name, content, reason)
+
+    def revisions(self, **generator_kwargs):
+        self.wiki.requests.append(('revisions', self.name))
+        revisions = reversed(self.wiki.pages.get(self.name, []))
+        limit = generator_kwargs.get('limit')
+
+        for i, revision in enumerate(revisions):
+            if limit is not None and i >= limit:
+                break
+            yield dict(revision)
+
+    @property
+    def mod(self):
+        return self
+
+    def update(self, listed, permlevel, **other_settings):
+        pass
+
+
+class FakeWiki(object):
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        self._next_revision = 0
+
+    def __getitem__(self, name):
+        return FakeWikiPage(self, name)
+
+    def create(self, name, content, reason=None, **other_settings):
+        self.requests.append(('create', name))
+        self.add_revision(name, content, reason)
+
+    def add_revision(self, name, content, reason=None):
+        self._next_revision += 1
+        self.pages.setdefault(name, []).append({
+            'id': 'rev{}'.format(self._next_revision),
+            'content': content,
+            'reason': reason,
+            'timestamp': self._next_revision,
+            'author': None
+        })
+
+
+class FakeSubreddit(object):
+    def __init__(self, display_name='test', mods=('teaearlgraycold',)):
+        self.display_name = display_name
+        self.wiki = FakeWiki()
+        self.mods = list(mods)
+
+    def __str__(self):
+        return self.display_name
+
+    def moderator(self):
+        return [FakeUser(x) for x in self.mods]
+
+
+class FakeRedditorHelper(object):
+    def __init__(self, name):
+        self._name = name
+
+    def me(self):
+        return FakeUser(self._name)
+
+
+class FakeReddit(object):
+    def __init__(self, username='teaearlgraycold'):
+        self.user = FakeRedditorHelper(username)
+
+
+def make_usernotes(notes=(), generated=0, moderators=None, name='test',
+                   now=1600000000, **kwargs):
+    """Return UserNotes on an in-memory wiki.
+
+    Arguments:
+        notes: Note objects added in a single batch (list)
+        generated: the number of users of generated notes uploaded first (int)
+        moderators: the subreddit's moderators. Defaults to mod_0 to mod_59,
+            who wrote the generated notes, or to 'mod' (list of str)
+        name: the name of the subreddit (str)
+        now: the UNIX timestamp of the newest generated notes (int)
+        kwargs: options for the UserNotes, such as metrics
+    """
+    if moderators is None:
+        moderators = GENERATED_MODS if generated else ['mod']
+
+    backend = MemoryBackend(name=name, moderators=moderators)
+    un = UserNotes(None, name, backend=backend, **kwargs)
+
+    if generated:
+        un.cached_json['users'] = generate_users(generated, now=now)
+        un.set_json('generated notes')
+
+    if notes:
+        with un.batch():
+            for note in notes:
+                un.add_note(note)
+
+    return un
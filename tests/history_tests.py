@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+from puni import UserNotes, Note, SQLiteCache
+from tests import fakes
+
+
+def make_history(cache=None):
+    """Return usernotes with four revisions, at times 100, 200, 300, 400."""
+    un = fakes.make_usernotes(cache=cache)
+    backend = un.backend
+    un.add_note(Note('a', 'first', mod='mod', note_time=1))
+    un.add_note(Note('a', 'second', mod='mod', note_time=2))
+    un.remove_note('a', 1)
+
+    for i, revision in enumerate(backend.pages['usernotes']):
+        revision['timestamp'] = 100 * (i + 1)
+
+    return un, backend
+
+
+def test_get_notes_at():
+    """Assert that a user's notes are read as of a point in time."""
+    un, backend = make_history()
+    history = un.history()
+
+    assert history.get_notes('a', at=50) == []
+    assert [x.note for x in history.get_notes('a', at=250)] == ['first']
+    assert [x.note for x in history.get_notes('a', at=350)] == \
+        ['second', 'first']
+    assert [x.note for x in history.get_notes('a', at=1000)] == ['second']
+
+
+def test_provenance():
+    """Assert that the revisions adding and removing a note are found."""
+    un, backend = make_history()
+    history = un.history(workers=2)
+    first = history.get_notes('a', at=250)[0]
+    second = un.get_notes('a')[0]
+
+    found = history.provenance(first)
+
+    assert found['added']['timestamp'] == 200
+    assert found['removed']['timestamp'] == 400
+    assert history.provenance(second) == {
+        'added': history.revision_at(300), 'removed': None
+    }
+    assert history.provenance(Note('a', 'never', mod='mod')) == {
+        'added': None, 'removed': None
+    }
+
+
+def test_revisions_not_downloaded_again():
+    """Assert that decoded revisions are reused, also across processes."""
+    directory = tempfile.mkdtemp()
+
+    try:
+        cache = SQLiteCache(os.path.join(directory, 'cache.db'))
+        un, backend = make_history(cache)
+        revisions = un.history().revisions()
+        list(un.history().snapshots(revisions))
+        history = un.history()
+        requests = backend.requests
+
+        assert [x[1].get_users() for x in history.snapshots(revisions)] == \
+            [['a'], ['a'], ['a'], []]
+        assert backend.requests == requests
+
+        # The current page is still cached alongside the history
+        UserNotes(None, 'test', backend=backend, cache=cache)
+        assert backend.requests == requests + 1
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_revision_list_kept():
+    """Assert that only the revisions not seen before are listed again."""
+    un, backend = make_history()
+    history = un.history()
+    listed = []
+    revisions = backend.revisions
+
+    def counted_revisions(page, limit=None):
+        for revision in revisions(page, limit):
+            listed.append(revision['id'])
+            yield revision
+
+    backend.revisions = counted_revisions
+    history.get_notes('a', at=250)
+    history.get_notes('a', at=350)
+
+    assert len(listed) == 4 + 1  # The second call stops at the newest
+
+    un.add_note(Note('a', 'third', mod='mod'))
+    del listed[:]
+
+    assert [x.note for x in history.get_notes('a', at=10 ** 10)] == \
+        ['third', 'second']
+    assert len(listed) == 2
+    assert len(history.revisions()) == 5
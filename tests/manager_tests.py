@@ -0,0 +1,66 @@
+import time
+from puni import UserNotes, UserNotesManager, Note, MemoryBackend
+
+
+def make_backends(count, latency=0):
+    """Return in-memory wikis for subreddits sub0, sub1, ..."""
+    backends = {}
+
+    for i in range(count):
+        name = 'sub{}'.format(i)
+        backends[name] = MemoryBackend(name=name, moderators=['mod'],
+                                       latency=latency)
+        un = UserNotes(None, name, backend=backends[name])
+        un.add_note(Note('user{}'.format(i % 3), 'note on ' + name,
+                         mod='mod'))
+
+    return backends
+
+
+def test_manager_loads_concurrently():
+    """Assert that the pages are downloaded in parallel."""
+    backends = make_backends(10, latency=0.1)
+    start = time.time()
+    manager = UserNotesManager(None, sorted(backends), workers=10,
+                               backends=backends)
+
+    assert time.time() - start < 0.5
+    assert len(manager) == 10
+    assert manager['sub3'].get_users(lazy=True) == ['user0']
+
+
+def test_notes_for_user():
+    """Assert that a user's notes are found on every subreddit."""
+    backends = make_backends(6)
+    manager = UserNotesManager(None, sorted(backends), backends=backends)
+    requests = sum(x.requests for x in backends.values())
+    notes = manager.notes_for_user('USER1')
+
+    assert sorted(notes) == ['sub1', 'sub4']
+    assert [x.note for x in notes['sub4']] == ['note on sub4']
+    assert sum(x.requests for x in backends.values()) == requests
+
+    manager['sub0'].add_note(Note('user1', 'new', mod='mod'))
+
+    assert sorted(manager.notes_for_user('user1')) == ['sub0', 'sub1', 'sub4']
+    assert manager.notes_for_user('nobody') == {}
+
+    manager['sub1'].remove_user('user1')
+
+    assert sorted(manager.notes_for_user('user1')) == ['sub0', 'sub4']
+    assert sorted(manager.notes_for_user('user2')) == ['sub2', 'sub5']
+
+
+def test_refresh_reports_errors():
+    """Assert that a failing subreddit does not stop the others."""
+    backends = make_backends(3)
+    manager = UserNotesManager(None, sorted(backends), backends=backends)
+    UserNotes(None, 'sub2', backend=backends['sub2']).add_note(
+        Note('user0', 'elsewhere', mod='mod')
+    )
+    backends['sub1'].latest_revision = None  # Not callable
+
+    errors = manager.refresh()
+
+    assert list(errors) == ['sub1']
+    assert sorted(manager.notes_for_user('user0')) == ['sub0', 'sub2']
@@ -0,0 +1,22 @@
+from puni import UserNotes, Note, MemoryBackend, MetricsCollector
+
+
+def test_metrics():
+    """Assert that wiki requests and encoding stages are reported."""
+    metrics = MetricsCollector()
+    backend = MemoryBackend(moderators=['teaearlgraycold'])
+    un = UserNotes(None, 'test', backend=backend, metrics=metrics)
+    un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+    UserNotes(None, 'test', backend=backend, metrics=metrics)
+
+    for stage in ('fetch', 'decode', 'inflate', 'compress', 'encode',
+                  'upload'):
+        assert metrics.timings[stage]['count'] > 0
+        assert metrics.timings[stage]['bytes'] > 0
+
+    assert metrics.timings['parse_users']['count'] == 1
+
+    assert metrics.counters['wiki_writes'] == 2
+    assert metrics.counters['wiki_reads'] == 2
+    assert metrics.counters['update_cache'] == 1
+    assert metrics.counters['api_calls'] == backend.requests
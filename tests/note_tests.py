@@ -1,4 +1,4 @@
-from puni import Note
+from puni import Note, links
 from nose.tools import assert_raises
 
 
@@ -58,3 +58,26 @@ def test_note_4():
     )
 
     assert_raises(ValueError, n.full_url)
+
+
+def test_bulk_links():
+    """Ensure links convert in bulk the same as one at a time."""
+    urls = [
+        'https://reddit.com/message/messages/000fff',
+        'https://www.reddit.com/r/pics/comments/92dd8/test_post_please_ignore',
+        'https://www.reddit.com/r/pics/comments/92dd8/test/c0b6xx0',
+        'https://www.reddit.com/r/pics/comments/92dd8/test/c0b6xx0',
+        'https://example.com/'
+    ]
+    short = links.compress_links(urls)
+
+    assert short == ['m,000fff', 'l,92dd8', 'l,92dd8,c0b6xx0',
+                     'l,92dd8,c0b6xx0', None]
+    assert links.expand_links(short[:4] + [''], 'pics') == [
+        'https://reddit.com/message/messages/000fff',
+        'https://reddit.com/r/pics/comments/92dd8/',
+        'https://reddit.com/r/pics/comments/92dd8/-/c0b6xx0',
+        'https://reddit.com/r/pics/comments/92dd8/-/c0b6xx0',
+        None
+    ]
+    assert_raises(ValueError, links.expand_links, ['l,92dd8'])
@@ -0,0 +1,52 @@
+import time
+from puni import OlderThan, WarningType, UsersWithOnly
+from tests import fakes
+
+
+def page_size(un):
+    """Return the length of the page stored on the wiki."""
+    return len(un.backend.read('usernotes')[0])
+
+
+def test_prune_oldest_first():
+    """Assert that pruning removes the oldest notes until the page fits."""
+    un = fakes.make_usernotes(generated=500, now=int(time.time()))
+    target = page_size(un) * 3 // 4
+    oldest = min(x['t'] for u in un.cached_json['users'].values()
+                 for x in u['ns'])
+    revisions = len(un.backend.pages['usernotes'])
+    un.prune(target)
+
+    assert target * 0.9 < page_size(un) <= target
+    assert len(un.backend.pages['usernotes']) == revisions + 1
+    assert oldest < min(x['t'] for u in un.cached_json['users'].values()
+                        for x in u['ns'])
+    assert un.backend.pages['usernotes'][-1]['reason'].startswith('"prune ')
+
+
+def test_prune_policies():
+    """Assert that policies are applied in order."""
+    un = fakes.make_usernotes(generated=500, now=int(time.time()))
+    warnings = un.cached_json['constants']['warnings']
+    target = page_size(un) - 500
+    un.prune(target, [UsersWithOnly('none'), WarningType('spamwatch'),
+                      OlderThan(30)])
+
+    assert page_size(un) <= target
+    # Only users with nothing but 'none' notes had to go
+    assert any(warnings[x['w']] == 'spamwatch'
+               for u in un.cached_json['users'].values() for x in u['ns'])
+    assert len(un.plan_prune(1, [WarningType('botban')])) == sum(
+        1 for u in un.cached_json['users'].values() for x in u['ns']
+        if warnings[x['w']] == 'botban'
+    )
+
+
+def test_prune_nothing_to_do():
+    """Assert that a page that already fits is left alone."""
+    un = fakes.make_usernotes(generated=500, now=int(time.time()))
+    revisions = len(un.backend.pages['usernotes'])
+    un.prune()
+
+    assert un.plan_prune() == []
+    assert len(un.backend.pages['usernotes']) == revisions
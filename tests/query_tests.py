@@ -0,0 +1,49 @@
+from puni import Note
+from tests import fakes
+
+
+NOTES = [
+    Note('spammer', 'spam', mod='modA', warning='spamwatch', link='l,92dd8',
+         note_time=100),
+    Note('spammer', 'banned', mod='modB', warning='permban',
+         link='l,92dd8,c0b6xx0', note_time=200),
+    Note('troll', 'banned', mod='modA', warning='permban', link='m,000fff',
+         note_time=300),
+]
+
+
+def test_query_by_mod_and_warning():
+    """Assert that queries combine the moderator and warning indexes."""
+    un = fakes.make_usernotes(NOTES)
+    notes = un.query(mod='modA', warning='permban')
+
+    assert [(x.username, x.time) for x in notes] == [('troll', 300)]
+
+
+def test_query_by_time():
+    """Assert that time range queries return notes newest first."""
+    un = fakes.make_usernotes(NOTES)
+    notes = un.query(start=100, end=300)
+
+    assert [x.time for x in notes] == [200, 100]
+
+
+def test_query_by_link():
+    """Assert that submission links also match notes on its comments."""
+    un = fakes.make_usernotes(NOTES)
+    url = 'https://www.reddit.com/r/pics/comments/92dd8/test_post_please_ignore'
+
+    assert len(un.query(link=url)) == 2
+    assert len(un.query(link='l,92dd8,c0b6xx0')) == 1
+    assert un.query(mod='nobody') == []
+
+
+def test_query_index_maintained():
+    """Assert that the indexes follow notes being added and removed."""
+    un = fakes.make_usernotes(NOTES)
+    un.query()
+    un.remove_user('spammer')
+    un.add_note(Note('troll', 'again', mod='modB', warning='permban',
+                     note_time=400))
+
+    assert [x.time for x in un.query(warning='permban')] == [400, 300]
@@ -0,0 +1,44 @@
+from puni import Note
+from nose.tools import assert_raises
+from tests import fakes
+
+
+NOTES = [
+    Note('alice', 'Ban evasion, see example.com', mod='mod', note_time=100),
+    Note('bob', 'evasion of a ban', mod='mod', note_time=200),
+    Note('carol', 'suspected BAN  EVASION', mod='mod', note_time=300),
+    Note('dave', 'spam from example.org', mod='mod', note_time=400),
+]
+
+
+def users(notes):
+    """Return the usernames of a list of notes."""
+    return [x.username for x in notes]
+
+
+def test_search_matches():
+    """Assert that phrases, words and domains are found, newest first."""
+    un = fakes.make_usernotes(NOTES)
+
+    assert users(un.search('ban evasion')) == ['carol', 'alice']
+    assert users(un.search('Ban Evasion', match='all')) == \
+        ['carol', 'bob', 'alice']
+    assert users(un.search('example.com')) == ['alice']
+    assert users(un.search('example com spam', match='any')) == \
+        ['dave', 'alice']
+    assert users(un.search('ban', limit=1)) == ['carol']
+    assert un.search('nothing') == []
+    assert un.search('!!!') == []
+    assert_raises(ValueError, un.search, 'ban', match='fuzzy')
+
+
+def test_search_follows_changes():
+    """Assert that the index is kept up to date."""
+    un = fakes.make_usernotes(NOTES)
+    un.search('ban')
+    un.add_note(Note('erin', 'ban evasion again', mod='mod', note_time=500))
+    un.remove_user('carol')
+    un.remove_note('alice', 0)
+
+    assert users(un.search('ban evasion')) == ['erin']
+    assert users(un.search('example')) == ['dave']
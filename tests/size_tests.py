@@ -0,0 +1,95 @@
+import json
+import sys
+import threading
+from puni import UserNotes, Note, MetricsCollector
+from nose.tools import assert_raises
+from tests import fakes
+
+
+def page_size(un):
+    """Return the actual length of the page set_json would upload."""
+    return len(json.dumps(un._compress_json(un.cached_json)))
+
+
+def test_estimate_tracks_changes():
+    """Assert that the estimate stays close to the real page size."""
+    un = fakes.make_usernotes(generated=300, metrics=MetricsCollector())
+    un2 = UserNotes(None, 'test', backend=un.backend)
+
+    for usernotes in (un, un2):
+        assert abs(usernotes.estimated_page_size() - page_size(usernotes)) < \
+            page_size(usernotes) * 0.05
+
+    for i in range(50):
+        note = Note('user{}'.format(i), 'note {}'.format(i), mod='mod_0')
+        un.add_note(note, lazy=True)
+
+    for user in list(un.cached_json['users'])[:100]:
+        un.remove_user(user, lazy=True)
+
+    assert abs(un.estimated_page_size() - page_size(un)) < page_size(un) * 0.1
+
+
+def test_estimate_fails_fast():
+    """Assert that a page far over the limit is rejected before compressing."""
+    un = fakes.make_usernotes(generated=300, metrics=MetricsCollector())
+    un.max_page_size = un.estimated_page_size() // 2
+    un.metrics.reset()
+
+    assert_raises(OverflowError, un.set_json, 'too big')
+    assert 'compress' not in un.metrics.timings
+
+
+def test_estimate_during_changes():
+    """Assert that size estimates and pruning plans can run beside writers."""
+    un = fakes.make_usernotes(generated=300, metrics=MetricsCollector())
+    done = threading.Event()
+    errors = []
+
+    def write():
+        try:
+            for i in range(500):
+                note = Note('new{}'.format(i % 50), 'note', mod='mod_0')
+                un.add_note(note, lazy=True)
+
+                if i % 5 == 0:
+                    un.remove_user('new{}'.format(i % 50), lazy=True)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                un.estimated_page_size()
+                un.plan_prune(target_size=1000)
+                un.peek_notes('new1')
+                un.is_current()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write), threading.Thread(target=read)]
+
+    # Switch threads often to provoke races
+    if hasattr(sys, 'setswitchinterval'):
+        get_interval = sys.getswitchinterval
+        set_interval = sys.setswitchinterval
+        fast = 1e-5
+    else:  # Python 2 counts bytecode instructions instead
+        get_interval, set_interval = sys.getcheckinterval, sys.setcheckinterval
+        fast = 1
+
+    interval = get_interval()
+    set_interval(fast)
+
+    try:
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+    finally:
+        set_interval(interval)
+
+    assert errors == []
@@ -0,0 +1,92 @@
+import threading
+from puni import UserNotes, Note
+from puni.index import SizeIndex
+from tests import fakes
+
+
+def test_snapshot_is_immutable():
+    """Assert that changes after a snapshot do not show up in it."""
+    un = fakes.make_usernotes(moderators=['teaearlgraycold'])
+    un.add_note(Note('spammer', 'first', mod='teaearlgraycold'))
+    un.add_note(Note('other', 'note', mod='teaearlgraycold'))
+    snapshot = un.snapshot()
+
+    un.add_note(Note('spammer', 'second', mod='new_mod', warning='ban'))
+    un.remove_user('other')
+
+    assert [x.note for x in snapshot.get_notes('spammer')] == ['first']
+    assert sorted(snapshot.get_users()) == ['other', 'spammer']
+    assert snapshot.query(mod='new_mod') == []
+    assert snapshot.constants['users'] == ['teaearlgraycold']
+    assert [x.note for x in un.get_notes('spammer')] == ['second', 'first']
+    assert un.get_users() == ['spammer']
+    assert snapshot.revision_id != un.revision_id
+
+
+def test_snapshot_shares_unchanged_users():
+    """Assert that only the entries of changed users are copied."""
+    un = fakes.make_usernotes(moderators=['teaearlgraycold'])
+
+    with un.batch():
+        for i in range(3):
+            un.add_note(Note('user{}'.format(i), 'note', mod='teaearlgraycold'))
+
+    snapshot = un.snapshot()
+    un.add_note(Note('user0', 'another', mod='teaearlgraycold'))
+
+    assert snapshot.users is not un.cached_json['users']
+    assert snapshot.users['user1'] is un.cached_json['users']['user1']
+    assert snapshot.users['user0'] is not un.cached_json['users']['user0']
+    assert len(snapshot.users['user0']['ns']) == 1
+
+
+def test_concurrent_writers_and_readers():
+    """Assert that threads sharing a UserNotes see consistent states."""
+    un = fakes.make_usernotes(moderators=['teaearlgraycold'])
+    errors = []
+
+    def write(thread):
+        for i in range(10):
+            un.add_note(Note('user{}'.format(thread), 'note {}'.format(i),
+                             mod='teaearlgraycold'))
+
+    def read():
+        last = 0
+
+        for _ in range(200):
+            snapshot = un.snapshot()
+            count = sum(len(x.get('ns', [])) for x in snapshot.users.values())
+
+            if count < last:
+                errors.append('went back from {} to {}'.format(last, count))
+
+            last = count
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(6)]
+    threads += [threading.Thread(target=read) for _ in range(3)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(len(un.get_notes(x)) for x in un.get_users()) == [10] * 6
+    assert len(UserNotes(None, 'test', backend=un.backend).get_users()) == 6
+
+
+def test_replaced_users_not_indexed():
+    """Assert that indexes of a replaced users map are not reused."""
+    un = fakes.make_usernotes(moderators=['teaearlgraycold'])
+    un.add_note(Note('old', 'note', mod='teaearlgraycold'))
+    un.query(mod='teaearlgraycold')
+    un.cached_json['users'] = {}
+    un.snapshot()
+    un.add_note(Note('new', 'note', mod='teaearlgraycold'), lazy=True)
+
+    found = un.query(mod='teaearlgraycold', lazy=True)
+
+    assert [x.username for x in found] == ['new']
+    assert un._index('size').size() == \
+        SizeIndex(un.cached_json['users']).size()
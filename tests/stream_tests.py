@@ -0,0 +1,48 @@
+import base64
+import json
+import zlib
+from puni import UserNotes, Note
+from puni.stream import expand_users, find_user
+from tests.fakes import FakeReddit, FakeSubreddit
+
+
+def make_blob(users):
+    """Compress a users map the way the usernotes page stores it."""
+    data = zlib.compress(json.dumps(users).encode('utf-8'), 9)
+    return base64.b64encode(data).decode('utf-8')
+
+
+USERS = dict(
+    ('user{}'.format(i), {'ns': [{'n': u'n\u00f6te {}'.format(j), 't': j,
+                                  'm': 0, 'l': '', 'w': 0}
+                                 for j in range(i % 5 + 1)]})
+    for i in range(500)
+)
+
+
+def test_expand_users():
+    """Assert that the streaming decoder matches json.loads in small chunks."""
+    blob = make_blob(USERS)
+
+    assert expand_users(blob, chunk_size=64) == USERS
+    assert expand_users(make_blob({})) == {}
+
+
+def test_find_user():
+    """Assert that a single user's entry can be found in the BLOB."""
+    blob = make_blob(USERS)
+
+    assert find_user(blob, 'user42', chunk_size=64) == USERS['user42']
+    assert find_user(blob, 'nobody') is None
+
+
+def test_peek_notes():
+    """Assert that peek_notes reads a user's notes without filling the cache."""
+    sub = FakeSubreddit()
+    un = UserNotes(FakeReddit(), sub)
+    un.add_note(Note('spammer', 'note', mod='teaearlgraycold'))
+    un2 = UserNotes(FakeReddit(), sub, lazy_start=True)
+
+    assert [x.note for x in un2.peek_notes('spammer')] == ['note']
+    assert un2.peek_notes('nobody') == []
+    assert un2.cached_json == {}
@@ -0,0 +1,43 @@
+from puni import Note
+from tests import fakes
+
+
+NOTES = [
+    Note('alice', 'spam', mod='mod', warning='spamwarn', note_time=100),
+    Note('alice', 'banned', mod='other', warning='permban', note_time=300),
+    Note('alice', 'kind', mod='mod', warning='gooduser', note_time=200),
+    Note('bob', 'hello', mod='mod', note_time=400),
+]
+
+
+def test_summaries():
+    """Assert that counts, times, warnings and moderators are summarized."""
+    un = fakes.make_usernotes(NOTES, moderators=['mod', 'other'])
+
+    assert un.summaries(['alice', 'bob', 'nobody']) == {
+        'alice': {'count': 3, 'latest': 300, 'warning': 'permban',
+                  'moderators': ['mod', 'other']},
+        'bob': {'count': 1, 'latest': 400, 'warning': 'none',
+                'moderators': ['mod']},
+    }
+
+
+def test_summaries_follow_changes():
+    """Assert that summaries are updated as notes are added and removed."""
+    un = fakes.make_usernotes(NOTES, moderators=['mod', 'other'])
+    un.summaries(['alice'])
+
+    un.remove_note('alice', 0)  # The permban, which is the newest note
+
+    assert un.summaries(['alice'])['alice'] == {
+        'count': 2, 'latest': 200, 'warning': 'spamwarn', 'moderators': ['mod']
+    }
+
+    un.add_note(Note('alice', 'again', mod='other', warning='ban',
+                     note_time=500))
+    un.remove_user('bob')
+
+    assert un.summaries(['alice', 'bob']) == {
+        'alice': {'count': 3, 'latest': 500, 'warning': 'ban',
+                  'moderators': ['mod', 'other']}
+    }
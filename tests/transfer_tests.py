@@ -0,0 +1,123 @@
+import io
+import json
+from puni import Note
+from nose.tools import assert_raises
+from tests import fakes
+
+
+def jsonl(rows):
+    """Return a text file holding rows as JSON lines."""
+    return io.StringIO(u'\n'.join(json.dumps(x) for x in rows))
+
+
+def all_notes(un):
+    """Return every note as a sorted list of tuples."""
+    return sorted((x.username, x.note, x.time, x.moderator, x.link, x.warning)
+                  for user in un.get_users() for x in un.get_notes(user))
+
+
+def fill(un):
+    """Add a few notes to the usernotes."""
+    with un.batch():
+        un.add_note(Note('spammer', 'spam, "quoted"', mod='mod_a',
+                         link='l,abc12', warning='spamwatch', note_time=100))
+        un.add_note(Note('spammer', 'again', mod='mod_b', note_time=200,
+                         link='https://reddit.com/message/messages/xyz12'))
+        un.add_note(Note('troll', u'tr\u00f6ll', mod='mod_a', warning='ban',
+                         link='l,abc12,def34', note_time=150))
+
+
+def test_export_import_round_trip():
+    """Assert that notes survive an export and import in both formats."""
+    source = fakes.make_usernotes(moderators=['mod_a'], name='source')
+    fill(source)
+
+    for format in ('jsonl', 'csv'):
+        fp = io.StringIO()
+
+        assert source.export_notes(fp, format) == 3
+
+        target = fakes.make_usernotes(moderators=['mod_a'], name='target')
+        revisions = len(target.backend.pages['usernotes'])
+        fp.seek(0)
+
+        assert target.import_notes(fp, format) == 3
+        assert all_notes(target) == all_notes(source)
+        assert len(target.backend.pages['usernotes']) == revisions + 1
+        assert target.backend.pages['usernotes'][-1]['reason'] == \
+            '"import 3 notes" via puni'
+
+
+def test_export_expands_links():
+    """Assert that exported rows hold full URLs."""
+    un = fakes.make_usernotes(moderators=['mod_a'], name='source')
+    fill(un)
+    fp = io.StringIO()
+    un.export_notes(fp)
+    rows = [json.loads(x) for x in fp.getvalue().splitlines()]
+    urls = sorted(x['url'] for x in rows)
+
+    assert urls == [
+        'https://reddit.com/message/messages/xyz12',
+        'https://reddit.com/r/source/comments/abc12/',
+        'https://reddit.com/r/source/comments/abc12/-/def34'
+    ]
+
+
+def test_import_deduplicates():
+    """Assert that notes already present are not added again."""
+    un = fakes.make_usernotes(moderators=['mod_a'], name='source')
+    fill(un)
+    fp = io.StringIO()
+    un.export_notes(fp)
+    lines = fp.getvalue().splitlines()
+    revisions = len(un.backend.pages['usernotes'])
+
+    assert un.import_notes(io.StringIO(u'\n'.join(lines * 2))) == 0
+    assert len(un.backend.pages['usernotes']) == revisions
+
+    older = json.loads(lines[0])
+    older.update(note='older', time=1)
+    newer = json.loads(lines[0])
+    newer.update(note='newer', time=10 ** 9, link=None, url=None)
+    assert un.import_notes(jsonl([older, older, newer])) == 2
+    notes = un.get_notes(older['username'])
+    assert notes[0].note == 'newer'
+    assert notes[-1].note == 'older'
+    assert [x.time for x in notes] == sorted((x.time for x in notes),
+                                             reverse=True)
+
+
+def test_import_normalizes_links():
+    """Assert that imported links are stored as shorthand links."""
+    un = fakes.make_usernotes(moderators=['mod_a'], name='source')
+    fill(un)
+    rows = [
+        {'username': 'troll', 'note': u'tr\u00f6ll', 'time': 150,
+         'moderator': 'mod_a', 'warning': 'ban',
+         'link': 'https://www.reddit.com/r/x/comments/abc12/foo/def34'},
+        {'username': 'new', 'note': 'full', 'moderator': 'mod_a',
+         'link': 'https://www.reddit.com/r/x/comments/92dd8/foo/'},
+        {'username': 'new', 'note': 'garbage', 'moderator': 'mod_a',
+         'link': 'garbage'},
+    ]
+
+    assert un.import_notes(jsonl(rows)) == 2
+    assert len(un.get_notes('troll')) == 1
+    assert sorted(x.link for x in un.get_notes('new')) == ['', 'l,92dd8']
+
+
+def test_import_errors():
+    """Assert that invalid files are rejected without changing anything."""
+    un = fakes.make_usernotes(moderators=['mod_a'], name='source')
+    fill(un)
+    before = all_notes(un)
+    bad_warning = {'username': 'a', 'note': 'n', 'warning': 'x',
+                   'moderator': 'mod_a'}
+
+    assert_raises(ValueError, un.export_notes, io.StringIO(), 'xml')
+    assert_raises(ValueError, un.import_notes,
+                  jsonl([{'username': 'a', 'note': 'n', 'moderator': 'mod_a'},
+                         {'username': 'b'}]))
+    assert_raises(ValueError, un.import_notes, jsonl([bad_warning]))
+    assert all_notes(un) == before
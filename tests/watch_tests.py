@@ -0,0 +1,80 @@
+import threading
+from puni import UserNotes, Note, NoteAdded, NoteRemoved, UserRemoved
+from tests import fakes
+
+
+NOTES = [Note('a', 'first', mod='mod', note_time=1),
+         Note('b', 'other', mod='mod', note_time=2)]
+
+
+def describe(events):
+    return [(type(x), x.username, getattr(x, 'note', None) and x.note.note)
+            for x in events]
+
+
+def test_poll_reports_changes():
+    """Assert that changes by another client are reported once."""
+    un = fakes.make_usernotes(NOTES)
+    backend = un.backend
+    other = UserNotes(None, 'test', backend=backend)
+    watcher = un.watch()
+
+    assert watcher.poll() == []
+
+    with other.batch():
+        other.add_note(Note('a', 'second', mod='mod', warning='ban'))
+        other.remove_note('a', 1)
+        other.remove_user('b')
+        other.add_note(Note('c', 'new', mod='mod'))
+
+    events = watcher.poll()
+
+    assert describe(events) == [
+        (NoteRemoved, 'a', 'first'),
+        (NoteAdded, 'a', 'second'),
+        (UserRemoved, 'b', None),
+        (NoteAdded, 'c', 'new'),
+    ]
+    assert events[1].note.warning == 'ban'
+    assert [x.note for x in events[2].notes] == ['other']
+    assert watcher.poll() == []
+
+
+def test_unchanged_page_not_downloaded():
+    """Assert that polls of an unchanged page only check the revision."""
+    un = fakes.make_usernotes(NOTES)
+    backend = un.backend
+    watcher = un.watch()
+    watcher.poll()
+    requests = backend.requests
+
+    assert watcher.poll() == []
+    assert backend.requests == requests + 1
+
+
+def test_iteration_backs_off():
+    """Assert that polls slow down while nothing changes, until stopped."""
+    un = fakes.make_usernotes(NOTES)
+    backend = un.backend
+    stop = threading.Event()
+    watcher = un.watch(interval=0.001, max_interval=0.004, stop=stop)
+    delays = []
+    poll = watcher.poll
+
+    def counted_poll():
+        delays.append(watcher.delay)
+
+        if len(delays) == 4:
+            UserNotes(None, 'test', backend=backend).add_note(
+                Note('d', 'late', mod='mod')
+            )
+        elif len(delays) == 6:
+            stop.set()
+
+        return poll()
+
+    watcher.poll = counted_poll
+    events = list(watcher)
+
+    assert describe(events) == [(NoteAdded, 'd', 'late')]
+    assert delays == [0.001, 0.002, 0.004, 0.004, 0.001, 0.002]